@@ -0,0 +1,607 @@
+import os
+import json
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pipeline.utils import Utils, load_json, save_json
+
+
+# ==============================================================================================
+# SQLITE ARTIFACT STORE
+#
+# One database per results root (results/<system>/<personas>/<model>/artifacts.db) holding every
+# pipeline artifact as rows. Each row keeps its original JSON record in `data` (so key order and any
+# extra fields survive) next to the indexed columns that queries use.
+#
+# Stage writes that update single records or whole conflict files (conflict identification, verification
+# and resolution) go through the store: the rows change in one transaction and the JSON file is then
+# generated from them, so the stages that read JSON see the same content. Files still written directly
+# by other stages are re-read into the store, per file, when their on-disk signature changes
+# (`sync_file` / `sync_json`).
+
+ARTIFACT_DB_FILENAME = "artifacts.db"
+
+# Fields written onto a conflict record by the resolvers; stored in their own table
+RESOLUTION_FIELDS = ("generalResolutionType", "resolutionDescription", "newUserStoryASummary", "newUserStoryBSummary")
+
+# Per-file collections: name -> (table, Utils directory attribute, file name pattern)
+FILE_COLLECTIONS = {
+    "unique_tasks": ("tasks", "UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR", "Unique_extracted_tasks_for_{}.json"),
+    "duplicated_tasks": ("tasks", "DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR", "Duplicated_extracted_tasks_for_{}.json"),
+    "unique_user_stories": ("user_stories", "UNIQUE_USER_STORY_DIR_PATH", "User_stories_for_{}.json"),
+    "duplicated_user_stories": ("user_stories", "DUPLICATED_USER_STORY_DIR_PATH", "Duplicated_user_stories_for_{}.json"),
+    "skipped_user_stories": ("user_stories", "DUPLICATED_USER_STORY_DIR_PATH", "Skipped_user_stories_for_{}.json"),
+    "non_functional_conflicts_within": ("conflicts", "NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR", "{}.json"),
+    "non_functional_conflicts_across": ("conflicts", "NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR", "{}.json"),
+    "invalid_non_functional_conflicts_within": ("conflicts", "INVALID_NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR", "{}.json"),
+    "invalid_non_functional_conflicts_across": ("conflicts", "INVALID_NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR", "{}.json"),
+    "functional_conflicts_within": ("conflicts", "FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR", "{}.json"),
+    "functional_conflicts_across": ("conflicts", "FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR", "{}.json"),
+    "invalid_functional_conflicts_within": ("conflicts", "INVALID_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR", "{}.json"),
+    "invalid_functional_conflicts_across": ("conflicts", "INVALID_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR", "{}.json"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifact_files (
+    collection TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    signature TEXT,
+    PRIMARY KEY (collection, file_key)
+);
+
+CREATE TABLE IF NOT EXISTS use_cases (
+    id TEXT PRIMARY KEY,
+    use_case_type TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS use_case_personas (
+    use_case_id TEXT NOT NULL REFERENCES use_cases(id) ON DELETE CASCADE,
+    persona_id TEXT NOT NULL,
+    PRIMARY KEY (use_case_id, persona_id)
+);
+CREATE INDEX IF NOT EXISTS idx_use_case_personas_persona ON use_case_personas(persona_id);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    row_id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    task_id TEXT,
+    use_case_id TEXT,
+    persona_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_file ON tasks(collection, file_key, position);
+CREATE INDEX IF NOT EXISTS idx_tasks_task_id ON tasks(task_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_use_case ON tasks(use_case_id);
+
+CREATE TABLE IF NOT EXISTS user_stories (
+    row_id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT,
+    persona TEXT,
+    user_group TEXT,
+    use_case TEXT,
+    type TEXT,
+    pillar TEXT,
+    cluster TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_stories_file ON user_stories(collection, file_key, position);
+CREATE INDEX IF NOT EXISTS idx_user_stories_id ON user_stories(id);
+CREATE INDEX IF NOT EXISTS idx_user_stories_type_cluster ON user_stories(collection, type, cluster);
+CREATE INDEX IF NOT EXISTS idx_user_stories_use_case ON user_stories(use_case);
+
+CREATE TABLE IF NOT EXISTS clusters (
+    row_id INTEGER PRIMARY KEY,
+    name TEXT,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS decompositions (
+    story_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS conflicts (
+    row_id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    conflict_id TEXT,
+    story_a_id TEXT,
+    story_b_id TEXT,
+    cluster TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conflicts_file ON conflicts(collection, file_key, position);
+CREATE INDEX IF NOT EXISTS idx_conflicts_conflict_id ON conflicts(conflict_id);
+CREATE INDEX IF NOT EXISTS idx_conflicts_story_a ON conflicts(story_a_id);
+CREATE INDEX IF NOT EXISTS idx_conflicts_story_b ON conflicts(story_b_id);
+
+CREATE TABLE IF NOT EXISTS resolutions (
+    conflict_row_id INTEGER PRIMARY KEY REFERENCES conflicts(row_id) ON DELETE CASCADE,
+    general_resolution_type TEXT,
+    data TEXT NOT NULL
+);
+
+"""
+
+# Indexed columns of each per-file table, and the JSON field each one mirrors
+INDEXED_COLUMNS = {
+    "tasks": {"task_id": "taskID", "use_case_id": "useCaseId", "persona_id": "personaId"},
+    "user_stories": {"id": "id", "persona": "persona", "user_group": "user_group", "use_case": "use_case",
+                     "type": "type", "pillar": "pillar", "cluster": "cluster"},
+    "conflicts": {"conflict_id": "conflictId", "story_a_id": "userStoryAId", "story_b_id": "userStoryBId", "cluster": "cluster"},
+}
+
+
+def _dumps(record) -> str:
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _file_signature(path: str) -> Optional[str]:
+    """(mtime, size, inode) of a JSON file, or None if it does not exist. save_json replaces files, so any write changes it."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}:{stat.st_ino}"
+
+
+class ArtifactStore:
+    """
+    Embedded SQLite store for the artifacts of one results root.
+    `write_file` and `update_user_story_summary` write through the store to the JSON files, `sync_json`
+    picks up files written directly, and `export_json` writes the whole tree out in the same layout.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, results_root: Optional[str] = None):
+        utils = Utils()
+        self.results_root = results_root or utils.ROOT_RESULTS_DIR
+        self.db_path = db_path or os.path.join(self.results_root, ARTIFACT_DB_FILENAME)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+
+        # Pipeline stages run their LLM calls from worker threads, so writes are serialised here
+        self._lock = threading.RLock()
+        self._depth = 0
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """All writes inside the block commit together, or not at all. Nested blocks join the outer one."""
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    self.conn.execute("BEGIN")
+                yield self.conn
+                if self._depth == 1:
+                    self.conn.commit()
+            except Exception:
+                if self._depth == 1:
+                    self.conn.rollback()
+                raise
+            finally:
+                self._depth -= 1
+
+    # ---------- Layout ----------
+
+    def _relative_dir(self, utils_attr: str) -> str:
+        """Directory of a collection relative to the results root, taken from the current Utils paths."""
+        utils = Utils()
+        return os.path.relpath(getattr(utils, utils_attr), utils.ROOT_RESULTS_DIR)
+
+    def _collection_path(self, root: str, collection: str, file_key: str) -> str:
+        _, utils_attr, pattern = FILE_COLLECTIONS[collection]
+        return os.path.join(root, self._relative_dir(utils_attr), pattern.format(file_key))
+
+    def _collection_keys_on_disk(self, root: str, collection: str) -> List[str]:
+        _, utils_attr, pattern = FILE_COLLECTIONS[collection]
+        directory = os.path.join(root, self._relative_dir(utils_attr))
+        if not os.path.isdir(directory):
+            return []
+        prefix, suffix = pattern.split("{}")
+        return sorted(
+            fname[len(prefix):len(fname) - len(suffix)]
+            for fname in os.listdir(directory)
+            if fname.startswith(prefix) and fname.endswith(suffix) and len(fname) > len(prefix) + len(suffix)
+        )
+
+    # ---------- Generic per-file records ----------
+
+    def replace_file_records(self, collection: str, file_key: str, records: List[dict]) -> None:
+        """Replace every record of one (collection, file) with `records`, in order."""
+        table = FILE_COLLECTIONS[collection][0]
+        columns = INDEXED_COLUMNS[table]
+        column_names = ", ".join(columns)
+        placeholders = ", ".join("?" for _ in columns)
+
+        with self.transaction() as conn:
+            conn.execute(f"DELETE FROM {table} WHERE collection = ? AND file_key = ?", (collection, file_key))
+            conn.execute("INSERT OR IGNORE INTO artifact_files (collection, file_key) VALUES (?, ?)", (collection, file_key))
+            for position, record in enumerate(records):
+                base = record
+                if table == "conflicts":
+                    base = {k: v for k, v in record.items() if k not in RESOLUTION_FIELDS}
+                cursor = conn.execute(
+                    f"INSERT INTO {table} (collection, file_key, position, {column_names}, data) "
+                    f"VALUES (?, ?, ?, {placeholders}, ?)",
+                    (collection, file_key, position, *(record.get(field) for field in columns.values()), _dumps(base)),
+                )
+                if table == "conflicts" and any(field in record for field in RESOLUTION_FIELDS):
+                    self._write_resolution(conn, cursor.lastrowid, record)
+
+    def get_file_records(self, collection: str, file_key: str) -> List[dict]:
+        """Records of one (collection, file), exactly as the JSON file holds them."""
+        table = FILE_COLLECTIONS[collection][0]
+        rows = self.conn.execute(
+            f"SELECT row_id, data FROM {table} WHERE collection = ? AND file_key = ? ORDER BY position",
+            (collection, file_key),
+        ).fetchall()
+        return [self._record(table, row) for row in rows]
+
+    def get_file_keys(self, collection: str) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT file_key FROM artifact_files WHERE collection = ? ORDER BY file_key", (collection,)
+        ).fetchall()
+        return [row["file_key"] for row in rows]
+
+    def _record(self, table: str, row: sqlite3.Row) -> dict:
+        record = json.loads(row["data"])
+        if table == "conflicts":
+            resolution = self.conn.execute(
+                "SELECT data FROM resolutions WHERE conflict_row_id = ?", (row["row_id"],)
+            ).fetchone()
+            if resolution:
+                record.update(json.loads(resolution["data"]))
+        return record
+
+    # ---------- Write-through ----------
+
+    def collection_of(self, path: str) -> Tuple[str, str]:
+        """(collection, file key) of a per-file JSON path under the results root."""
+        directory, fname = os.path.split(os.path.abspath(path))
+        for collection, (_, utils_attr, pattern) in FILE_COLLECTIONS.items():
+            if os.path.abspath(os.path.join(self.results_root, self._relative_dir(utils_attr))) != directory:
+                continue
+            prefix, suffix = pattern.split("{}")
+            if fname.startswith(prefix) and fname.endswith(suffix) and len(fname) > len(prefix) + len(suffix):
+                return collection, fname[len(prefix):len(fname) - len(suffix)]
+        raise ValueError(f"{path} is not a file of the artifact store")
+
+    def _set_signature(self, collection: str, file_key: str, signature: Optional[str]) -> None:
+        self.conn.execute(
+            "INSERT INTO artifact_files (collection, file_key, signature) VALUES (?, ?, ?) "
+            "ON CONFLICT(collection, file_key) DO UPDATE SET signature = excluded.signature",
+            (collection, file_key, signature),
+        )
+
+    def _export_file(self, collection: str, file_key: str) -> None:
+        path = self._collection_path(self.results_root, collection, file_key)
+        save_json(path, self.get_file_records(collection, file_key))
+        self._set_signature(collection, file_key, _file_signature(path))
+
+    def read_file(self, path: str) -> List[dict]:
+        """Records of one per-file JSON path (re-read first if it was written outside the store); [] if it does not exist."""
+        collection, file_key = self.collection_of(path)
+        self.sync_file(collection, file_key)
+        return self.get_file_records(collection, file_key)
+
+    def write_file(self, path: str, records: List[dict]) -> None:
+        """Replace the records of one per-file JSON path, then generate the file from the store."""
+        collection, file_key = self.collection_of(path)
+        with self.transaction():
+            self.replace_file_records(collection, file_key, records)
+            self._export_file(collection, file_key)
+
+    def update_user_story_summary(self, persona_id: str, story_id: str, summary: str) -> bool:
+        """
+        Set the summary of one of a persona's stories (an empty summary removes the story) and regenerate
+        the persona's story file. Returns False if the persona has no such story.
+        """
+        collection = "unique_user_stories"
+        with self.transaction() as conn:
+            self.sync_file(collection, persona_id)
+            row = conn.execute(
+                "SELECT row_id, data FROM user_stories WHERE collection = ? AND file_key = ? AND id = ? ORDER BY position LIMIT 1",
+                (collection, persona_id, story_id),
+            ).fetchone()
+            if row is None:
+                return False
+
+            if summary.strip():
+                record = json.loads(row["data"])
+                record["summary"] = summary
+                conn.execute("UPDATE user_stories SET data = ? WHERE row_id = ?", (_dumps(record), row["row_id"]))
+            else:
+                conn.execute("DELETE FROM user_stories WHERE row_id = ?", (row["row_id"],))
+            self._export_file(collection, persona_id)
+        return True
+
+    def sync_file(self, collection: str, file_key: str) -> bool:
+        """Re-read one file if it was written (or removed) outside the store. Returns whether it was."""
+        path = self._collection_path(self.results_root, collection, file_key)
+        signature = _file_signature(path)
+        row = self.conn.execute(
+            "SELECT signature FROM artifact_files WHERE collection = ? AND file_key = ?", (collection, file_key)
+        ).fetchone()
+        stored = row["signature"] if row else None
+        if (row is None and signature is None) or (stored is not None and stored == signature):
+            return False
+
+        table = FILE_COLLECTIONS[collection][0]
+        with self.transaction() as conn:
+            if signature is None:
+                conn.execute(f"DELETE FROM {table} WHERE collection = ? AND file_key = ?", (collection, file_key))
+                conn.execute("DELETE FROM artifact_files WHERE collection = ? AND file_key = ?", (collection, file_key))
+            else:
+                self.replace_file_records(collection, file_key, load_json(path))
+                self._set_signature(collection, file_key, signature)
+        return True
+
+    def sync_json(self) -> Dict[str, int]:
+        """
+        Re-read every file written outside the store since it last matched (the use cases, clusters and
+        decompositions are small and re-read whole). Returns the number of re-read files per collection,
+        and the number of use cases, clusters and decompositions.
+        """
+        counts = {}
+        with self.transaction():
+            for collection in FILE_COLLECTIONS:
+                file_keys = set(self._collection_keys_on_disk(self.results_root, collection)) | set(self.get_file_keys(collection))
+                for file_key in sorted(file_keys):
+                    if self.sync_file(collection, file_key):
+                        counts[collection] = counts.get(collection, 0) + 1
+            counts.update(self._import_shared(self.results_root))
+        return counts
+
+    # ---------- Use cases ----------
+
+    def upsert_use_case(self, data: dict) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO use_cases (id, use_case_type, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET use_case_type = excluded.use_case_type, data = excluded.data",
+                (data["id"], data.get("useCaseType"), _dumps(data)),
+            )
+            conn.execute("DELETE FROM use_case_personas WHERE use_case_id = ?", (data["id"],))
+            conn.executemany(
+                "INSERT OR IGNORE INTO use_case_personas (use_case_id, persona_id) VALUES (?, ?)",
+                [(data["id"], pid) for pid in data.get("personas", [])],
+            )
+
+    def get_use_case(self, use_case_id: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM use_cases WHERE id = ?", (use_case_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def get_use_cases(self, persona_id: Optional[str] = None) -> List[dict]:
+        if persona_id is None:
+            rows = self.conn.execute("SELECT data FROM use_cases ORDER BY id").fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT u.data FROM use_cases u JOIN use_case_personas p ON p.use_case_id = u.id "
+                "WHERE p.persona_id = ? ORDER BY u.id",
+                (persona_id,),
+            ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    # ---------- Tasks ----------
+
+    def get_tasks(self, persona_id: str, duplicated: bool = False) -> List[dict]:
+        return self.get_file_records("duplicated_tasks" if duplicated else "unique_tasks", persona_id)
+
+    def get_tasks_by_use_case(self, use_case_id: str) -> List[dict]:
+        rows = self.conn.execute(
+            "SELECT row_id, data FROM tasks WHERE collection = 'unique_tasks' AND use_case_id = ? ORDER BY file_key, position",
+            (use_case_id,),
+        ).fetchall()
+        return [self._record("tasks", row) for row in rows]
+
+    # ---------- User stories ----------
+
+    def get_user_stories(
+        self,
+        collection: str = "unique_user_stories",
+        persona: Optional[str] = None,
+        story_type: Optional[str] = None,
+        cluster: Optional[str] = None,
+        use_case: Optional[str] = None,
+    ) -> List[dict]:
+        """Stories of one collection, filtered on any indexed field (type is matched case-insensitively)."""
+        clauses, params = ["collection = ?"], [collection]
+        for column, value in (("persona", persona), ("cluster", cluster), ("use_case", use_case)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if story_type is not None:
+            clauses.append("LOWER(type) = ?")
+            params.append(story_type.lower())
+
+        rows = self.conn.execute(
+            f"SELECT row_id, data FROM user_stories WHERE {' AND '.join(clauses)} ORDER BY file_key, position",
+            params,
+        ).fetchall()
+        return [self._record("user_stories", row) for row in rows]
+
+    def get_user_story(self, story_id: str) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT row_id, data FROM user_stories WHERE collection = 'unique_user_stories' AND id = ? "
+            "ORDER BY file_key, position LIMIT 1",
+            (story_id,),
+        ).fetchone()
+        return self._record("user_stories", row) if row else None
+
+    # ---------- Clusters & decompositions ----------
+
+    def replace_clusters(self, clusters: List[dict]) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM clusters")
+            conn.executemany(
+                "INSERT INTO clusters (name, position, data) VALUES (?, ?, ?)",
+                [(c.get("cluster_name"), i, _dumps(c)) for i, c in enumerate(clusters)],
+            )
+
+    def get_clusters(self) -> List[dict]:
+        return [json.loads(row["data"]) for row in self.conn.execute("SELECT data FROM clusters ORDER BY position")]
+
+    def upsert_decomposition(self, record: dict) -> None:
+        with self.transaction() as conn:
+            row = conn.execute("SELECT position FROM decompositions WHERE story_id = ?", (record["id"],)).fetchone()
+            if row:
+                position = row["position"]
+            else:
+                position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM decompositions").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO decompositions (story_id, position, data) VALUES (?, ?, ?)",
+                (record["id"], position, _dumps(record)),
+            )
+
+    def get_decompositions(self) -> List[dict]:
+        return [json.loads(row["data"]) for row in self.conn.execute("SELECT data FROM decompositions ORDER BY position")]
+
+    # ---------- Conflicts & resolutions ----------
+
+    def get_conflicts(self, collection: str, file_key: Optional[str] = None, story_id: Optional[str] = None) -> List[dict]:
+        """Conflicts of one collection, optionally limited to one group file or to those involving one story."""
+        clauses, params = ["collection = ?"], [collection]
+        if file_key is not None:
+            clauses.append("file_key = ?")
+            params.append(file_key)
+        if story_id is not None:
+            clauses.append("(story_a_id = ? OR story_b_id = ?)")
+            params.extend([story_id, story_id])
+
+        rows = self.conn.execute(
+            f"SELECT row_id, data FROM conflicts WHERE {' AND '.join(clauses)} ORDER BY file_key, position",
+            params,
+        ).fetchall()
+        return [self._record("conflicts", row) for row in rows]
+
+    def get_unresolved_conflicts(self, collection: str) -> List[dict]:
+        rows = self.conn.execute(
+            "SELECT c.row_id, c.data FROM conflicts c LEFT JOIN resolutions r ON r.conflict_row_id = c.row_id "
+            "WHERE c.collection = ? AND (r.conflict_row_id IS NULL OR COALESCE(r.general_resolution_type, '') = '') "
+            "ORDER BY c.file_key, c.position",
+            (collection,),
+        ).fetchall()
+        return [self._record("conflicts", row) for row in rows]
+
+    def _write_resolution(self, conn: sqlite3.Connection, conflict_row_id: int, record: dict) -> None:
+        resolution = {field: record[field] for field in RESOLUTION_FIELDS if field in record}
+        conn.execute(
+            "INSERT OR REPLACE INTO resolutions (conflict_row_id, general_resolution_type, data) VALUES (?, ?, ?)",
+            (conflict_row_id, resolution.get("generalResolutionType"), _dumps(resolution)),
+        )
+
+    # ---------- Import / export ----------
+
+    def import_json(self, root: Optional[str] = None) -> Dict[str, int]:
+        """Replace the store's content with the JSON tree under `root` (default: the current results root)."""
+        root = root or self.results_root
+        counts = {}
+
+        with self.transaction() as conn:
+            for table in ("resolutions", "conflicts", "user_stories", "tasks", "artifact_files"):
+                conn.execute(f"DELETE FROM {table}")
+
+            for collection in FILE_COLLECTIONS:
+                for file_key in self._collection_keys_on_disk(root, collection):
+                    path = self._collection_path(root, collection, file_key)
+                    records = load_json(path)
+                    self.replace_file_records(collection, file_key, records)
+                    # Files of another tree are never written through this store, so they get no signature
+                    self._set_signature(collection, file_key, _file_signature(path) if root == self.results_root else None)
+                    counts[collection] = counts.get(collection, 0) + len(records)
+
+            counts.update(self._import_shared(root))
+
+        return counts
+
+    def _import_shared(self, root: str) -> Dict[str, int]:
+        """Replace the use cases, clusters and decompositions with those under `root`."""
+        utils = Utils()
+        counts = {}
+
+        with self.transaction() as conn:
+            for table in ("use_case_personas", "use_cases", "clusters", "decompositions"):
+                conn.execute(f"DELETE FROM {table}")
+
+            use_case_dir = os.path.join(root, self._relative_dir("USE_CASE_DIR"))
+            if os.path.isdir(use_case_dir):
+                for fname in sorted(os.listdir(use_case_dir)):
+                    # The use case bundle only mirrors the per-file use cases
+                    if fname.endswith(".json") and fname.startswith("UC-"):
+                        self.upsert_use_case(load_json(os.path.join(use_case_dir, fname)))
+                        counts["use_cases"] = counts.get("use_cases", 0) + 1
+
+            cluster_path = os.path.join(root, os.path.relpath(utils.FUNCTIONAL_USER_STORY_CLUSTER_SET_PATH, utils.ROOT_RESULTS_DIR))
+            if os.path.exists(cluster_path):
+                clusters = load_json(cluster_path)
+                self.replace_clusters(clusters)
+                counts["clusters"] = len(clusters)
+
+            decomposition_path = os.path.join(root, os.path.relpath(utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH, utils.ROOT_RESULTS_DIR))
+            if os.path.exists(decomposition_path):
+                decompositions = load_json(decomposition_path)
+                for record in decompositions:
+                    self.upsert_decomposition(record)
+                counts["decompositions"] = len(decompositions)
+
+        return counts
+
+    def iter_json_files(self, collections: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, object]]:
+        """
+        (path relative to the results root, JSON content) of every file the store holds, in the pipeline's layout.
+        `collections` limits it to some per-file collections (plus "use_cases", "clusters", "decompositions").
+        """
+        utils = Utils()
+        wanted = set(collections) if collections is not None else None
+
+        def included(name: str) -> bool:
+            return wanted is None or name in wanted
+
+        if included("use_cases"):
+            use_case_dir = self._relative_dir("USE_CASE_DIR")
+            for use_case in self.get_use_cases():
+                yield os.path.join(use_case_dir, f"{use_case['id']}.json"), use_case
+
+        for collection in FILE_COLLECTIONS:
+            if not included(collection):
+                continue
+            for file_key in self.get_file_keys(collection):
+                yield self._collection_path("", collection, file_key), self.get_file_records(collection, file_key)
+
+        if included("clusters") and self.conn.execute("SELECT 1 FROM clusters LIMIT 1").fetchone():
+            yield os.path.relpath(utils.FUNCTIONAL_USER_STORY_CLUSTER_SET_PATH, utils.ROOT_RESULTS_DIR), self.get_clusters()
+
+        if included("decompositions") and self.conn.execute("SELECT 1 FROM decompositions LIMIT 1").fetchone():
+            yield os.path.relpath(utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH, utils.ROOT_RESULTS_DIR), self.get_decompositions()
+
+    def export_json(self, root: Optional[str] = None, collections: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Write the store back out in the pipeline's JSON layout under `root` (default: the current results root).
+        `collections` is passed to `iter_json_files`. Returns the written file paths.
+        """
+        root = root or self.results_root
+        written = []
+        for relative_path, data in self.iter_json_files(collections):
+            path = os.path.join(root, relative_path)
+            save_json(path, data)
+            written.append(path)
+        return written
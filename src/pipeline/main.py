@@ -5,6 +5,7 @@ import time
 import random
 
 from pipeline.utils import UserPersonaLoader
+from pipeline.artifact_store import ArtifactStore
 
 from pipeline.use_case.use_case_loader import UseCaseLoader
 from pipeline.use_case.skeleton_use_case_randomizer import write_use_case_skeletons
@@ -36,6 +37,10 @@ from pipeline.user_story_conflict.functional_user_story_conflict_across_two_grou
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# Task deduplication mode: by default only borderline groups of similar tasks go to the LLM. Set
+# ALFRED_HIERARCHICAL_TASK_DEDUP=1 to have the LLM review every task in bounded chunks (map-reduce).
+HIERARCHICAL_TASK_DEDUP = os.environ.get("ALFRED_HIERARCHICAL_TASK_DEDUP") == "1"
+
 def main():
     # Step 1: Load user personas
     print("\n============================================================= LOAD USER PERSONAS =====================================================================")
@@ -70,7 +75,7 @@ def main():
     
     #   Step 2e: Deduplicate tasks for each persona
     print("\n🔄 Phase 2e: Deduplicating tasks for each persona...")
-    deduplicate_tasks_for_all_use_cases(persona_loader)
+    deduplicate_tasks_for_all_use_cases(persona_loader, hierarchical=HIERARCHICAL_TASK_DEDUP)
     
     # Step 3: Generate user stories from tasks
     print("\n============================================================ LOAD / GENERATE USER STORIES ============================================================")
@@ -179,6 +184,13 @@ def main():
     print("\n🛠️ Phase 7b: Resolving conflicts for functional user stories across two user groups...")
     resolve_functional_conflicts_across_two_groups(persona_loader)
     
+    # Step 8: Bring the artifact store up to date with the files the earlier stages wrote directly
+    print("\n💾 Phase 8: Syncing results into the artifact store...")
+    store = ArtifactStore()
+    counts = store.sync_json()
+    store.close()
+    print(f"✅ Artifact store synced at {store.db_path}: " + ", ".join(f"{n} {name}" for name, n in counts.items()))
+
     print("\n✅ Pipeline completed successfully. Check your results in the output folder.")
 
 if __name__ == "__main__":
@@ -17,7 +17,8 @@ from pipeline.result_analysis.user_story_analysis import (
 from pipeline.result_analysis.user_story_conflict_analysis import (
     analyze_all_conflict_verification_cases,
     analyze_and_flatten_all_conflict_verification_records,
-    analyze_all_valid_conflict_resolutions_for_human_review
+    analyze_all_valid_conflict_resolutions_for_human_review,
+    analyze_functional_conflict_candidate_recall,
 )
 
 from pipeline.utils import UserPersonaLoader, Utils
@@ -49,6 +50,7 @@ def main(persona_loader: UserPersonaLoader = None, uc_loader: UseCaseLoader = No
     analyze_all_conflict_verification_cases()
     analyze_and_flatten_all_conflict_verification_records()
     analyze_all_valid_conflict_resolutions_for_human_review()
+    analyze_functional_conflict_candidate_recall()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
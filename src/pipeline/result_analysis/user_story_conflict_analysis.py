@@ -5,6 +5,12 @@ import pandas as pd
 from collections import defaultdict
 from pathlib import Path
 
+from pipeline.user_story.user_story_loader import UserStory, UserStoryLoader
+from pipeline.user_story_conflict.user_story_conflict_candidate_selector import (
+    MIN_CANDIDATE_PAIRS,
+    functional_comparison_blocks,
+    select_candidate_pairs,
+)
 from pipeline.utils import Utils
 
 def analyze_conflict_verification(valid_dir, invalid_dir, output_csv_path, conflict_type: str, is_across_groups: bool):
@@ -265,3 +271,85 @@ def analyze_all_valid_conflict_resolutions_for_human_review():
     df.to_csv(output_path, index=False, encoding="utf-8-sig")
 
     print(f"✅ Valid conflict resolution records exported to {output_path}")
+
+
+def load_conflict_records(folder) -> list:
+    records = []
+    for file in Path(folder).glob("*.json"):
+        with open(file, encoding="utf-8") as f:
+            records.extend(json.load(f))
+    return records
+
+
+def analyze_functional_conflict_candidate_recall():
+    """
+    Recall of the local candidate-pair blocking against the exhaustive pairwise comparison: which of the
+    conflicts found by comparing every pair would still have been sent to the LLM. Stories are scored with
+    the summaries recorded in the conflict files (i.e. as the identifier saw them), and conflicts whose
+    stories are no longer in the same comparison block are left out.
+    """
+    utils = Utils()
+    output_csv_path = utils.FUNCTIONAL_USER_STORY_CONFLICT_CANDIDATE_RECALL_ANALYSIS_CSV_FILE_PATH
+
+    if os.path.exists(output_csv_path):
+        print(f"⚠️ {output_csv_path} already exists. Please delete it to re-generate.")
+        return
+
+    loader = UserStoryLoader()
+    loader.load_all_user_stories()
+
+    comparisons = [
+        ("Functional within-group", True, utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, utils.INVALID_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR),
+        ("Functional across-groups", False, utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, utils.INVALID_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR),
+    ]
+
+    def percent(part, whole):
+        return f"{round((part / whole) * 100) if whole > 0 else 0}%"
+
+    records = []
+    for name, within_one_group, valid_dir, invalid_dir in comparisons:
+        valid = load_conflict_records(valid_dir)
+        invalid = load_conflict_records(invalid_dir)
+
+        recorded_summaries = {}
+        for c in valid + invalid:
+            recorded_summaries[c["userStoryAId"]] = c["userStoryASummary"]
+            recorded_summaries[c["userStoryBId"]] = c["userStoryBSummary"]
+        stories = [
+            UserStory.from_dict({**s.to_dict(), "summary": recorded_summaries.get(s.id, s.summary)})
+            for s in loader.filter_by_type("Functional")
+        ]
+        blocks = functional_comparison_blocks(stories, within_one_group)
+
+        def pair_key(a_id, b_id):
+            return tuple(sorted([a_id, b_id]))
+
+        compared = {pair_key(a.id, b.id) for _, stories_a, stories_b in blocks for a in stories_a for b in stories_b}
+        verified = {pair_key(c["userStoryAId"], c["userStoryBId"]) for c in valid} & compared
+        identified = verified | ({pair_key(c["userStoryAId"], c["userStoryBId"]) for c in invalid} & compared)
+
+        # "Configured" is what the identifiers run; "Forced" prunes every block, however small
+        for mode, min_pairs in (("Configured", MIN_CANDIDATE_PAIRS), ("Forced", 1)):
+            sent = {
+                pair_key(a.id, b.id)
+                for _, stories_a, stories_b in blocks
+                for a, b in select_candidate_pairs(stories_a, stories_b, min_pairs=min_pairs)
+            }
+            records.append({
+                "Comparison": name,
+                "Blocking Mode": mode,
+                "Exhaustive LLM Calls": len(compared),
+                "LLM Calls with Blocking": len(sent),
+                "LLM Call Share": percent(len(sent), len(compared)),
+                "Conflicts Identified Exhaustively": len(identified),
+                "Identified Conflicts Kept": len(identified & sent),
+                "Recall (Identified)": percent(len(identified & sent), len(identified)),
+                "Verified Conflicts": len(verified),
+                "Verified Conflicts Kept": len(verified & sent),
+                "Recall (Verified)": percent(len(verified & sent), len(verified)),
+            })
+
+    df = pd.DataFrame(records)
+    os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
+    df.to_csv(output_csv_path, index=False, encoding="utf-8-sig")
+    print(f"✅ Functional conflict candidate recall analysis saved to {output_csv_path}")
@@ -0,0 +1,364 @@
+import re
+import zlib
+
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# ==============================================================================================
+# LOCAL TEXT SIMILARITY (hashed n-gram TF-IDF + cosine)
+
+DEFAULT_N_FEATURES = 2 ** 14
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_POSSESSIVE_PATTERN = re.compile(r"['’]s\b")
+
+STOPWORDS = frozenset("""
+a an the and or but if so as at by for from in into of on onto to with without within
+is are was were be been being am do does did doing have has had having
+i me my mine we our ours you your yours he him his she her hers it its they them their theirs
+this that these those there here what which who whom whose when where why how
+can could would should will shall may might must
+all any both each few more most other some such no nor not only own same than too very
+just also about above below up down out off over under again further then once
+want wants wanted like need needs able
+""".split())
+
+
+def tokenize(text: Optional[str], remove_stopwords: bool = True) -> List[str]:
+    """Lower-case word tokens, optionally without English stopwords."""
+    if not text:
+        return []
+    tokens = _TOKEN_PATTERN.findall(_POSSESSIVE_PATTERN.sub("", text.lower()).replace("’", "'"))
+    if remove_stopwords:
+        tokens = [t for t in tokens if t not in STOPWORDS]
+    return tokens
+
+
+def word_ngrams(tokens: Sequence[str], ngram_range: Tuple[int, int] = (1, 2)) -> List[str]:
+    low, high = ngram_range
+    ngrams = []
+    for n in range(low, high + 1):
+        for i in range(len(tokens) - n + 1):
+            ngrams.append(" ".join(tokens[i:i + n]))
+    return ngrams
+
+
+def char_ngrams(tokens: Sequence[str], ngram_range: Tuple[int, int] = (3, 5)) -> List[str]:
+    """Character n-grams inside word boundaries, so "manage" and "manages" still overlap."""
+    low, high = ngram_range
+    ngrams = []
+    for token in tokens:
+        padded = f" {token} "
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                ngrams.append(padded[i:i + n])
+    return ngrams
+
+
+def extract_features(text: Optional[str], analyzer: str = "char") -> List[str]:
+    tokens = tokenize(text)
+    if analyzer == "char":
+        return char_ngrams(tokens)
+    if analyzer == "word":
+        return word_ngrams(tokens)
+    raise ValueError(f"❌ Unknown analyzer: {analyzer}. Valid options are: char, word")
+
+
+def _feature_index(feature: str, n_features: int) -> int:
+    # crc32 is stable across processes, unlike the built-in (salted) str hash
+    return zlib.crc32(feature.encode("utf-8")) % n_features
+
+
+def term_frequency_vectors(
+    texts: Iterable[str],
+    analyzer: str = "char",
+    n_features: int = DEFAULT_N_FEATURES,
+) -> np.ndarray:
+    """Sublinear (1 + log tf) hashed n-gram counts, one row per text."""
+    texts = list(texts)
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in extract_features(text, analyzer):
+            matrix[row, _feature_index(feature, n_features)] += 1.0
+    nonzero = matrix > 0
+    matrix[nonzero] = 1.0 + np.log(matrix[nonzero])
+    return matrix
+
+
+def sparse_term_frequencies(
+    texts: Iterable[str],
+    analyzer: str = "char",
+    n_features: int = DEFAULT_N_FEATURES,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The same values as term_frequency_vectors, as (rows, columns, values) of the non-zero cells only."""
+    rows, columns, values = [], [], []
+    for row, text in enumerate(texts):
+        counts = Counter(_feature_index(feature, n_features) for feature in extract_features(text, analyzer))
+        rows.extend([row] * len(counts))
+        columns.extend(counts)
+        values.extend(counts.values())
+    values = np.asarray(values, dtype=np.float32)
+    return np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64), 1.0 + np.log(values)
+
+
+def inverse_document_frequency(tf_matrix: np.ndarray) -> np.ndarray:
+    """Smoothed IDF over the rows of a term-frequency matrix."""
+    n_docs = tf_matrix.shape[0]
+    df = np.count_nonzero(tf_matrix, axis=0)
+    return (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def tfidf_vectors(texts: Iterable[str], analyzer: str = "char", n_features: int = DEFAULT_N_FEATURES) -> np.ndarray:
+    """L2-normalised hashed TF-IDF vectors, with IDF fitted on the given texts."""
+    tf = term_frequency_vectors(texts, analyzer, n_features)
+    if tf.shape[0] == 0:
+        return tf
+    return l2_normalize(tf * inverse_document_frequency(tf))
+
+
+def cosine_similarity_matrix(texts: Sequence[str], analyzer: str = "char") -> np.ndarray:
+    """Pairwise cosine similarity of the given texts (diagonal included)."""
+    vectors = tfidf_vectors(texts, analyzer)
+    return vectors @ vectors.T
+
+
+def bounded_groups(similarity: np.ndarray, min_score: float, max_group_size: int) -> List[List[int]]:
+    """
+    Agglomerate items by merging the most similar pairs first (single linkage), never letting a
+    group grow beyond `max_group_size`. Returns groups of size >= 2, each in ascending index order.
+    """
+    n_items = similarity.shape[0]
+    rows, cols = np.triu_indices(n_items, k=1)
+    scores = similarity[rows, cols]
+    order = np.argsort(-scores, kind="stable")
+
+    parent = list(range(n_items))
+    size = [1] * n_items
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for idx in order:
+        if scores[idx] < min_score:
+            break
+        root_a, root_b = find(int(rows[idx])), find(int(cols[idx]))
+        if root_a == root_b or size[root_a] + size[root_b] > max_group_size:
+            continue
+        keep, drop = min(root_a, root_b), max(root_a, root_b)
+        parent[drop] = keep
+        size[keep] += size[drop]
+
+    groups = {}
+    for i in range(n_items):
+        groups.setdefault(find(i), []).append(i)
+
+    return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: g[0])
+
+
+class SimilarityIndex:
+    """
+    Incrementally growing corpus of texts, queried by hashed TF-IDF cosine similarity.
+    Term frequencies are kept as sparse (row, column, value) cells in buffers that double when full,
+    so adding a text only writes its own cells; IDF weights are applied when the index is queried.
+    """
+
+    def __init__(self, analyzer: str = "char", n_features: int = DEFAULT_N_FEATURES):
+        self.analyzer = analyzer
+        self.n_features = n_features
+
+        self.keys: List[str] = []
+        self.texts: List[str] = []
+        self._positions = {}
+        self._df = np.zeros(n_features, dtype=np.float32)
+
+        self._size = 0
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._columns = np.zeros(0, dtype=np.int64)
+        self._values = np.zeros(0, dtype=np.float32)
+        # (weighted cell values, row norms), valid until the next add
+        self._weighted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        # Readable word n-grams, kept alongside the hashed features for theme digests
+        self._terms: List[Counter] = []
+        self._term_df: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, text: str) -> None:
+        _, columns, values = sparse_term_frequencies([text], self.analyzer, self.n_features)
+        end = self._size + len(columns)
+        if end > len(self._values):
+            capacity = max(end, 2 * len(self._values), 1024)
+            self._rows = np.resize(self._rows, capacity)
+            self._columns = np.resize(self._columns, capacity)
+            self._values = np.resize(self._values, capacity)
+        self._rows[self._size:end] = len(self.keys)
+        self._columns[self._size:end] = columns
+        self._values[self._size:end] = values
+        self._size = end
+
+        self._positions[key] = len(self.keys)
+        self.keys.append(key)
+        self.texts.append(text)
+        self._df[columns] += 1
+        self._weighted = None
+
+        terms = Counter(word_ngrams(tokenize(text)))
+        self._terms.append(terms)
+        self._term_df.update(terms.keys())
+
+    def get_text(self, key: str) -> str:
+        return self.texts[self._positions[key]]
+
+    def _idf(self) -> np.ndarray:
+        return np.log((1.0 + len(self.keys)) / (1.0 + self._df)) + 1.0
+
+    def _weighted_cells(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._weighted is None:
+            rows, columns = self._rows[:self._size], self._columns[:self._size]
+            weighted = self._values[:self._size] * self._idf()[columns]
+            norms = np.sqrt(np.bincount(rows, weights=weighted ** 2, minlength=len(self.keys)))
+            norms[norms == 0] = 1.0
+            self._weighted = (weighted, norms)
+        return self._weighted
+
+    def query(self, text: str, top_k: int = 5, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """The `top_k` most similar indexed texts as (key, score), best first."""
+        if not self.keys:
+            return []
+
+        query_vec = l2_normalize(term_frequency_vectors([text], self.analyzer, self.n_features) * self._idf())[0]
+        weighted, norms = self._weighted_cells()
+        rows, columns = self._rows[:self._size], self._columns[:self._size]
+        scores = np.bincount(rows, weights=weighted * query_vec[columns], minlength=len(self.keys)) / norms
+
+        excluded = set(exclude)
+        ranked = np.argsort(-scores, kind="stable")
+        results = [(self.keys[i], float(scores[i])) for i in ranked if self.keys[i] not in excluded]
+        return results[:top_k]
+
+    def key_terms(self, key: str, n: int = 6, ignore: Iterable[str] = ()) -> List[str]:
+        """The most distinctive word n-grams of one indexed text (TF-IDF over the whole corpus)."""
+        ignored = {w.lower() for w in ignore}
+        terms = {
+            term: count for term, count in self._terms[self._positions[key]].items()
+            if not ignored.intersection(term.split())
+        }
+        n_docs = len(self.keys)
+
+        def score(item: Tuple[str, int]) -> Tuple[bool, float, str]:
+            term, count = item
+            idf = np.log((1.0 + n_docs) / (1.0 + self._term_df[term])) + 1.0
+            # Repeated terms describe the text's theme; one-off phrases are mostly narrative filler
+            return (count < 2, -count * idf * len(term.split()), term)
+
+        scored = sorted(terms.items(), key=score)
+
+        picked: List[str] = []
+        for term, _ in scored:
+            # Skip words already covered by a picked phrase (and vice versa)
+            if any(term in p or p in term for p in picked):
+                continue
+            picked.append(term)
+            if len(picked) == n:
+                break
+        return picked
+
+    def common_terms(self, n: int = 10, ignore: Iterable[str] = ()) -> List[str]:
+        """Word n-grams shared by the most indexed texts, i.e. the themes the corpus already covers."""
+        ignored = {w.lower() for w in ignore}
+        shared = [
+            (term, df) for term, df in self._term_df.items()
+            if df > 1 and not ignored.intersection(term.split())
+        ]
+        shared.sort(key=lambda item: (-item[1], -len(item[0].split()), item[0]))
+
+        picked: List[str] = []
+        for term, _ in shared:
+            if any(term in p or p in term for p in picked):
+                continue
+            picked.append(term)
+            if len(picked) == n:
+                break
+        return picked
+
+
+# ==============================================================================================
+# LOCAL TEXT CLASSIFICATION (hashed n-gram TF-IDF + logistic regression)
+
+class TextClassifier:
+    """
+    Binary logistic regression over hashed TF-IDF features, trained with full-batch gradient descent.
+    Features are kept sparse (a summary has a few hundred non-zero n-grams out of `n_features`).
+    """
+
+    def __init__(self, analyzer: str = "char", n_features: int = 2 ** 13, l2: float = 1e-3,
+                 learning_rate: float = 5.0, epochs: int = 400):
+        self.analyzer = analyzer
+        self.n_features = n_features
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.epochs = epochs
+
+        self.idf: Optional[np.ndarray] = None
+        self.weights: Optional[np.ndarray] = None
+        self.bias = 0.0
+
+    def _tfidf(self, rows: np.ndarray, columns: np.ndarray, values: np.ndarray, n_rows: int) -> np.ndarray:
+        """L2-normalised TF-IDF values of sparse term frequencies."""
+        values = values * self.idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=n_rows))
+        norms[norms == 0] = 1.0
+        return (values / norms[rows]).astype(np.float32)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[bool]) -> "TextClassifier":
+        texts = list(texts)
+        rows, columns, values = sparse_term_frequencies(texts, self.analyzer, self.n_features)
+        # Smoothed IDF, as inverse_document_frequency (each (row, column) cell appears once)
+        df = np.bincount(columns, minlength=self.n_features)
+        self.idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+        n_rows = len(texts)
+        values = self._tfidf(rows, columns, values, n_rows)
+        y = np.asarray(labels, dtype=np.float32)
+
+        # Balance the classes so a skewed label history does not drown the minority class
+        positives = max(float(y.sum()), 1.0)
+        negatives = max(float(len(y) - y.sum()), 1.0)
+        sample_weights = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives)).astype(np.float32)
+
+        self.weights = np.zeros(self.n_features, dtype=np.float32)
+        self.bias = 0.0
+        for _ in range(self.epochs):
+            scores = np.bincount(rows, weights=values * self.weights[columns], minlength=n_rows)
+            error = (self._sigmoid(scores + self.bias) - y) * sample_weights
+            gradient = np.bincount(columns, weights=values * error[rows], minlength=self.n_features)
+            self.weights -= (self.learning_rate * (gradient / len(y) + self.l2 * self.weights)).astype(np.float32)
+            self.bias -= self.learning_rate * float(error.mean())
+        return self
+
+    @staticmethod
+    def _sigmoid(z: np.ndarray) -> np.ndarray:
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Probability of the positive label for each text."""
+        if self.weights is None:
+            raise ValueError("❌ TextClassifier must be fitted before predicting.")
+        texts = list(texts)
+        rows, columns, values = sparse_term_frequencies(texts, self.analyzer, self.n_features)
+        values = self._tfidf(rows, columns, values, len(texts))
+        scores = np.bincount(rows, weights=values * self.weights[columns], minlength=len(texts))
+        return self._sigmoid(scores + self.bias)
@@ -1,7 +1,7 @@
 import os
 import json
 import streamlit as st
-from pipeline.utils import Utils
+from pipeline.utils import Utils, save_json
 
 def is_valid_persona_filename(filename):
     return filename.startswith("P-") and filename.endswith(".json") and filename[2:5].isdigit()
@@ -49,8 +49,7 @@ def data_section():
                 try:
                     content = json.load(file)
                     save_path = os.path.join(utils.UPLOADED_PERSONA_DIR, filename)
-                    with open(save_path, "w", encoding="utf-8") as f:
-                        json.dump(content, f, indent=2, ensure_ascii=False)
+                    save_json(save_path, content)
                     st.success(f"✅ Uploaded: {filename}")
                 except Exception as e:
                     st.error(f"❌ Failed to save {filename}: {e}")
@@ -1,9 +1,10 @@
+import io
 import os
 import zipfile
-import shutil
 import streamlit as st
 
-from pipeline.utils import Utils
+from pipeline.artifact_store import ARTIFACT_DB_FILENAME, ArtifactStore
+from pipeline.utils import Utils, dump_json_bytes
 
 def zip_and_download(label, source_dir, zip_name):
     if not os.path.exists(source_dir) or not os.listdir(source_dir):
@@ -28,6 +29,26 @@ def zip_and_download(label, source_dir, zip_name):
 
     os.remove(zip_path)
 
+def zip_store_files_and_download(label, store_files, source_dir, zip_name):
+    """Same as zip_and_download, but zips (relative path, JSON) files exported from the artifact store in memory."""
+    files = [(os.path.relpath(path, source_dir), data) for path, data in store_files
+             if not os.path.relpath(path, source_dir).startswith("..")]
+    if not files:
+        st.warning(f"No data found for {label} in the artifact store under {source_dir}")
+        return
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for arcname, data in files:
+            zipf.writestr(arcname, dump_json_bytes(data))
+
+    st.download_button(
+        label=f"📥 Download {label}",
+        data=buffer.getvalue(),
+        file_name=zip_name + ".zip",
+        mime="application/zip"
+    )
+
 def results_section():
     st.subheader("📂 Results Explorer")
 
@@ -67,13 +88,33 @@ def results_section():
     utils.refresh_result_paths_for_ui(selected_combo)
 
     st.markdown("### 📦 Download Outputs")
+
+    # When the run has an artifact store, the downloads are zipped straight from it in the usual JSON layout
+    store_files = None
+    store_path = os.path.join(result_root, ARTIFACT_DB_FILENAME)
+    if os.path.exists(store_path):
+        store = ArtifactStore(db_path=store_path, results_root=result_root)
+        store.sync_json()
+        store_files = list(store.iter_json_files(collections=[
+            "use_cases", "unique_tasks", "unique_user_stories",
+            "non_functional_conflicts_within", "functional_conflicts_within",
+            "non_functional_conflicts_across", "functional_conflicts_across",
+        ]))
+        store.close()
+
+    def download(label: str, path: str, zip_name: str) -> None:
+        if store_files is None:
+            zip_and_download(label, path, zip_name)
+        else:
+            zip_store_files_and_download(label, store_files, os.path.relpath(path, utils.ROOT_RESULTS_DIR), zip_name)
+
     col1, col2 = st.columns(2)
 
     with col1:
-        zip_and_download("Use Cases", utils.USE_CASE_DIR, "use_cases")
-        zip_and_download("Valid Use Case Tasks", utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR, "valid_tasks")
-        zip_and_download("Valid User Stories", utils.UNIQUE_USER_STORY_DIR_PATH, "valid_user_stories")
+        download("Use Cases", utils.USE_CASE_DIR, "use_cases")
+        download("Valid Use Case Tasks", utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR, "valid_tasks")
+        download("Valid User Stories", utils.UNIQUE_USER_STORY_DIR_PATH, "valid_user_stories")
 
     with col2:
-        zip_and_download("Conflicts Within One Group", utils.USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, "conflicts_within")
-        zip_and_download("Conflicts Across Two Groups", utils.USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, "conflicts_across")
+        download("Conflicts Within One Group", utils.USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, "conflicts_within")
+        download("Conflicts Across Two Groups", utils.USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, "conflicts_across")
@@ -2,6 +2,7 @@ import os
 import re
 import textwrap
 
+from pipeline.similarity import SimilarityIndex
 from pipeline.use_case.use_case_loader import UseCaseLoader
 from pipeline.utils import (
     UserPersonaLoader, 
@@ -9,6 +10,52 @@ from pipeline.utils import (
 )
 
 
+# Number of most related prior scenarios listed in the "avoid these themes" digest
+THEME_DIGEST_SIZE = 8
+# Number of theme phrases kept per prior scenario
+THEMES_PER_SCENARIO = 6
+# A new scenario at or above this similarity to any prior one is regenerated once
+SCENARIO_DUPLICATE_THRESHOLD = 0.35
+MAX_SCENARIO_ATTEMPTS = 2
+
+
+# ========== Step c: Scenario Novelty Index ==========
+def build_scenario_index(use_cases) -> SimilarityIndex:
+    """Index every scenario written so far, so novelty is checked against the whole corpus."""
+    index = SimilarityIndex(analyzer="word")
+    for uc in use_cases:
+        if uc.scenario and uc.scenario.strip():
+            index.add(uc.id, uc.scenario.strip())
+    return index
+
+
+def scenario_themes(scenario_index: SimilarityIndex, uc_id: str, persona_by_id: dict) -> str:
+    # Persona and system names are expected to recur, so they are never reported as themes
+    ignored_words = {Utils().SYSTEM_NAME} | {word for p in persona_by_id.values() for word in p.name.lower().split()}
+    return ", ".join(scenario_index.key_terms(uc_id, n=THEMES_PER_SCENARIO, ignore=ignored_words))
+
+
+def build_theme_digest(uc, scenario_index: SimilarityIndex, uc_loader: UseCaseLoader, persona_by_id: dict) -> str:
+    """Compact digest of the themes used by the prior scenarios most related to this use case."""
+    if not len(scenario_index):
+        return ""
+
+    query = " ".join([uc.name, uc.description] + [
+        f"{persona_by_id[pid].name} {persona_by_id[pid].role}" for pid in uc.personas if pid in persona_by_id
+    ])
+
+    lines = []
+    for prev_id, _ in scenario_index.query(query, top_k=THEME_DIGEST_SIZE, exclude=[uc.id]):
+        prev = uc_loader.get_by_id(prev_id)
+        actors = "; ".join(
+            f"{persona_by_id[pid].name} ({persona_by_id[pid].role})"
+            for pid in prev.personas if pid in persona_by_id
+        )
+        lines.append(f"- {prev.id} \"{prev.name}\" – {actors} – themes: {scenario_themes(scenario_index, prev_id, persona_by_id)}")
+
+    return "\n".join(lines)
+
+
 # ========== Step c: Prompt Constructor ==========
 def build_scenario_prompt(
     uc,
@@ -16,8 +63,9 @@ def build_scenario_prompt(
     system_context: str,
     uc_guidelines: str,
     user_groups_guidelines: dict,
-    previous_use_cases,
+    theme_digest: str,
     proficiency_level: str = "",
+    retry_note: str = "",
 ) -> str:
     """Return a prompt that discourages scenario duplication."""
 
@@ -31,19 +79,7 @@ def build_scenario_prompt(
     persona_text = "\n".join(persona_blocks)
     group_ctx = "\n\n".join(f"{g}:\n{user_groups_guidelines[g]}" for g in sorted(group_set))
 
-    # --- Prior scenarios (last 6 for brevity) ---
-    persona_by_id = {p.id: p for p in all_personas.values()}
-    prev_summaries = []
-    for prev in previous_use_cases:
-        if not prev.scenario or prev.id == uc.id:
-            continue
-        actors = "; ".join(
-            f"{persona_by_id[pid].name} ({persona_by_id[pid].role})"
-            for pid in prev.personas if pid in persona_by_id
-        )
-        prev_summaries.append(f"- {prev.id} – {actors}\n{prev.scenario.strip()}")
-
-    prev_block = "\n\n".join(prev_summaries[-6:]) or "None (The current is the first real use case being written, besides the non-existent examples)"
+    prev_block = theme_digest or "None (The current is the first real use case being written, besides the non-existent examples)"
 
     return textwrap.dedent(
         f"""
@@ -82,9 +118,10 @@ Compose a lifelike 200–400-word scenario that:
     • Avoid over-relying on the use case name or description, or the given system context or its user group summaries to dictate behavior. Focus instead on how these personas would realistically react, misunderstand, or personalize their experience with the system, using all their information provided in the persona context
 -----------------------------
 
---- PREVIOUS REAL USE CASE SCENARIOS (To avoid duplication) ---
-Besides the unreal and non-existent examples in the Use case Guidelines, here are the last scenarios of other use cases that has been written:
+--- THEMES OF PREVIOUS REAL USE CASE SCENARIOS (To avoid duplication) ---
+Besides the unreal and non-existent examples in the Use case Guidelines, here are the themes already covered by the most related scenarios of other use cases that have been written. Avoid these themes:
 {prev_block}
+{retry_note}
 Note that, while minor thematic similarities are acceptable, the current scenario must present clearly **distinct** actions, motivations, and interactions for the involved personas. Do not reuse **specific** activities, dialogue, or situation structures from prior scenarios—even implicitly. Focus on crafting a uniquely personalized and realistic narrative driven by the distinctive goals, traits, struggles, main actions, etc., of the personas involved in this use case.
 When the current scenario includes a persona that has been previously used, it should be focused on the aspects of that persona (e.g., goals, actions, challenges, singularities, ...) that has not been previously used or presented. However, if there is no new aspects to use, just re-use the existing ones, strictly do not generate new aspects for each persona, as these aspects must always be presented all in the persona context.
 -----------------------------
@@ -115,6 +152,10 @@ def enrich_use_cases_with_scenarios(persona_loader: UserPersonaLoader) -> None:
     # --- Language proficiency level ---
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
+    # --- Novelty index over all scenarios written so far ---
+    persona_by_id = {p.id: p for p in all_personas.values()}
+    scenario_index = build_scenario_index(uc_loader.get_all())
+
     for uc in uc_loader.get_all():
         if uc.scenario and uc.scenario.strip():
             print(f"⏭️  {uc.id} already has a scenario.")
@@ -124,12 +165,30 @@ def enrich_use_cases_with_scenarios(persona_loader: UserPersonaLoader) -> None:
             continue
 
         print(f"\n🧠  Generating scenario for {uc.id} …")
-        prompt = build_scenario_prompt(uc, all_personas, system_context, uc_guidelines, user_groups_guidelines, uc_loader.get_all())
-        raw = utils.get_llm_response(prompt)
+        theme_digest = build_theme_digest(uc, scenario_index, uc_loader, persona_by_id)
+        retry_note = ""
+
+        for attempt in range(1, MAX_SCENARIO_ATTEMPTS + 1):
+            prompt = build_scenario_prompt(uc, all_personas, system_context, uc_guidelines, user_groups_guidelines, theme_digest, retry_note=retry_note)
+            raw = utils.get_llm_response(prompt)
+
+            # Clean accidental code fences or markdown
+            scenario = re.sub(r"```.*?```", "", raw, flags=re.S).strip()
+
+            # Check the draft against every scenario written so far
+            closest = scenario_index.query(scenario, top_k=1, exclude=[uc.id])
+            if not closest or closest[0][1] < SCENARIO_DUPLICATE_THRESHOLD or attempt == MAX_SCENARIO_ATTEMPTS:
+                break
+
+            prev_id, score = closest[0]
+            print(f"🔁  Draft for {uc.id} is too close to {prev_id} (similarity {score:.2f}) – regenerating …")
+            retry_note = (
+                f"IMPORTANT: A previous draft of this scenario was too similar to {prev_id} "
+                f"(themes: {scenario_themes(scenario_index, prev_id, persona_by_id)}). Take a clearly different angle."
+            )
 
-        # Clean accidental code fences or markdown
-        scenario = re.sub(r"```.*?```", "", raw, flags=re.S).strip()
         uc.scenario = scenario
+        scenario_index.add(uc.id, scenario)
 
         print(f"✅  {uc.id} scenario added → {scenario[:200]}…")
 
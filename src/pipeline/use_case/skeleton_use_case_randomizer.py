@@ -11,6 +11,7 @@ from pipeline.utils import (
     UserPersona,
     UserPersonaLoader,
     Utils,
+    save_json,
 )
 
 # ========== Utility: Persona Group Generator ==========
@@ -142,6 +143,6 @@ def write_use_case_skeletons(persona_loader: UserPersonaLoader, seed: int = None
 
     Path(utils.USE_CASE_DIR).mkdir(parents=True, exist_ok=True)
     for uc in use_cases:
-        (Path(utils.USE_CASE_DIR) / f"{uc['id']}.json").write_text(json.dumps(uc, indent=2, ensure_ascii=False))
+        save_json(str(Path(utils.USE_CASE_DIR) / f"{uc['id']}.json"), uc)
 
     print(f"📝 Generated {len(use_cases)} skeletons; persona frequency gap={gap()}")
\ No newline at end of file
@@ -1,23 +1,26 @@
 import json
 import os
-from typing import List, Optional
+from collections import defaultdict
+from typing import Dict, List, Optional
 
-from pipeline.utils import Utils
+from pipeline.utils import Utils, intern_value, save_json
 
 
 class UseCase:
     """Represents a single ALFRED system use case."""
 
+    __slots__ = ("id", "personas", "use_case_type", "user_groups", "pillars", "name", "title", "description", "scenario")
+
     def __init__(self, data: dict):
         if "id" not in data or "personas" not in data:
             raise ValueError("❌ A use case must contain 'id' and 'personas'.")
 
         self.id: str = data["id"]
-        self.personas: List[str] = data["personas"]
+        self.personas: List[str] = [intern_value(p) for p in data["personas"]]
 
-        self.use_case_type: str = data.get("useCaseType", "")
-        self.user_groups: List[str] = data.get("userGroups", [])
-        self.pillars: List[str] = data.get("pillars", [])
+        self.use_case_type: str = intern_value(data.get("useCaseType", ""))
+        self.user_groups: List[str] = [intern_value(g) for g in data.get("userGroups", [])]
+        self.pillars: List[str] = [intern_value(p) for p in data.get("pillars", [])]
         
         self.name: str = data.get("name", "")
         self.title: str = self.name
@@ -41,44 +44,144 @@ class UseCase:
 
 
 class UseCaseLoader:
-    """Loads all ALFRED use cases from a directory of JSON files."""
+    """
+    Loads all ALFRED use cases from a directory of JSON files, indexed by ID, persona, type and pillar.
+    With `use_bundle=True`, an up-to-date single-file bundle of the directory is read instead of
+    parsing one file per use case, and refreshed on save.
+    """
+
+    BUNDLE_FILENAME = "use_cases_bundle.json"
 
-    def __init__(self, directory: str = None):
+    def __init__(self, directory: str = None, use_bundle: bool = False):
         self.utils = Utils()
         self.directory = directory or self.utils.USE_CASE_DIR
+        self.use_bundle = use_bundle
 
         self.use_cases: List[UseCase] = []
 
+        # Lookup indexes, rebuilt on load/save and extended by add_use_case
+        self.by_id: Dict[str, UseCase] = {}
+        self.by_persona: Dict[str, List[UseCase]] = defaultdict(list)
+        self.by_type: Dict[str, List[UseCase]] = defaultdict(list)
+        self.by_pillar: Dict[str, List[UseCase]] = defaultdict(list)
+
+        # Last saved/loaded content per use case ID, used to write only changed files
+        self._saved_state: Dict[str, dict] = {}
+
+    @property
+    def bundle_path(self) -> str:
+        return os.path.join(self.directory, self.BUNDLE_FILENAME)
+
+    def _use_case_files(self) -> List[os.DirEntry]:
+        return [
+            entry for entry in os.scandir(self.directory)
+            if entry.name.startswith("UC-") and entry.name.endswith(".json")
+        ]
+
+    def _bundle_is_fresh(self, files: List[os.DirEntry]) -> bool:
+        """The bundle is usable when it is newer than every use case file it mirrors."""
+        if not os.path.exists(self.bundle_path):
+            return False
+        bundle_mtime = os.path.getmtime(self.bundle_path)
+        return all(entry.stat().st_mtime <= bundle_mtime for entry in files)
+
+    def _build_indexes(self) -> None:
+        self.by_id = {}
+        self.by_persona = defaultdict(list)
+        self.by_type = defaultdict(list)
+        self.by_pillar = defaultdict(list)
+
+        for uc in self.use_cases:
+            self._index(uc)
+
+    def _index(self, uc: UseCase) -> None:
+        self.by_id[uc.id] = uc
+        for persona_id in uc.personas:
+            self.by_persona[persona_id].append(uc)
+        self.by_type[uc.use_case_type].append(uc)
+        for pillar in uc.pillars:
+            self.by_pillar[pillar].append(uc)
+
     def load(self) -> None:
         if not os.path.exists(self.directory):
             print(f"❌ Use case directory not found: {self.directory}")
             return
 
         try:
-            count = 0
             self.use_cases = []
-            
-            for filename in os.listdir(self.directory):
-                if filename.startswith("UC-") and filename.endswith(".json"):
-                    full_path = os.path.join(self.directory, filename)
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        self.use_cases.append(UseCase(data))
-                        count += 1
-            print(f"✅ Loaded {count} use case(s) from {self.directory}")
+            files = self._use_case_files()
+
+            records = None
+            if self.use_bundle and self._bundle_is_fresh(files):
+                with open(self.bundle_path, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+                source = self.bundle_path
+                # A use case file added or removed since the bundle was written makes it stale
+                if {f"{data['id']}.json" for data in records} != {entry.name for entry in files}:
+                    records = None
+
+            if records is None:
+                records = []
+                for entry in sorted(files, key=lambda e: e.name):
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        records.append(json.load(f))
+                source = self.directory
+
+            self.use_cases = [UseCase(data) for data in records]
+            self._saved_state = {uc.id: uc.to_dict() for uc in self.use_cases}
+            self._build_indexes()
+
+            print(f"✅ Loaded {len(self.use_cases)} use case(s) from {source}")
         except Exception as e:
             print(f"❌ Failed to load use cases: {e}")
 
     def get_all(self) -> List[UseCase]:
         return self.use_cases
 
+    def get_by_id(self, use_case_id: str) -> Optional[UseCase]:
+        return self.by_id.get(use_case_id)
+
+    def get_by_persona(self, persona_id: str) -> List[UseCase]:
+        return self.by_persona.get(persona_id, [])
+
+    def get_by_type(self, use_case_type: str) -> List[UseCase]:
+        return self.by_type.get(use_case_type, [])
+
+    def get_by_pillar(self, pillar: str) -> List[UseCase]:
+        return self.by_pillar.get(pillar, [])
+
+    def add_use_case(self, use_case: UseCase) -> None:
+        if use_case.id in self.by_id:
+            raise ValueError(f"❌ Duplicate use case ID: {use_case.id}")
+        self.use_cases.append(use_case)
+        # Appended last, so adding it to the end of its buckets keeps them in load order
+        self._index(use_case)
+
+    def get_dirty(self) -> List[UseCase]:
+        """Use cases whose content differs from what was last loaded or saved."""
+        return [uc for uc in self.use_cases if self._saved_state.get(uc.id) != uc.to_dict()]
+
     def save_all(self) -> None:
+        """Write only the use cases that changed since they were loaded or last saved."""
         os.makedirs(self.directory, exist_ok=True)
-        for use_case in self.use_cases:
+
+        dirty = self.get_dirty()
+        for use_case in dirty:
             file_path = os.path.join(self.directory, f"{use_case.id}.json")
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(use_case.to_dict(), f, indent=2, ensure_ascii=False)
-        print(f"💾 Saved {len(self.use_cases)} use case files to {self.directory}")
+            save_json(file_path, use_case.to_dict())
+            self._saved_state[use_case.id] = use_case.to_dict()
+
+        # Memberships may have changed through attribute edits
+        self._build_indexes()
+
+        if self.use_bundle and (dirty or not self._bundle_is_fresh(self._use_case_files())):
+            self.save_bundle()
+
+        print(f"💾 Saved {len(dirty)} changed use case file(s) to {self.directory} ({len(self.use_cases)} total)")
+
+    def save_bundle(self) -> None:
+        """Write every use case into one compact JSON file for fast cold loads."""
+        save_json(self.bundle_path, [uc.to_dict() for uc in self.use_cases], compact=True)
 
     def print_all_use_cases(self) -> None:
         if not self.use_cases:
@@ -1,13 +1,32 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
 from pathlib import Path
+from typing import List, Optional, Set, Tuple
 
+from pipeline.similarity import SimilarityIndex, bounded_groups, cosine_similarity_matrix
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    load_json,
+    save_json,
 )
 
 
+# Tasks at or above this cosine similarity are treated as duplicates without asking the LLM
+NEAR_DUPLICATE_THRESHOLD = 0.85
+# Tasks between this and NEAR_DUPLICATE_THRESHOLD form borderline groups that the LLM reviews
+CANDIDATE_THRESHOLD = 0.2
+# Upper bound on the number of tasks sent to the LLM in one prompt
+MAX_CANDIDATE_GROUP_SIZE = 12
+
+# Hierarchical (map-reduce) mode: every surviving task is reviewed by the LLM in chunks of at most
+# DEDUP_CHUNK_SIZE tasks, and the survivors of adjacent chunks are merged in further rounds
+DEDUP_CHUNK_SIZE = 25
+MAX_DEDUP_WORKERS = 4
+
+
 def build_batch_dedup_prompt(system_context: str, tasks: list, persona_prompt: str) -> str:
     examples = [
         {"taskID": task["taskID"], "description": task["taskDescription"]}
@@ -48,71 +67,230 @@ Return ONLY the list likes the above example. Do not include any explanation, co
 """.strip()
 
 
-def deduplicate_tasks_for_all_use_cases(persona_loader: UserPersonaLoader):
+def prefilter_duplicate_tasks(tasks: list) -> Tuple[List[str], List[list]]:
+    """
+    Locally split a persona's tasks into obvious duplicates and borderline candidate groups.
+    Returns the task IDs to remove outright, and the groups of tasks the LLM should still review.
+    """
+    described = [t for t in tasks if t.get("taskDescription")]
+    if len(described) <= 1:
+        return [], []
+
+    similarity = cosine_similarity_matrix([t["taskDescription"] for t in described])
+
+    # Greedy pass in file order: a task is dropped when it nearly repeats an earlier kept task
+    kept, removed = [], set()
+    for i in range(len(described)):
+        if any(similarity[i, k] >= NEAR_DUPLICATE_THRESHOLD for k in kept):
+            removed.add(i)
+        else:
+            kept.append(i)
+
+    survivors = similarity[kept][:, kept]
+    candidate_groups = [
+        [described[kept[i]] for i in group]
+        for group in bounded_groups(survivors, CANDIDATE_THRESHOLD, MAX_CANDIDATE_GROUP_SIZE)
+    ]
+
+    return [described[i]["taskID"] for i in sorted(removed)], candidate_groups
+
+
+def dedup_task_chunk(utils: Utils, system_context: str, persona, chunk: list) -> List[str]:
+    """Ask the LLM which tasks of one bounded chunk are redundant. Only IDs from the chunk are returned."""
+    chunk_ids = {t["taskID"] for t in chunk}
+    prompt = build_batch_dedup_prompt(system_context, chunk, persona.to_prompt_string())
+    response = utils.get_llm_response(prompt)
+
+    try:
+        to_remove_ids = json.loads(response)
+        if not isinstance(to_remove_ids, list):
+            raise ValueError("Expected a list of task IDs.")
+    except Exception as e:
+        print(f"⚠️ LLM response parsing failed for a chunk of {len(chunk)} tasks ({persona.id}): {e}")
+        return []
+
+    return [tid for tid in to_remove_ids if tid in chunk_ids]
+
+
+def dedup_task_chunks(utils: Utils, system_context: str, persona, chunks: List[list]) -> List[List[str]]:
+    """Deduplicate independent chunks concurrently; results come back in chunk order."""
+    if not chunks:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_DEDUP_WORKERS, len(chunks))) as executor:
+        return list(executor.map(lambda chunk: dedup_task_chunk(utils, system_context, persona, chunk), chunks))
+
+
+def order_tasks_by_similarity(tasks: list, removed_ids: List[str]) -> list:
+    """
+    Surviving tasks chained by nearest neighbour in a similarity index (each task is followed by the most
+    similar one not placed yet), so that near-duplicates sit next to each other and share a chunk.
+    """
+    removed = set(removed_ids)
+    remaining = [t for t in tasks if t.get("taskDescription") and t["taskID"] not in removed]
+    if len(remaining) <= 2:
+        return remaining
+
+    index = SimilarityIndex()
+    for task in remaining:
+        index.add(task["taskID"], task["taskDescription"])
+    by_id = {t["taskID"]: t for t in remaining}
+
+    ordered = [remaining[0]]
+    placed = {remaining[0]["taskID"]}
+    while len(ordered) < len(remaining):
+        (next_id, _), = index.query(ordered[-1]["taskDescription"], top_k=1, exclude=placed)
+        ordered.append(by_id[next_id])
+        placed.add(next_id)
+    return ordered
+
+
+def hierarchical_dedup_tasks(utils: Utils, system_context: str, persona, tasks: list, reviewable: Optional[Set[str]] = None) -> List[str]:
+    """
+    Map-reduce deduplication over tasks in similarity order: chunks of DEDUP_CHUNK_SIZE tasks are
+    deduplicated in parallel, then adjacent groups of survivors are merged pairwise round after round
+    until one group is left. A merge whose survivors fit in one chunk reviews them all; a larger one
+    reviews the chunk of survivors around the boundary, where the similarity order puts duplicates
+    across the two groups. Prompt size is bounded by DEDUP_CHUNK_SIZE, the number of prompts grows
+    linearly with the number of tasks, and the number of rounds logarithmically.
+    With `reviewable`, only those task IDs can be removed and chunks without any of them are skipped.
+    """
+    removed_ids: Set[str] = set()
+    groups = [tasks[i:i + DEDUP_CHUNK_SIZE] for i in range(0, len(tasks), DEDUP_CHUNK_SIZE)]
+    chunks = groups
+
+    for round_no in count(1):
+        chunks = [c for c in chunks if len(c) > 1]
+        if reviewable is not None:
+            chunks = [c for c in chunks if any(t["taskID"] in reviewable for t in c)]
+        if chunks:
+            print(f"   ➤ Round {round_no}: {len(tasks) - len(removed_ids)} task(s), {len(chunks)} chunk(s)")
+            round_removed = {tid for ids in dedup_task_chunks(utils, system_context, persona, chunks) for tid in ids}
+            if reviewable is not None:
+                round_removed &= reviewable
+            removed_ids |= round_removed
+
+        groups = [[t for t in group if t["taskID"] not in removed_ids] for group in groups]
+        if len(groups) <= 1:
+            break
+
+        # Merge adjacent groups; an unpaired last group moves up unchanged
+        merged, chunks = [], []
+        for i in range(0, len(groups), 2):
+            pair = groups[i:i + 2]
+            if len(pair) == 2:
+                left, right = pair
+                if len(left) + len(right) <= DEDUP_CHUNK_SIZE:
+                    chunks.append(left + right)
+                else:
+                    half = DEDUP_CHUNK_SIZE // 2
+                    chunks.append(left[-half:] + right[:DEDUP_CHUNK_SIZE - half])
+            merged.append([t for group in pair for t in group])
+        groups = merged
+
+    return [t["taskID"] for t in tasks if t["taskID"] in removed_ids]
+
+
+def load_deduplicated_task_ids(task_dir: Path, invalid_dir: Path, persona_tasks: dict) -> Set[str]:
+    """IDs of the saved tasks that a deduplication run has already reviewed."""
+    utils = Utils()
+    if os.path.exists(utils.DEDUPLICATED_TASK_IDS_PATH):
+        return set(load_json(utils.DEDUPLICATED_TASK_IDS_PATH))
+
+    # Results from before the record existed: personas with a duplicate file were reviewed, except for
+    # the tasks of use cases whose extraction file is still waiting to be deduplicated
+    pending_uc = {f.stem.split("_from_")[-1] for f in task_dir.glob("Extracted_tasks_from_UC-*.json")}
+    return {
+        t["taskID"]
+        for persona_id, tasks in persona_tasks.items()
+        if (invalid_dir / f"Duplicated_extracted_tasks_for_{persona_id}.json").exists()
+        for t in tasks
+        if t.get("useCaseId") not in pending_uc
+    }
+
+
+def deduplicate_tasks_for_all_use_cases(persona_loader: UserPersonaLoader, hierarchical: bool = False):
+    """
+    Remove redundant tasks for every persona. Obvious near-duplicates are removed locally first.
+    By default, only borderline candidate groups go to the LLM; with `hierarchical=True` every
+    remaining task is reviewed by the LLM through chunked map-reduce rounds instead.
+    Runs are incremental: tasks reviewed by an earlier run are kept, and only tasks added since
+    (compared with each other and with the kept ones) can be removed.
+    """
     utils = Utils()
 
     all_personas = {p.id: p for p in persona_loader.get_personas()}
-    persona_ids = set(all_personas.keys())
     
     task_dir = Path(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR)
     invalid_dir = Path(utils.DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR)
-    
-    # Skipping logic
-    if invalid_dir.exists():
-        invalid_files = list(invalid_dir.glob("Duplicated_extracted_tasks_for_P-*.json"))
-        found_ids = {f.stem.split("_for_")[-1] for f in invalid_files}
-        if found_ids >= persona_ids:
-            print(f"⏭️ Skipping task deduplication – all invalid task files already exist for {len(found_ids)} personas.\n")
-            return
-
-    # Create invalid directory if it doesn't exist
-    invalid_dir.mkdir(parents=True, exist_ok=True)
-
-    # Load system context
-    system_context = utils.load_system_context()
-    
-    # Load all persona tasks
-    persona_files = sorted(task_dir.glob("Unique_extracted_tasks_for_*.json"))
-    print(f"🔍 Starting batch task deduplication for {len(persona_files)} personas...\n")
 
-    for file_path in persona_files:
+    # Load all persona tasks
+    persona_tasks = {}
+    for file_path in sorted(task_dir.glob("Unique_extracted_tasks_for_*.json")):
         persona_id = file_path.stem.split("_for_")[-1]
+        try:
+            persona_tasks[persona_id] = json.loads(file_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"❌ Failed to read tasks for {persona_id}: {e}")
+
+    # Skipping logic: only personas with tasks that no run has reviewed yet
+    reviewed_ids = load_deduplicated_task_ids(task_dir, invalid_dir, persona_tasks)
+    pending = {
+        persona_id: tasks for persona_id, tasks in persona_tasks.items()
+        if any(t["taskID"] not in reviewed_ids for t in tasks)
+    }
+
+    if not pending:
+        save_json(utils.DEDUPLICATED_TASK_IDS_PATH, sorted(reviewed_ids))
+        print(f"⏭️ Skipping task deduplication – all tasks of {len(persona_tasks)} personas were already reviewed.\n")
+    else:
+        # Create invalid directory if it doesn't exist
+        invalid_dir.mkdir(parents=True, exist_ok=True)
+
+        # Load system context
+        system_context = utils.load_system_context()
+        print(f"🔍 Starting batch task deduplication for {len(pending)} personas...\n")
+
+    for persona_id, tasks in pending.items():
         persona = all_personas.get(persona_id)
         if not persona:
             print(f"⚠️ Persona {persona_id} not found in loader. Skipping.")
             continue
 
-        try:
-            tasks = json.loads(file_path.read_text(encoding="utf-8"))
-        except Exception as e:
-            print(f"❌ Failed to read tasks for {persona_id}: {e}")
-            continue
+        new_ids = {t["taskID"] for t in tasks if t["taskID"] not in reviewed_ids}
+        reviewed_ids.update(t["taskID"] for t in tasks)
 
         if len(tasks) <= 1:
+            save_json(utils.DEDUPLICATED_TASK_IDS_PATH, sorted(reviewed_ids))
             continue
 
-        print(f"🧠 Deduplicating {len(tasks)} tasks for {persona_id}...")
+        print(f"🧠 Deduplicating {len(new_ids)} new of {len(tasks)} tasks for {persona_id}...")
 
-        prompt = build_batch_dedup_prompt(system_context, tasks, persona.to_prompt_string())
-        response = utils.get_llm_response(prompt)
+        # Tasks kept by an earlier run stay: only new ones are removed, and only groups holding one are reviewed
+        to_remove_ids, candidate_groups = prefilter_duplicate_tasks(tasks)
+        to_remove_ids = [tid for tid in to_remove_ids if tid in new_ids]
+        print(f"   ➤ {len(to_remove_ids)} near-duplicate(s) removed locally")
 
-        try:
-            to_remove_ids = json.loads(response)
-            if not isinstance(to_remove_ids, list):
-                raise ValueError("Expected a list of task IDs.")
-        except Exception as e:
-            print(f"⚠️ LLM response parsing failed for {persona_id}: {e}")
-            continue
+        if hierarchical:
+            survivors = order_tasks_by_similarity(tasks, to_remove_ids)
+            to_remove_ids.extend(hierarchical_dedup_tasks(utils, system_context, persona, survivors, new_ids))
+        else:
+            candidate_groups = [g for g in candidate_groups if any(t["taskID"] in new_ids for t in g)]
+            print(f"   ➤ {len(candidate_groups)} borderline group(s) sent to LLM")
+            for group_remove_ids in dedup_task_chunks(utils, system_context, persona, candidate_groups):
+                to_remove_ids.extend(tid for tid in group_remove_ids if tid in new_ids)
 
         valid_tasks = [t for t in tasks if t["taskID"] not in to_remove_ids]
         invalid_tasks = [t for t in tasks if t["taskID"] in to_remove_ids]
 
         # Save valid tasks back to original path
-        file_path.write_text(json.dumps(valid_tasks, indent=2, ensure_ascii=False), encoding="utf-8")
+        file_path = task_dir / f"Unique_extracted_tasks_for_{persona_id}.json"
+        save_json(str(file_path), valid_tasks)
 
-        # Save invalid tasks to new path
+        # Add invalid tasks to the ones removed by earlier runs
         invalid_path = invalid_dir / f"Duplicated_extracted_tasks_for_{persona_id}.json"
-        invalid_path.write_text(json.dumps(invalid_tasks, indent=2, ensure_ascii=False), encoding="utf-8")
+        saved_invalid = load_json(str(invalid_path)) if invalid_path.exists() else []
+        save_json(str(invalid_path), saved_invalid + invalid_tasks)
+        save_json(utils.DEDUPLICATED_TASK_IDS_PATH, sorted(reviewed_ids))
 
         print(f"✅ {len(invalid_tasks)} duplicate task(s) moved to → {invalid_path.name}")
         print(f"📄 {len(valid_tasks)} valid task(s) retained → {file_path.name}\n")
@@ -125,4 +303,5 @@ def deduplicate_tasks_for_all_use_cases(persona_loader: UserPersonaLoader):
         except Exception as e:
             print(f"⚠️ Could not remove {file.name}: {e}")
 
-    print("🎉 Task deduplication complete for all personas.\n")
+    if pending:
+        print("🎉 Task deduplication complete for all personas.\n")
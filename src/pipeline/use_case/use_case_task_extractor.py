@@ -9,6 +9,10 @@ from collections import defaultdict
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    assign_content_ids,
+    content_hash,
+    load_json,
+    save_json,
 )
 from pipeline.use_case.use_case_loader import UseCaseLoader
 
@@ -137,40 +141,132 @@ def extract_and_save_tasks(uc, all_personas: dict) -> dict:
     }
 
 
+def load_existing_persona_tasks() -> list:
+    """All tasks already saved per persona, both kept (unique) and removed as duplicates."""
+    utils = Utils()
+
+    existing = []
+    sources = [
+        (Path(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR), "Unique_extracted_tasks_for_*.json"),
+        (Path(utils.DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR), "Duplicated_extracted_tasks_for_*.json"),
+    ]
+    for directory, pattern in sources:
+        if not directory.exists():
+            continue
+        for file in sorted(directory.glob(pattern)):
+            try:
+                existing.extend(json.loads(file.read_text(encoding="utf-8")))
+            except Exception as e:
+                print(f"⚠️ Failed to read existing tasks from {file.name}: {e}")
+    return existing
+
+
+def remove_stale_tasks(stale_keys: dict):
+    """
+    Drop tasks of a re-extracted use case that its new extraction no longer yields (task ID -> key):
+    from the kept and duplicate task files, from the deduplication and skeleton extraction records,
+    and the user stories built from them.
+    """
+    utils = Utils()
+
+    sources = [
+        (Path(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR), "Unique_extracted_tasks_for_*.json", "taskID"),
+        (Path(utils.DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR), "Duplicated_extracted_tasks_for_*.json", "taskID"),
+        (Path(utils.UNIQUE_USER_STORY_DIR_PATH), "User_stories_for_*.json", None),
+    ]
+    stale_story_keys = set(stale_keys.values())
+    for directory, pattern, id_field in sources:
+        if not directory.exists():
+            continue
+        for file in sorted(directory.glob(pattern)):
+            records = load_json(str(file))
+            if id_field:
+                kept = [r for r in records if r[id_field] not in stale_keys]
+            else:
+                kept = [r for r in records if (r["use_case"], r["persona"], r["task"]) not in stale_story_keys]
+            if len(kept) < len(records):
+                save_json(str(file), kept)
+                print(f"🧹 Removed {len(records) - len(kept)} outdated record(s) from {file.name}")
+
+    for ledger_path in (utils.DEDUPLICATED_TASK_IDS_PATH, utils.SKELETON_EXTRACTED_TASK_IDS_PATH):
+        if os.path.exists(ledger_path):
+            save_json(ledger_path, [tid for tid in load_json(ledger_path) if tid not in stale_keys])
+
+
 def reformat_and_save_all_tasks_by_persona():
     utils = Utils()
 
     task_dir = Path(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR)
     files = sorted(task_dir.glob("Extracted_tasks_from_UC-*.json"))
-    flat_task_list = []
-    task_counter = 1
 
+    keys = []
+    extracted_uc_ids = set()
     for file in files:
         with file.open("r", encoding="utf-8") as f:
             data = json.load(f)
             uc_id = data.get("useCaseId", "")
+            extracted_uc_ids.add(uc_id)
             for persona_entry in data.get("tasksByPersona", []):
                 persona_id = persona_entry.get("personaId", "")
                 for desc in persona_entry.get("tasks", []):
-                    flat_task_list.append({
-                        "taskID": f"TASK-{task_counter:03}",
-                        "useCaseId": uc_id,
-                        "personaId": persona_id,
-                        "taskDescription": desc
-                    })
-                    task_counter += 1
+                    keys.append((uc_id, persona_id, desc))
+
+    # Tasks saved by earlier runs keep their IDs; new tasks are merged in. An extraction file holds the
+    # whole current extraction of its use case, so saved tasks of that use case it no longer lists are outdated
+    existing_keys = {
+        t["taskID"]: (t["useCaseId"], t["personaId"], t["taskDescription"])
+        for t in load_existing_persona_tasks()
+    }
+    current_keys = set(keys)
+    stale_keys = {
+        task_id: key for task_id, key in existing_keys.items()
+        if key[0] in extracted_uc_ids and key not in current_keys
+    }
+    if stale_keys:
+        remove_stale_tasks(stale_keys)
+        existing_keys = {task_id: key for task_id, key in existing_keys.items() if task_id not in stale_keys}
+
+    # IDs are derived from (use case, persona, task text), so they survive regeneration of other use cases
+    task_ids = assign_content_ids("TASK", keys, existing_keys)
+
+    flat_task_list = [
+        {
+            "taskID": task_id,
+            "useCaseId": uc_id,
+            "personaId": persona_id,
+            "taskDescription": desc
+        }
+        for task_id, (uc_id, persona_id, desc) in zip(task_ids, keys)
+        if task_id not in existing_keys
+    ]
 
     # Group by personaId
     grouped = defaultdict(list)
     for task in flat_task_list:
         grouped[task["personaId"]].append(task)
 
-    # Write to separate JSON files
+    # Append to (or create) separate JSON files
     for persona_id, tasks in grouped.items():
         out_path = task_dir / f"Unique_extracted_tasks_for_{persona_id}.json"
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(tasks, f, indent=2, ensure_ascii=False)
-        print(f"✅ Saved {len(tasks)} tasks for {persona_id} → {out_path.name}")
+        saved = json.loads(out_path.read_text(encoding="utf-8")) if out_path.exists() else []
+        save_json(str(out_path), saved + tasks)
+        print(f"✅ Saved {len(tasks)} new task(s) for {persona_id} → {out_path.name}")
+
+
+def use_case_fingerprint(uc) -> str:
+    """Hash of the use case content tasks are extracted from, so a regenerated use case is extracted again."""
+    return content_hash(uc.name, uc.description, uc.scenario, ",".join(uc.personas or []))
+
+
+def load_processed_use_cases(all_uc: list) -> dict:
+    """Use case ID -> fingerprint of every use case whose tasks were extracted, including those that yielded none."""
+    utils = Utils()
+    if os.path.exists(utils.PROCESSED_USE_CASES_PATH):
+        return load_json(utils.PROCESSED_USE_CASES_PATH)
+
+    # Results from before the record existed: use cases with saved tasks count as extracted
+    extracted_uc_ids = {t.get("useCaseId") for t in load_existing_persona_tasks()}
+    return {uc.id: use_case_fingerprint(uc) for uc in all_uc if uc.id in extracted_uc_ids}
 
 
 def extract_tasks_from_all_use_cases(persona_loader: UserPersonaLoader):
@@ -183,24 +279,27 @@ def extract_tasks_from_all_use_cases(persona_loader: UserPersonaLoader):
 
     os.makedirs(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR, exist_ok=True)
 
-    # Check if we can skip the extraction
-    persona_files = set(f for f in os.listdir(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR) if f.startswith("Unique_extracted_tasks_for_") and f.endswith(".json"))
-    expected_files = {f"Unique_extracted_tasks_for_{pid}.json" for pid in all_personas.keys()}
-    
-    if expected_files.issubset(persona_files) and len(expected_files) == len(all_personas):
+    # Check if we can skip the extraction: every use case was extracted in its current version
+    processed_uc = load_processed_use_cases(all_uc)
+    pending_uc = [uc for uc in all_uc if processed_uc.get(uc.id) != use_case_fingerprint(uc)]
+
+    if not pending_uc:
+        save_json(utils.PROCESSED_USE_CASES_PATH, processed_uc)
         print("⏭️ Skipping task extraction — all tasks already extracted.")
         return
 
-    for uc in all_uc:
+    print(f"🧾 Extracting tasks for {len(pending_uc)} of {len(all_uc)} use case(s)...")
+
+    for uc in pending_uc:
         file_path = os.path.join(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR, f"Extracted_tasks_from_{uc.id}.json")
-        if os.path.exists(file_path):
-            print(f"⏭️ Skipping {uc.id} – already extracted.")
-            continue
 
         extracted = extract_and_save_tasks(uc, all_personas)
         if extracted:
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(extracted, f, indent=2, ensure_ascii=False)
+            save_json(file_path, extracted)
             print(f"✅ Saved → {file_path}")
 
-    reformat_and_save_all_tasks_by_persona()
\ No newline at end of file
+            # Recorded even when the use case yielded no task, so it is not extracted again
+            processed_uc[uc.id] = use_case_fingerprint(uc)
+            save_json(utils.PROCESSED_USE_CASES_PATH, processed_uc)
+
+    reformat_and_save_all_tasks_by_persona()
@@ -1,8 +1,23 @@
 import os
 import json
 
+from typing import List, Optional
+
+from pipeline.similarity import SimilarityIndex
 from pipeline.user_story.user_story_loader import UserStoryLoader
-from pipeline.utils import Utils
+from pipeline.utils import Utils, save_json
+
+
+# Cluster assignments are kept in memory and written back every this many stories (and at the end)
+CLUSTER_CHECKPOINT_INTERVAL = 25
+
+# Local nearest-cluster assignment: a story is assigned without the LLM only when its best cluster
+# scores at least LOCAL_MIN_SCORE and beats the runner-up by LOCAL_MARGIN_RATIO
+LOCAL_MIN_SCORE = 0.2
+LOCAL_MARGIN_RATIO = 1.5
+# Cluster files without `nfus_ids` are enriched with this many of the most similar NFUS summaries
+NFUS_PER_CLUSTER = 3
+
 
 def build_cluster_definition_prompt(system_context: str, story_guidelines: str, technique_text: str, non_functional_stories: list) -> str:
     joined_nf_stories = "\n".join(
@@ -128,14 +143,14 @@ Below is the original list of functional requirement clusters. Each cluster is d
 --- TASK ---
 Please reduce and merge these clusters down to approximately {adjusted_cluster_num} merged clusters. Merge similar or overlapping topics thoughtfully.
 
-Return only a list of cluster names in valid JSON format like:
+Return only a list of cluster names, each with the IDs of the non-functional user stories (`nfus_id`) of the original clusters merged into it, in valid JSON format like:
 [
-  {{"cluster_name": "Cluster A"}},
-  {{"cluster_name": "Cluster B"}},
+  {{"cluster_name": "Cluster A", "nfus_ids": ["US-XXX", "US-YYY"]}},
+  {{"cluster_name": "Cluster B", "nfus_ids": ["US-ZZZ"]}},
   ...
 ]
 
-Strictly return only a JSON array of objects with a `"cluster_name"` field each. Do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
+Strictly return only a JSON array of objects with a `"cluster_name"` and a `"nfus_ids"` field each. Do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
 ------------------------------
 
 --- END OF PROMPT ---
@@ -147,10 +162,7 @@ Strictly return only a JSON array of objects with a `"cluster_name"` field each.
         if not isinstance(reduced_clusters, list) or not all("cluster_name" in c for c in reduced_clusters):
             raise ValueError("Rescaled cluster response is not a valid JSON list of name-only cluster objects")
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(reduced_clusters, f, indent=2, ensure_ascii=False)
+        save_json(output_path, reduced_clusters)
 
         print(f"✅ Rescaled clusters saved to: {output_path} ({len(reduced_clusters)} clusters)")
 
@@ -199,31 +211,55 @@ Strictly, only respond with the exact **cluster name** (or **(Unclustered)** onl
 """.strip()
 
 
-def update_user_story_cluster_by_persona(story_id: str, persona_id: str, new_cluster: str, utils: Utils = None):
-    """Update the cluster of a user story for a specific persona."""
-    filename = f"User_stories_for_{persona_id}.json"
-    filepath = os.path.join(utils.UNIQUE_USER_STORY_DIR_PATH, filename)
+def get_cluster_name(cluster: dict) -> str:
+    return cluster.get('cluster_name') or cluster.get('name')
 
-    if not os.path.exists(filepath):
-        print(f"❌ File not found for persona {persona_id}: {filepath}")
-        return
 
-    with open(filepath, "r", encoding="utf-8") as f:
-        stories = json.load(f)
+def build_functional_cluster_index(cluster_definitions: list, nfus_list: list, functional_stories: list) -> SimilarityIndex:
+    """
+    Index each cluster by its name, the summaries of its source NFUSs, and the functional stories
+    already assigned to it.
+    """
+    nfus_by_id = {s.id: s for s in nfus_list}
+    nfus_index = SimilarityIndex()
+    for s in nfus_list:
+        nfus_index.add(s.id, s.summary or "")
+
+    cluster_index = SimilarityIndex()
+    for cluster in cluster_definitions:
+        name = get_cluster_name(cluster)
+        nfus_ids = [i for i in cluster.get("nfus_ids", []) if i in nfus_by_id]
+        if not nfus_ids:
+            # Older cluster files lost the NFUS link when clusters were merged; use the closest NFUSs
+            nfus_ids = [key for key, _ in nfus_index.query(name, top_k=NFUS_PER_CLUSTER)]
+
+        texts = [name, name]
+        texts += [nfus_by_id[i].summary or "" for i in nfus_ids]
+        texts += [f"{s.title} {s.summary}" for s in functional_stories if s.cluster == name]
+        cluster_index.add(name, " ".join(texts))
+    return cluster_index
 
-    updated = False
-    for story in stories:
-        if story.get("id") == story_id:
-            story["cluster"] = new_cluster
-            updated = True
-            break
 
-    if updated:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(stories, f, indent=2, ensure_ascii=False)
-        print(f"✅ Cluster updated for {story_id} (persona {persona_id}) → {new_cluster}")
-    else:
-        print(f"⚠️ Story {story_id} not found in file for persona {persona_id}")
+def assign_functional_cluster_locally(story, cluster_index: SimilarityIndex) -> Optional[str]:
+    """The best-matching cluster name when it clears the score and margin thresholds, else None."""
+    ranked = cluster_index.query(f"{story.title} {story.summary}", top_k=2)
+    if not ranked:
+        return None
+    best_name, best_score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    if best_score >= LOCAL_MIN_SCORE and best_score >= LOCAL_MARGIN_RATIO * runner_up:
+        return best_name
+    return None
+
+
+def update_user_story_cluster_by_persona(story, new_cluster: str, loader: UserStoryLoader):
+    """Record the cluster of a user story; persona files are flushed at checkpoints."""
+    loader.update_cluster(story, new_cluster)
+    print(f"✅ Cluster updated for {story.id} (persona {story.persona}) → {new_cluster}")
+
+    if loader.pending_updates >= CLUSTER_CHECKPOINT_INTERVAL:
+        written = loader.save_dirty_personas()
+        print(f"💾 Checkpoint: {written} persona file(s) saved.")
 
 
 def cluster_functional_user_stories(user_story_loader: UserStoryLoader = None):
@@ -249,11 +285,21 @@ def cluster_functional_user_stories(user_story_loader: UserStoryLoader = None):
 
     print(f"📊 {len(functional_stories)} functional stories to process...")
 
+    cluster_index = build_functional_cluster_index(cluster_definitions, loader.filter_by_type("Non-Functional"), functional_stories)
+    local_count = 0
+
     for story in functional_stories:
         if story.cluster and story.cluster.strip():
             print(f"   ⏭️ Already clustered: {story.id} → {story.cluster}")
             continue
 
+        cluster_name = assign_functional_cluster_locally(story, cluster_index)
+        if cluster_name:
+            print(f"🧠 Clustered {story.id} ({story.title}) locally")
+            update_user_story_cluster_by_persona(story, cluster_name, loader)
+            local_count += 1
+            continue
+
         print(f"🔍 Clustering {story.id} ({story.title})...")
 
         prompt = build_prompt_to_cluster_functional_user_story(
@@ -268,4 +314,9 @@ def cluster_functional_user_stories(user_story_loader: UserStoryLoader = None):
             print(f"❌ Failed for {story.id}: {e}")
             cluster_name = "(Unclustered)"
 
-        update_user_story_cluster_by_persona(story.id, story.persona, cluster_name, utils)
\ No newline at end of file
+        update_user_story_cluster_by_persona(story, cluster_name, loader)
+
+    print(f"🧠 {local_count} functional stories clustered locally without an LLM call.")
+
+    written = loader.save_dirty_personas()
+    print(f"💾 Cluster assignments saved to {written} persona file(s).")
@@ -1,10 +1,19 @@
-import os
 import json
 
+from collections import defaultdict
+from typing import Dict, List
+
 from pipeline.user_story.user_story_loader import UserStoryLoader
 from pipeline.utils import Utils
 
 
+# Cluster assignments are kept in memory and written back every this many stories (and at the end)
+CLUSTER_CHECKPOINT_INTERVAL = 25
+
+# Number of same-pillar stories assigned to clusters per LLM call
+CLUSTER_BATCH_SIZE = 15
+
+
 def build_prompt_to_cluster_non_functional_user_story(story, system_context, guidelines, clusters):
     """Build a prompt to cluster a non-functional user story."""
     if not clusters:
@@ -55,32 +64,101 @@ Respond only with the exact **name** of the BEST cluster. Do not include any add
     return prompt
 
 
-def update_user_story_cluster_by_persona(story_id: str, persona_id: str, new_cluster: str, utils: Utils = None):
-    """Update the user story in the persona-specific file (User_stories_for_P-XXX.json)."""
-    filename = f"User_stories_for_{persona_id}.json"
-    filepath = os.path.join(utils.UNIQUE_USER_STORY_DIR_PATH, filename)
+def build_prompt_to_cluster_non_functional_user_stories_batch(stories, pillar, system_context, guidelines, clusters):
+    """Build a prompt to cluster several non-functional user stories of the same pillar."""
+    cluster_defs_text = "\n".join(
+        f"- {c['name']}: {c['description']}" for c in clusters
+    )
+    cluster_names_str = ", ".join(c['name'] for c in clusters)
+
+    stories_text = "\n".join(
+        f"- ID: {s.id}\n  Title: {s.title}\n  Summary: {s.summary}\n  User Group: {s.user_group}"
+        for s in stories
+    )
+
+    return f"""
+You are a system requirements engineer. You are doing requirements clustering for non-functional user stories in a software system.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+-------------------------------------
+
+--- USER STORY GUIDELINES ---
+Below is the given system's User Story Guidelines (Definitions, Structure, and Unreal Examples):
+{guidelines}
+-------------------------------------
+
+--- NON-FUNCTIONAL USER STORIES ---
+Now here are REAL Non-Functional User Stories, all under the pillar "{pillar}":
+{stories_text}
+--------------------------------------
+
+--- LIST OF AVAILABLE NON-FUNCTIONAL USER STORY CLUSTERS ---
+Here are the cluster definitions for the pillar:
+{cluster_defs_text}
+-------------------------------------
+
+--- YOUR TASK ---
+For EACH user story above, decide which cluster BEST fits it. Note that every cluster name must be one of the following: {cluster_names_str}.
+-------------------------------------
+
+--- OUTPUT FORMAT ---
+Return a JSON list with exactly one entry per user story ID, e.g.:
+[
+  {{"id": "US-001", "cluster": "(Exact cluster name)"}},
+  ...
+]
+
+Strictly return only the JSON list. Do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
+-------------------------------------
+
+--- END OF PROMPT ---
+""".strip()
+
+
+def match_cluster_name(reply, clusters) -> str:
+    """Map an LLM reply onto the exact name of one of the pillar's clusters (case-insensitive), or '' if none matches."""
+    valid_names = {c['name'].strip().lower(): c['name'] for c in clusters}
+    return valid_names.get(str(reply or "").strip().lower(), "")
+
+
+def cluster_non_functional_user_stories_batch(stories, pillar, system_context, guidelines, clusters, utils: Utils) -> Dict[str, str]:
+    """Assign clusters to a batch of same-pillar stories. Only valid cluster names of the pillar are kept."""
+    prompt = build_prompt_to_cluster_non_functional_user_stories_batch(stories, pillar, system_context, guidelines, clusters)
+    response = utils.get_llm_response(prompt)
+
+    try:
+        assignments = json.loads(response)
+        if not isinstance(assignments, list):
+            raise ValueError("Expected a JSON list of {id, cluster} objects.")
+    except Exception as e:
+        print(f"⚠️ Failed to parse batch clustering for pillar {pillar}: {e}")
+        return {}
+
+    batch_ids = {s.id for s in stories}
+
+    result = {}
+    for item in assignments:
+        if not isinstance(item, dict) or item.get("id") not in batch_ids:
+            continue
+        cluster_name = match_cluster_name(item.get("cluster", ""), clusters)
+        if cluster_name:
+            result[item["id"]] = cluster_name
+        else:
+            print(f"⚠️ {item['id']}: '{item.get('cluster')}' is not a cluster of pillar {pillar}")
+    return result
+
+
+def update_user_story_cluster_by_persona(story, new_cluster: str, loader: UserStoryLoader):
+    """Record the cluster of a user story; persona files are flushed at checkpoints."""
+    loader.update_cluster(story, new_cluster)
+    print(f"✅ Cluster updated for {story.id} (persona {story.persona}) → {new_cluster}")
+
+    if loader.pending_updates >= CLUSTER_CHECKPOINT_INTERVAL:
+        written = loader.save_dirty_personas()
+        print(f"💾 Checkpoint: {written} persona file(s) saved.")
 
-    if not os.path.exists(filepath):
-        print(f"❌ File not found for persona {persona_id}: {filepath}")
-        return
 
-    with open(filepath, "r", encoding="utf-8") as f:
-        stories = json.load(f)
-
-    updated = False
-    for story in stories:
-        if story.get("id") == story_id:
-            story["cluster"] = new_cluster
-            updated = True
-            break
-
-    if updated:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(stories, f, indent=2, ensure_ascii=False)
-        print(f"✅ Cluster updated for {story_id} (persona {persona_id}) → {new_cluster}")
-    else:
-        print(f"⚠️ Story {story_id} not found in file for persona {persona_id}")
-        
 def cluster_non_functional_user_stories(user_story_loader: UserStoryLoader = None):
     """Main callable from main.py to cluster all non-functional user stories."""
     utils = Utils()
@@ -99,16 +177,38 @@ def cluster_non_functional_user_stories(user_story_loader: UserStoryLoader = Non
     system_context = utils.load_system_context()
     story_guidelines = utils.load_user_story_guidelines()
 
+    # Candidate clusters depend only on the pillar, so unclustered stories are grouped by pillar
+    stories_by_pillar: Dict[str, List] = defaultdict(list)
     for story in non_functional_stories:
         if story.cluster and story.cluster.strip():
             print(f"   ⏭️ Already clustered: {story.id} → {story.cluster}")
             continue
+        stories_by_pillar[story.pillar].append(story)
 
-        print(f"🔍 Clustering {story.id} ({story.title})")
-        pillar = story.pillar
+    for pillar, pillar_stories in stories_by_pillar.items():
         clusters = utils.load_non_functional_user_story_clusters_by_each_pillar(pillar)
-        cluster_name = utils.get_llm_response(build_prompt_to_cluster_non_functional_user_story(story, system_context, story_guidelines, clusters)).strip()
-        if cluster_name:
-            update_user_story_cluster_by_persona(story.id, story.persona, cluster_name, utils)
-        else:
-            print(f"⚠️ Skipped {story.id} – no cluster assigned")
+        if not clusters:
+            print(f"⚠️ No cluster summary for pillar: {pillar} – skipped {len(pillar_stories)} stories")
+            continue
+
+        for i in range(0, len(pillar_stories), CLUSTER_BATCH_SIZE):
+            batch = pillar_stories[i:i + CLUSTER_BATCH_SIZE]
+            print(f"🔍 Clustering {len(batch)} stories of pillar {pillar}")
+            assignments = cluster_non_functional_user_stories_batch(batch, pillar, system_context, story_guidelines, clusters, utils)
+
+            for story in batch:
+                cluster_name = assignments.get(story.id)
+                if not cluster_name:
+                    # Missing or invalid in the batch reply – fall back to the single-story prompt
+                    print(f"🔍 Clustering {story.id} ({story.title})")
+                    reply = utils.get_llm_response(build_prompt_to_cluster_non_functional_user_story(story, system_context, story_guidelines, clusters))
+                    cluster_name = match_cluster_name(reply, clusters)
+                    if not cluster_name:
+                        print(f"⚠️ {story.id}: '{(reply or '').strip()}' is not a cluster of pillar {pillar}")
+                if cluster_name:
+                    update_user_story_cluster_by_persona(story, cluster_name, loader)
+                else:
+                    print(f"⚠️ Skipped {story.id} – no cluster assigned")
+
+    written = loader.save_dirty_personas()
+    print(f"💾 Cluster assignments saved to {written} persona file(s).")
@@ -1,79 +1,115 @@
 import os
 import json
-import shutil
 
 from collections import defaultdict
 
 from pipeline.user_story.user_story_loader import UserStory
 from pipeline.utils import (
     UserPersonaLoader,
-    Utils
+    Utils,
+    assign_content_ids,
+    load_json,
+    save_json,
 )
 
 
+def load_existing_user_story_keys() -> dict:
+    """Map every user story ID saved so far (kept or removed as duplicate) to its (use case, persona, task) key."""
+    utils = Utils()
+
+    existing = {}
+    for directory in (utils.UNIQUE_USER_STORY_DIR_PATH, utils.DUPLICATED_USER_STORY_DIR_PATH):
+        if not os.path.exists(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                    for story in json.load(f):
+                        existing[story["id"]] = (story["use_case"], story["persona"], story["task"])
+            except Exception as e:
+                print(f"⚠️ Failed to read existing user stories from {filename}: {e}")
+    return existing
+
+
 def extract_skeleton_user_stories(persona_loader: UserPersonaLoader):
     utils = Utils()
     
     # Step 1: Load persona map
     all_personas = {p.id: p for p in persona_loader.get_personas()}
 
-    # Step 1.1: Check if story files already exist and match expected count
-    if os.path.exists(utils.UNIQUE_USER_STORY_DIR_PATH):
-        existing_files = set(os.listdir(utils.UNIQUE_USER_STORY_DIR_PATH))
-        expected_files = {f"User_stories_for_{pid}.json" for pid in all_personas}
-        
-        if expected_files.issubset(existing_files) and len(expected_files) == len(all_personas):
-            print("✅ All skeleton user story files already exist. Skipping extraction.")
-            return
-    
-    # Step 2: Clean user story directory
-    if os.path.exists(utils.UNIQUE_USER_STORY_DIR_PATH):
-        shutil.rmtree(utils.UNIQUE_USER_STORY_DIR_PATH)
+    # Step 1.1: Load the stories that already exist, so only new tasks get a skeleton
     os.makedirs(utils.UNIQUE_USER_STORY_DIR_PATH, exist_ok=True)
+    existing_keys = load_existing_user_story_keys()
 
-    # Step 3: Process extracted task files
-    grouped_stories = defaultdict(list)
-    uid_counter = 1
-
-    for filename in os.listdir(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR):
+    # Step 2: Collect tasks from the extracted task files
+    task_objs = []
+    for filename in sorted(os.listdir(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR)):
         if not filename.startswith("Unique_extracted_tasks_for_") or not filename.endswith(".json"):
             continue
 
         file_path = os.path.join(utils.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR, filename)
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                task_list = json.load(f)
+                task_objs.extend(json.load(f))
         except Exception as e:
             print(f"❌ Failed to load {filename}: {e}")
             continue
 
-        for task_obj in task_list:
-            persona_id = task_obj["personaId"]
-            uc_id = task_obj["useCaseId"]
-            task = task_obj["taskDescription"]
-
-            user_group = all_personas[persona_id].user_group if persona_id in all_personas else "Unknown"
-
-            story = UserStory(
-                id=f"US-{uid_counter:03}",
-                title="",
-                persona=persona_id,
-                user_group=user_group,
-                use_case=uc_id,
-                priority=None,
-                summary="",
-                type="",
-                cluster=None,
-                pillar=None,
-                task=task
-            )
-            grouped_stories[persona_id].append(story)
-            uid_counter += 1
-
-    # Step 4: Write grouped user stories per persona
+    # Step 3: Story IDs are derived from (use case, persona, task) like task IDs, so existing stories keep theirs
+    keys = [(t["useCaseId"], t["personaId"], t["taskDescription"]) for t in task_objs]
+    story_ids = assign_content_ids("US", keys, existing_keys)
+
+    # Tasks that already went through skeleton extraction are skipped, even when their story was dropped since
+    if os.path.exists(utils.SKELETON_EXTRACTED_TASK_IDS_PATH):
+        extracted_task_ids = set(load_json(utils.SKELETON_EXTRACTED_TASK_IDS_PATH))
+    else:
+        # Results from before the record existed: tasks with a story, or of a use case that produced stories
+        processed_use_cases = {uc_id for uc_id, _, _ in existing_keys.values()}
+        extracted_task_ids = {
+            t["taskID"] for t, story_id in zip(task_objs, story_ids)
+            if story_id in existing_keys or t["useCaseId"] in processed_use_cases
+        }
+
+    grouped_stories = defaultdict(list)
+    for task, story_id, (uc_id, persona_id, task_text) in zip(task_objs, story_ids, keys):
+        if task["taskID"] in extracted_task_ids or story_id in existing_keys:
+            continue
+
+        user_group = all_personas[persona_id].user_group if persona_id in all_personas else "Unknown"
+
+        story = UserStory(
+            id=story_id,
+            title="",
+            persona=persona_id,
+            user_group=user_group,
+            use_case=uc_id,
+            priority=None,
+            summary="",
+            type="",
+            cluster=None,
+            pillar=None,
+            task=task_text
+        )
+        grouped_stories[persona_id].append(story)
+
+    extracted_task_ids.update(t["taskID"] for t in task_objs)
+
+    if not grouped_stories:
+        save_json(utils.SKELETON_EXTRACTED_TASK_IDS_PATH, sorted(extracted_task_ids))
+        print("✅ All skeleton user stories already exist. Skipping extraction.")
+        return
+
+    # Step 4: Append new skeletons to each persona's user story file
     for persona_id, stories in grouped_stories.items():
         file_path = os.path.join(utils.UNIQUE_USER_STORY_DIR_PATH, f"User_stories_for_{persona_id}.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump([s.to_dict() for s in stories], f, indent=2, ensure_ascii=False)
+        saved = []
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        save_json(file_path, saved + [s.to_dict() for s in stories])
+    save_json(utils.SKELETON_EXTRACTED_TASK_IDS_PATH, sorted(extracted_task_ids))
 
-    print(f"✅ Extracted and saved user stories for {len(grouped_stories)} persona(s).")
+    new_count = sum(len(stories) for stories in grouped_stories.values())
+    print(f"✅ Extracted and saved {new_count} new skeleton user stories for {len(grouped_stories)} persona(s).")
@@ -3,13 +3,22 @@ import json
 
 from collections import defaultdict
 from pathlib import Path
+from typing import List
 
+from pipeline.similarity import bounded_groups, cosine_similarity_matrix
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    save_json,
 )
 
 
+# Stories of one persona and cluster at or above this summary similarity are reviewed together by the LLM
+CANDIDATE_THRESHOLD = 0.2
+# Upper bound on the number of stories sent to the LLM in one prompt
+MAX_CANDIDATE_GROUP_SIZE = 8
+
+
 def build_batch_dedup_prompt(system_context: str, user_stories: list) -> str:
     examples = [
         {"id": story["id"], "summary": story["summary"]}
@@ -46,6 +55,19 @@ Return ONLY the list like the above example. Do not include any explanation, com
 """.strip()
 
 
+def find_candidate_duplicate_groups(stories: list) -> List[list]:
+    """Groups of stories whose summaries look alike; stories without a close neighbour are left out."""
+    summarized = [s for s in stories if s.get("summary")]
+    if len(summarized) <= 1:
+        return []
+
+    similarity = cosine_similarity_matrix([s["summary"] for s in summarized])
+    return [
+        [summarized[i] for i in group]
+        for group in bounded_groups(similarity, CANDIDATE_THRESHOLD, MAX_CANDIDATE_GROUP_SIZE)
+    ]
+
+
 def deduplicate_user_stories_for_each_persona(persona_loader: UserPersonaLoader):
     utils = Utils()
     
@@ -103,29 +125,37 @@ def deduplicate_user_stories_for_each_persona(persona_loader: UserPersonaLoader)
             if len(cluster_stories) <= 1:
                 continue
 
-            print(f"🔎 Checking {len(cluster_stories)} stories in cluster '{cluster}'")
-            prompt = build_batch_dedup_prompt(system_context, cluster_stories)
-            response = utils.get_llm_response(prompt)
+            # Only groups of look-alike summaries are worth an LLM call
+            candidate_groups = find_candidate_duplicate_groups(cluster_stories)
+            if not candidate_groups:
+                print(f"⏭️ No candidate duplicates among {len(cluster_stories)} stories in cluster '{cluster}'")
+                continue
 
-            try:
-                result = json.loads(response)
-                if isinstance(result, list):
-                    to_remove_ids.extend(result)
-                else:
-                    print(f"⚠️ Expected a list in cluster '{cluster}', got: {type(result)}")
-            except Exception as e:
-                print(f"⚠️ Failed to parse LLM response for cluster '{cluster}': {e}")
+            for group in candidate_groups:
+                print(f"🔎 Checking {len(group)} of {len(cluster_stories)} stories in cluster '{cluster}'")
+                prompt = build_batch_dedup_prompt(system_context, group)
+                response = utils.get_llm_response(prompt)
+
+                try:
+                    result = json.loads(response)
+                    if isinstance(result, list):
+                        group_ids = {story["id"] for story in group}
+                        to_remove_ids.extend(sid for sid in result if sid in group_ids)
+                    else:
+                        print(f"⚠️ Expected a list in cluster '{cluster}', got: {type(result)}")
+                except Exception as e:
+                    print(f"⚠️ Failed to parse LLM response for cluster '{cluster}': {e}")
 
         deduplicated = [s for s in stories if s["id"] not in to_remove_ids]
         duplicates = [s for s in stories if s["id"] in to_remove_ids]
 
-        file_path.write_text(json.dumps(deduplicated, indent=2, ensure_ascii=False), encoding="utf-8")
+        save_json(str(file_path), deduplicated)
         print(f"✅ Removed {len(duplicates)} duplicates → {file_path.name}")
 
         # Save invalids to a separate file
         if duplicates:
             invalid_file = invalid_dir / f"Duplicated_user_stories_for_{persona_id}.json"
-            invalid_file.write_text(json.dumps(duplicates, indent=2, ensure_ascii=False), encoding="utf-8")
+            save_json(str(invalid_file), duplicates)
             print(f"📁 Moved invalid user stories → {invalid_file.name}")
 
     print("🎉 Cluster-based user story deduplication complete.\n")
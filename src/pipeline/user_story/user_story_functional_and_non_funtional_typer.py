@@ -2,9 +2,33 @@ import os
 import json
 
 from pathlib import Path
+from typing import Dict, List, Tuple
 
+import numpy as np
+
+from pipeline.similarity import TextClassifier
 from pipeline.user_story.user_story_loader import UserStory, UserStoryLoader
-from pipeline.utils import Utils
+from pipeline.utils import Utils, content_hash, load_json, save_json
+
+
+# Number of user story summaries classified per LLM call
+TYPE_BATCH_SIZE = 20
+
+VALID_TYPES = {"functional": "Functional", "non-functional": "Non-Functional"}
+
+# Recorded in each story's `typeSource`: labels the local classifier wrote are never trained on
+LLM_TYPE_SOURCE = "llm"
+LOCAL_TYPE_SOURCE = "local"
+
+# Local fast-path classifier: trained on stored LLM labels, used only when confident
+MIN_TRAINING_STORIES = 50
+MIN_TRAINING_STORIES_PER_TYPE = 10
+LOCAL_CONFIDENCE = 0.9
+AGREEMENT_FOLDS = 5
+
+# Held-out agreement of the last training corpus, kept in the system's results folder so the k-fold
+# estimate only reruns when the stored labels change
+AGREEMENT_CACHE_FILENAME = "local_type_classifier_agreement.json"
 
 
 def build_classification_prompt(system_context: str, user_story_summary: str, user_story: UserStory) -> str:
@@ -48,7 +72,161 @@ def classify_user_story_type(story: UserStory, system_context: str, user_story_s
         
     return "Unknown"
 
-def update_user_stories_with_type():
+
+def build_batch_classification_prompt(system_context: str, user_story_summary: str, stories: List[UserStory]) -> str:
+    story_lines = "\n".join(f"- {s.id}: {s.summary}" for s in stories)
+    return f"""You are a Requirement Engineer, who specializes in Identifying Functional/Non-Functional requirement(s).
+
+Below are relevant summaries and a list of user stories.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+-------------------------------------
+
+--- USER STORY GUIDELINES ---
+## The given system's User Story Guidelines
+{user_story_summary}
+-------------------------------------
+
+--- USER STORIES ---
+## Target User Stories (ID: Summary)
+{story_lines}
+-------------------------------------
+
+--- YOUR TASK ---
+Please classify EACH user story above as either "Functional" or "Non-Functional". Focus on the *summary* of each story to guide your decision; classify every story independently.
+-------------------------------------
+
+--- OUTPUT FORMAT ---
+Return a single JSON object with exactly one entry per user story ID listed above, mapping the ID to one of the two options, e.g.:
+{{
+  "US-001": "Functional",
+  "US-002": "Non-Functional"
+}}
+
+Strictly, do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
+--------------------------------------
+
+--- END OF PROMPT ---
+""".strip()
+
+
+def classify_user_story_types_batch(stories: List[UserStory], system_context: str, user_story_summary: str, utils: Utils) -> Dict[str, str]:
+    """Classify a batch of stories in one call. Only IDs from the batch with a valid type are returned."""
+    prompt = build_batch_classification_prompt(system_context, user_story_summary, stories)
+    response = utils.get_llm_response(prompt)
+
+    try:
+        labels = json.loads(response)
+        if not isinstance(labels, dict):
+            raise ValueError("Expected a JSON object keyed by user story ID.")
+    except Exception as e:
+        print(f"⚠️ Batch classification parsing failed for {len(stories)} stories: {e}")
+        return {}
+
+    batch_ids = {s.id for s in stories}
+    return {
+        story_id: VALID_TYPES[str(label).strip().lower()]
+        for story_id, label in labels.items()
+        if story_id in batch_ids and str(label).strip().lower() in VALID_TYPES
+    }
+
+
+def is_typed(story: UserStory) -> bool:
+    return bool(story.type and story.type.strip()) and story.type != "Unknown"
+
+
+def system_results_dir(utils: Utils) -> str:
+    return os.path.join(utils.RESULTS_DIR, utils.SYSTEM_NAME)
+
+
+def load_labelled_summaries(utils: Utils) -> Tuple[List[str], np.ndarray]:
+    """
+    LLM-typed summaries stored by every run of the current system; True means Non-Functional.
+    Labels written by the local classifier are left out so it never learns from its own output
+    (stories without a `typeSource` predate the local classifier and count as LLM labels).
+    """
+    story_dir_name = os.path.basename(utils.UNIQUE_USER_STORY_DIR_PATH)
+    labels = {}
+    for file_path in sorted(Path(system_results_dir(utils)).glob(f"**/{story_dir_name}/User_stories_for_*.json")):
+        try:
+            stories = json.loads(file_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"⚠️ Skipping unreadable story file {file_path}: {e}")
+            continue
+        for story in stories:
+            summary, story_type = story.get("summary"), story.get("type")
+            if story.get("typeSource") == LOCAL_TYPE_SOURCE:
+                continue
+            if summary and story_type in VALID_TYPES.values():
+                labels[summary.strip()] = story_type == "Non-Functional"
+
+    summaries = list(labels)
+    return summaries, np.array([labels[s] for s in summaries], dtype=bool)
+
+
+def is_confident(probabilities: np.ndarray) -> np.ndarray:
+    return (probabilities >= LOCAL_CONFIDENCE) | (probabilities <= 1 - LOCAL_CONFIDENCE)
+
+
+def estimate_local_agreement(summaries: List[str], labels: np.ndarray) -> Tuple[float, float]:
+    """Held-out (k-fold) agreement of confident local predictions with stored LLM labels, and their coverage."""
+    order = np.random.default_rng(42).permutation(len(summaries))
+    probabilities = np.zeros(len(summaries), dtype=np.float32)
+    for fold in np.array_split(order, AGREEMENT_FOLDS):
+        train = np.setdiff1d(order, fold)
+        classifier = TextClassifier().fit([summaries[i] for i in train], labels[train])
+        probabilities[fold] = classifier.predict_proba([summaries[i] for i in fold])
+
+    confident = is_confident(probabilities)
+    if not confident.any():
+        return 0.0, 0.0
+    agreement = float(((probabilities[confident] >= 0.5) == labels[confident]).mean())
+    return agreement, float(confident.mean())
+
+
+def cached_local_agreement(summaries: List[str], labels: np.ndarray, utils: Utils) -> Tuple[float, float]:
+    """estimate_local_agreement, reused from the cache file while the training corpus is unchanged."""
+    corpus = content_hash(*(f"{int(label)}{summary}" for summary, label in zip(summaries, labels)), length=16)
+    cache_path = os.path.join(system_results_dir(utils), AGREEMENT_CACHE_FILENAME)
+    if os.path.exists(cache_path):
+        cached = load_json(cache_path)
+        if cached.get("corpus") == corpus:
+            return cached["agreement"], cached["coverage"]
+
+    agreement, coverage = estimate_local_agreement(summaries, labels)
+    save_json(cache_path, {"corpus": corpus, "agreement": agreement, "coverage": coverage})
+    return agreement, coverage
+
+
+def classify_locally(stories: List[UserStory], utils: Utils) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Predict types with the local classifier. Returns the confident labels (accepted as-is) and the
+    low-confidence guesses (kept only to report agreement with the LLM).
+    """
+    summaries, labels = load_labelled_summaries(utils)
+    n_non_functional = int(labels.sum())
+    if len(summaries) < MIN_TRAINING_STORIES or min(n_non_functional, len(labels) - n_non_functional) < MIN_TRAINING_STORIES_PER_TYPE:
+        print(f"ℹ️ Local classifier disabled: only {len(summaries)} stored LLM labels ({n_non_functional} Non-Functional).")
+        return {}, {}
+
+    agreement, coverage = cached_local_agreement(summaries, labels, utils)
+    print(f"🧠 Local classifier trained on {len(summaries)} stored LLM labels – held-out agreement {agreement:.0%} on the {coverage:.0%} it is confident about.")
+
+    classifier = TextClassifier().fit(summaries, labels)
+    probabilities = classifier.predict_proba([s.summary or "" for s in stories])
+
+    confident, guesses = {}, {}
+    for story, probability, sure in zip(stories, probabilities, is_confident(probabilities)):
+        story_type = "Non-Functional" if probability >= 0.5 else "Functional"
+        (confident if sure else guesses)[story.id] = story_type
+    return confident, guesses
+
+def update_user_stories_with_type(use_local_classifier: bool = True):
+    """
+    Type every untyped user story as Functional or Non-Functional. With `use_local_classifier`,
+    confident predictions of a classifier trained on stored LLM labels are accepted without an LLM call.
+    """
     utils = Utils()
 
     system_context = utils.load_system_context()
@@ -60,24 +238,42 @@ def update_user_stories_with_type():
     all_stories = loader.get_all()
     
     # Step Skipping Logic
+    untyped_stories = [story for story in all_stories if not is_typed(story)]
     persona_ids = set(story.persona for story in all_stories)
-    complete_personas = {
-        pid for pid in persona_ids
-        if all(story.type and story.type.strip() for story in loader.get_by_persona(pid))
-    }
 
-    if complete_personas == persona_ids:
+    if not untyped_stories:
         print(f"⏭️ Skipping classification: All user stories for {len(persona_ids)} personas are already typed.")
         return
 
+    # Fast path: accept confident local predictions
+    local_types, local_guesses = classify_locally(untyped_stories, utils) if use_local_classifier else ({}, {})
+    for story in untyped_stories:
+        if story.id in local_types:
+            loader.update_type(story, local_types[story.id], LOCAL_TYPE_SOURCE)
+            print(f"   ➤ {story.title[:40]}... → {story.type} (local)")
+
+    llm_stories = [story for story in untyped_stories if story.id not in local_types]
+
     # Process only stories that are not classified
-    print(f"🔍 Classifying {len(all_stories)} user stories by type...")
+    print(f"🔍 Classifying {len(llm_stories)} of {len(all_stories)} user stories by type with LLM ({TYPE_BATCH_SIZE} per call)...")
+
+    for i in range(0, len(llm_stories), TYPE_BATCH_SIZE):
+        batch = llm_stories[i:i + TYPE_BATCH_SIZE]
+        labels = classify_user_story_types_batch(batch, system_context, user_story_summary, utils)
+
+        for story in batch:
+            story_type = labels.get(story.id)
+            if story_type is None:
+                # Missing or invalid in the batch reply – fall back to a single-story call
+                story_type = classify_user_story_type(story, system_context, user_story_summary, utils)
+            loader.update_type(story, story_type, LLM_TYPE_SOURCE)
+            print(f"   ➤ {story.title[:40]}... → {story_type}")
 
-    for story in all_stories:
-        story_type = classify_user_story_type(story, system_context, user_story_summary, utils)
-        story.type = story_type
-        print(f"   ➤ {story.title[:40]}... → {story_type}")
+    compared = [s for s in llm_stories if s.id in local_guesses and s.type in VALID_TYPES.values()]
+    if compared:
+        agreed = sum(local_guesses[s.id] == s.type for s in compared)
+        print(f"📊 Local classifier agreed with the LLM on {agreed}/{len(compared)} low-confidence stories ({agreed / len(compared):.0%}).")
 
     # Save updated user stories grouped by persona
-    loader.save_all_user_stories_by_persona()
-    print("✅ All user stories updated and saved with 'type' field.")
\ No newline at end of file
+    loader.save_dirty_personas()
+    print("✅ All user stories updated and saved with 'type' field.")
@@ -1,89 +1,44 @@
 import os
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 from pathlib import Path
+from typing import List
 
-from pipeline.user_story.user_story_loader import UserStoryLoader
+from pipeline.similarity import SimilarityIndex
+from pipeline.user_story.user_story_loader import UserStory, UserStoryLoader
 from pipeline.use_case.use_case_loader import UseCaseLoader
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    save_json,
 )
 
-def generate_complete_user_stories(persona_loader: UserPersonaLoader, use_case_loader: UseCaseLoader):
-    utils = Utils()
 
-    # Load personas
-    all_personas = {p.id: p for p in persona_loader.get_personas()}
-    
-    # Step Skipping Logic – check if all stories are fully generated
-    loader = UserStoryLoader()
-    loader.load_all_user_stories()
-    all_stories = loader.get_all()
+# Personas are independent of each other, so each one gets its own sequential lane
+MAX_PERSONA_LANES = 6
 
-    # Check if all user stories for each persona are complete
-    persona_ids = set(p.id for p in all_personas.values())
-    complete_personas = {
-        pid for pid in persona_ids
-        if all(
-            story.title and story.summary and story.priority is not None and story.pillar
-            for story in loader.get_by_persona(pid)
-        )
-    }
+# Previous summaries shown per prompt: only the ones most similar to the raw task, plus a theme digest
+PREVIOUS_SUMMARY_TOP_K = 8
+COVERED_THEME_COUNT = 12
 
-    if complete_personas == persona_ids:
-        print(f"⏭️ Skipping generation: All user stories for {len(persona_ids)} personas are complete (title, summary, priority, and pillar filled).")
-        return
-    
-    # Load invalid user story directory
-    invalid_dir = Path(utils.DUPLICATED_USER_STORY_DIR_PATH)
-    invalid_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Load use cases
-    use_case_loader.load()
-    all_use_cases = {uc.id: uc for uc in use_case_loader.get_all()}
-    
-    # Load supporting documents
-    system_summary = utils.load_system_context()
-    story_guidelines = utils.load_user_story_guidelines()
+# A generated summary this similar to an earlier one of the same persona counts as a duplicate
+DUPLICATE_SUMMARY_THRESHOLD = 0.9
+# Consecutive empty/duplicate outcomes after which a persona is treated as exhausted (0 disables
+# exhaustion detection, including the duplicate-summary discard)
+EXHAUSTION_THRESHOLD = 3
 
-    # Reload to ensure clean state
-    loader = UserStoryLoader()
-    loader.load_all_user_stories()
+# Outcomes of completing one story
+STORY_CREATED = "created"
+STORY_EMPTY = "empty"
+STORY_DUPLICATE = "duplicate"
+STORY_FAILED = "failed"
 
-    # Filter incomplete stories
-    incomplete_stories = [
-        story for story in loader.get_all()
-        if not story.title or not story.summary or story.priority is None or not story.pillar
-    ]
 
-    print(f"🛠️ Generating {len(incomplete_stories)} user stories with LLM...")
-    
-    # Load user group keys
-    user_group_keys = utils.load_user_group_keys()
-    
-    # Load LLM response language proficiency level
-    proficiency_level = utils.load_llm_response_language_proficiency_level()
-
-    # Generate user stories' titles and summaries using LLM
-    for story in incomplete_stories:
-        persona = all_personas.get(story.persona)
-        use_case = all_use_cases.get(story.use_case)
-        group_key = user_group_keys.get(persona.user_group)
-        group_summary = utils.load_user_group_description(group_key) if group_key else "Unknown"
-
-        if not persona or not use_case:
-            print(f"⚠️ Skipping US {story.id} (missing persona or use case)")
-            continue
-        
-        previous_summaries = [
-            s.summary for s in loader.get_by_persona(story.persona)
-            if s.summary and s.id != story.id
-        ]
-        
-        prev_summary_text = "\n".join(f"- {s}" for s in previous_summaries) if previous_summaries else "(None yet)"
-
-        prompt = f"""
+def build_user_story_prompt(story: UserStory, persona, use_case, group_summary: str, prev_summary_text: str,
+                            system_summary: str, story_guidelines: str, proficiency_level: str) -> str:
+    return f"""
 You are a Requirement Engineer, helping define detailed user stories for a system mentioned below. Below is the system overview, user story schema, user group needs, persona, related use case, and the raw task that **probably** inspired the user story.
 
 --- SYSTEM OVERVIEW ---
@@ -163,41 +118,361 @@ Strictly, do not include any additional text or commentary. Do NOT use any markd
 --- END OF PROMPT ---
 """
 
-        try:
-            response = utils.get_llm_response(prompt)
-            json_data = json.loads(response)
-
-            title = json_data.get("title", "")
-            summary = json_data.get("summary", "")
-            priority = json_data.get("priority")
-            pillar = json_data.get("pillar")
-
-            if not summary or str(summary).strip().lower() in ["", "none", "null"]:
-                raise ValueError("Summary is missing or empty")
-
-            story.title = title
-            story.summary = summary
-            story.priority = priority
-            story.pillar = pillar
-
-            print(f"✅ Story {story.id} created: {title} → {summary[:40]}...")
-
-        except Exception as e:
-            # Move invalid story to invalid folder
-            # invalid_file = invalid_dir / f"Invalid_user_stories_for_{story.persona}.json"
-            # try:
-            #     existing = []
-            #     if invalid_file.exists():
-            #         with open(invalid_file, "r", encoding="utf-8") as f:
-            #             existing = json.load(f)
-            #     existing.append(story.to_dict())
-            #     with open(invalid_file, "w", encoding="utf-8") as f:
-            #         json.dump(existing, f, indent=2, ensure_ascii=False)
-            #     print(f"❌ Moved invalid story {story.id} → {invalid_file.name} (Reason: {str(e)})")
-            # except Exception as write_err:
-            print(f"❌ Failed to save invalid story {story.id}: {e}")
-
-    # Save updated stories back to their respective files
-    loader.save_all_user_stories_by_persona()
-
-    print(f"✅ Finished updating {len(incomplete_stories)} user stories.")
\ No newline at end of file
+
+def build_batch_user_story_prompt(stories: List[UserStory], persona, use_case, group_summary: str, prev_summary_text: str,
+                                  system_summary: str, story_guidelines: str, proficiency_level: str) -> str:
+    """Same context as build_user_story_prompt, sent once for several skeletons of one persona and use case."""
+    raw_tasks = "\n".join(f"- {s.id}: {s.task}" for s in stories)
+    example_ids = ", ".join(f'"{s.id}"' for s in stories[:2])
+
+    return f"""
+You are a Requirement Engineer, helping define detailed user stories for a system mentioned below. Below is the system overview, user story schema, user group needs, persona, related use case, and the raw tasks that **probably** inspired the user stories.
+
+--- SYSTEM OVERVIEW ---
+{system_summary}
+-------------------------------------------------------------
+
+--- USER STORY GUIDELINES ---
+{story_guidelines}
+-------------------------------------------------------------
+
+--- USER GROUP CONTEXT ({persona.user_group}) ---
+{group_summary}
+-------------------------------------------------------------
+
+--- PERSONA DETAIL (ID: {persona.id}) ---
+{persona.to_prompt_string()}
+-------------------------------------------------------------
+
+--- USE CASE DETAIL (ID: {use_case.id}
+Description: {use_case.description}
+Scenario: {use_case.scenario}
+-------------------------------------------------------------
+
+--- RAW TASKS (Inspiration, one per user story ID) ---
+{raw_tasks}
+-------------------------------------------------------------
+
+--- PREVIOUS SUMMARIES FOR THIS PERSONA ---
+{prev_summary_text}
+-------------------------------------------------------------
+
+--- YOUR JOB ---
+📌 Based on this information, generate one structured JSON user story for EACH user story ID above, inspired by its raw task. Each can focus on either:
+→ A functional intent (user’s goal, command, or system response)  
+→ Or a system quality (privacy, simplicity, autonomy, responsiveness, personalization, etc.)
+
+Generate the following fields for each user story:
+- title
+- summary
+- priority (1 to 5)
+- pillar (choose the most relevant system's pillar mentioned in the system summary among the provided in the relevant use case.")
+-------------------------------------------------------------
+
+--- INSTRUCTION ---
+Your job is to generate complete user stories that reflect either:
+- Behavioral (or functional) goals (e.g., what the user wants the system to do), or
+- Quality/constraint-focused (or Non-Functional) goals (e.g., how the system should behave, qualities like performance, privacy, usability, ...).
+(However, for this round, you will not classify them as functional or non-functional, or put these terms directly in the story)
+
+However:
+- You must NOT reuse the ideas already used in this persona’s previous user stories (listed above), nor repeat an idea across the user stories you write in this response.
+- If all of the persona’s information (e.g., goals, characteristics, challenges, singularities, main actions) has already been exhausted and you cannot write a new, meaningful story for an ID, return only an empty string ("") for that story's `summary` field.
+
+Additionally:
+- Only explore one, or (hardly) two, distinct ideas from the persona’s characteristics when generating each summary.
+- You should still prioritize the persona’s perspective over consistency with system behavior.
+
+Again, strictly, each new user story (especially the summary) must be strongly shaped by the given persona's information (e.g., unique needs, expectations, goals, characteristics, habits, concerns, ...) — even if this leads to inconsistencies with the use case or system description.
+That is, the user stories should be **persona-centric** and do not make them too "rational-based-on-the-system" or system-centric.
+--------------------------------------------------------------
+
+--- OUTPUT FORMAT ---
+You must return a single JSON object keyed by user story ID, with exactly one entry per ID listed in the raw tasks ({example_ids}, ...):
+
+{{
+  "US-XXX": {{
+    "title": "(User Story Title)",
+    "summary": ""As a [user role, not name], I want to [do something specific] (, so that I can [achieve a goal or handle a concern].)", # "so that ..." is hardly optional
+    "priority": 3, # 1 (Lowest) to 5 (Highest)
+    "pillar": "(Associated Pillar)"
+  }},
+  ...
+}}
+
+Strictly, do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
+------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+"""
+
+
+def build_summary_index(persona_stories: List[UserStory]) -> SimilarityIndex:
+    """Index the summaries already written for one persona."""
+    index = SimilarityIndex()
+    for s in persona_stories:
+        if s.summary:
+            index.add(s.id, s.summary)
+    return index
+
+
+def build_previous_summary_context(stories: List[UserStory], summary_index: SimilarityIndex, system_name: str) -> str:
+    """
+    The previous summaries most similar to the stories' raw tasks, plus a digest of the themes the
+    persona's stories already cover. The size stays bounded however many stories the persona has.
+    """
+    if not len(summary_index):
+        return "(None yet)"
+
+    query = "\n".join(s.task for s in stories)
+    similar = summary_index.query(query, top_k=PREVIOUS_SUMMARY_TOP_K, exclude=[s.id for s in stories])
+    lines = [f"Most related of the {len(summary_index)} previous summaries:"]
+    lines += [f"- {summary_index.get_text(key)}" for key, _ in similar]
+
+    themes = summary_index.common_terms(n=COVERED_THEME_COUNT, ignore=[system_name])
+    if themes:
+        lines.append(f"Themes already covered by this persona's stories: {', '.join(themes)}")
+
+    return "\n".join(lines)
+
+
+def apply_user_story_fields(story: UserStory, json_data: dict) -> str:
+    """Fill title, summary, priority and pillar of one story from its LLM JSON. Returns the outcome."""
+    try:
+        title = json_data.get("title", "")
+        summary = json_data.get("summary", "")
+        priority = json_data.get("priority")
+        pillar = json_data.get("pillar")
+
+        if not summary or str(summary).strip().lower() in ["", "none", "null"]:
+            # The prompt asks for an empty summary once the persona's traits are exhausted
+            print(f"⚠️ Story {story.id}: empty summary returned (persona may be exhausted)")
+            return STORY_EMPTY
+
+        story.title = title
+        story.summary = summary
+        story.priority = priority
+        story.pillar = pillar
+
+        print(f"✅ Story {story.id} created: {title} → {summary[:40]}...")
+        return STORY_CREATED
+
+    except Exception as e:
+        print(f"❌ Failed to save invalid story {story.id}: {e}")
+        return STORY_FAILED
+
+
+def complete_user_story(utils: Utils, story: UserStory, prompt: str) -> str:
+    try:
+        json_data = json.loads(utils.get_llm_response(prompt))
+    except Exception as e:
+        print(f"❌ Failed to save invalid story {story.id}: {e}")
+        return STORY_FAILED
+    return apply_user_story_fields(story, json_data)
+
+
+def complete_user_story_batch(utils: Utils, stories: List[UserStory], prompt: str) -> List[str]:
+    """Complete several stories from one structured response keyed by story ID."""
+    try:
+        json_data = json.loads(utils.get_llm_response(prompt))
+        if not isinstance(json_data, dict):
+            raise ValueError("Expected a JSON object keyed by user story ID.")
+    except Exception as e:
+        print(f"❌ Failed to parse batch response for {', '.join(s.id for s in stories)}: {e}")
+        return [STORY_FAILED] * len(stories)
+
+    results = []
+    for story in stories:
+        fields = json_data.get(story.id)
+        if not isinstance(fields, dict):
+            print(f"❌ Failed to save invalid story {story.id}: missing from batch response")
+            results.append(STORY_FAILED)
+            continue
+        results.append(apply_user_story_fields(story, fields))
+    return results
+
+
+def batch_stories_by_use_case(stories: List[UserStory], batch_size: int) -> List[List[UserStory]]:
+    """Split a persona's stories, in order, into runs of at most `batch_size` that share one use case."""
+    batches: List[List[UserStory]] = []
+    for story in stories:
+        if batches and len(batches[-1]) < batch_size and batches[-1][0].use_case == story.use_case:
+            batches[-1].append(story)
+        else:
+            batches.append([story])
+    return batches
+
+
+def is_duplicate_summary(story: UserStory, summary_index: SimilarityIndex) -> bool:
+    closest = summary_index.query(story.summary, top_k=1, exclude=[story.id])
+    return bool(closest) and closest[0][1] >= DUPLICATE_SUMMARY_THRESHOLD
+
+
+def clear_generated_fields(story: UserStory):
+    story.title = ""
+    story.summary = ""
+    story.priority = None
+    story.pillar = None
+
+
+def save_skipped_user_stories(skipped_dir: Path, persona_id: str, stories: List[UserStory]):
+    """Append skeletons left over once a persona is exhausted, so later runs do not retry them."""
+    skipped_file = skipped_dir / f"Skipped_user_stories_for_{persona_id}.json"
+    existing = json.loads(skipped_file.read_text(encoding="utf-8")) if skipped_file.exists() else []
+    existing.extend(s.to_dict() for s in stories)
+    save_json(str(skipped_file), existing)
+    print(f"⏭️ {persona_id}: {len(stories)} leftover skeleton(s) marked as skipped → {skipped_file.name}")
+
+
+def generate_user_stories_for_persona(utils: Utils, persona_id: str, stories: List[UserStory], loader: UserStoryLoader,
+                                      persona, use_case_loader: UseCaseLoader, group_summary: str,
+                                      system_summary: str, story_guidelines: str, proficiency_level: str,
+                                      batch_size: int = 1, exhaustion_threshold: int = EXHAUSTION_THRESHOLD) -> int:
+    """
+    One persona's lane: its stories are completed in order, because each prompt lists the summaries
+    written before it. With `batch_size` > 1, up to that many skeletons sharing a use case are
+    completed per call. A summary repeating an earlier one of the persona is discarded, and after
+    `exhaustion_threshold` consecutive empty or duplicate outcomes the persona is treated as exhausted:
+    no further calls are made and the leftover skeletons are moved to the skipped file. With
+    `exhaustion_threshold=0` neither applies and every generated story is kept. Saves the persona's file when the lane is done and returns the number completed.
+    """
+    completed = 0
+    persona_stories = loader.get_by_persona(persona_id)
+    summary_index = build_summary_index(persona_stories)
+
+    exhausted_streak: List[UserStory] = []
+    skipped: List[UserStory] = []
+    batches = batch_stories_by_use_case(stories, max(1, batch_size))
+
+    for batch_no, batch in enumerate(batches):
+        use_case = use_case_loader.get_by_id(batch[0].use_case)
+        if not persona or not use_case:
+            for story in batch:
+                print(f"⚠️ Skipping US {story.id} (missing persona or use case)")
+            continue
+
+        prev_summary_text = build_previous_summary_context(batch, summary_index, utils.SYSTEM_NAME)
+
+        if len(batch) == 1:
+            prompt = build_user_story_prompt(
+                batch[0], persona, use_case, group_summary, prev_summary_text,
+                system_summary, story_guidelines, proficiency_level,
+            )
+            outcomes = [complete_user_story(utils, batch[0], prompt)]
+        else:
+            prompt = build_batch_user_story_prompt(
+                batch, persona, use_case, group_summary, prev_summary_text,
+                system_summary, story_guidelines, proficiency_level,
+            )
+            outcomes = complete_user_story_batch(utils, batch, prompt)
+
+        for story, outcome in zip(batch, outcomes):
+            if outcome == STORY_CREATED and exhaustion_threshold and is_duplicate_summary(story, summary_index):
+                print(f"⚠️ Story {story.id}: summary repeats an earlier story of {persona_id} – discarded")
+                clear_generated_fields(story)
+                outcome = STORY_DUPLICATE
+
+            if outcome == STORY_CREATED:
+                summary_index.add(story.id, story.summary)
+                completed += 1
+                exhausted_streak = []
+            elif outcome in (STORY_EMPTY, STORY_DUPLICATE):
+                exhausted_streak.append(story)
+
+        if exhaustion_threshold and len(exhausted_streak) >= exhaustion_threshold:
+            skipped = exhausted_streak + [s for b in batches[batch_no + 1:] for s in b]
+            print(f"🛑 {persona_id}: {len(exhausted_streak)} empty/duplicate outcome(s) in a row – persona exhausted, stopping.")
+            break
+
+    if skipped:
+        skipped_ids = {s.id for s in skipped}
+        persona_stories = [s for s in persona_stories if s.id not in skipped_ids]
+        save_skipped_user_stories(Path(utils.DUPLICATED_USER_STORY_DIR_PATH), persona_id, skipped)
+
+    loader.save_user_stories_for_persona(persona_id, persona_stories)
+    print(f"💾 {persona_id}: {completed}/{len(stories)} user stories completed and saved.")
+    return completed
+
+
+def generate_complete_user_stories(persona_loader: UserPersonaLoader, use_case_loader: UseCaseLoader, batch_size: int = 1,
+                                   exhaustion_threshold: int = EXHAUSTION_THRESHOLD):
+    """
+    Fill the incomplete user stories of every persona. With `batch_size` > 1, skeletons sharing a
+    persona and use case are completed up to `batch_size` at a time in one structured request.
+    A persona stops receiving calls after `exhaustion_threshold` consecutive empty or duplicate
+    outcomes (0 disables the early stop and keeps duplicate summaries).
+    """
+    utils = Utils()
+
+    # Load personas
+    all_personas = {p.id: p for p in persona_loader.get_personas()}
+    
+    # Step Skipping Logic – check if all stories are fully generated
+    loader = UserStoryLoader()
+    loader.load_all_user_stories()
+    all_stories = loader.get_all()
+
+    # Check if all user stories for each persona are complete
+    persona_ids = set(p.id for p in all_personas.values())
+    complete_personas = {
+        pid for pid in persona_ids
+        if all(
+            story.title and story.summary and story.priority is not None and story.pillar
+            for story in loader.get_by_persona(pid)
+        )
+    }
+
+    if complete_personas == persona_ids:
+        print(f"⏭️ Skipping generation: All user stories for {len(persona_ids)} personas are complete (title, summary, priority, and pillar filled).")
+        return
+    
+    # Load invalid user story directory
+    invalid_dir = Path(utils.DUPLICATED_USER_STORY_DIR_PATH)
+    invalid_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Load use cases
+    use_case_loader.load()
+    
+    # Load supporting documents
+    system_summary = utils.load_system_context()
+    story_guidelines = utils.load_user_story_guidelines()
+
+    # Reload to ensure clean state
+    loader = UserStoryLoader()
+    loader.load_all_user_stories()
+
+    # Filter incomplete stories
+    incomplete_stories = [
+        story for story in loader.get_all()
+        if not story.title or not story.summary or story.priority is None or not story.pillar
+    ]
+
+    print(f"🛠️ Generating {len(incomplete_stories)} user stories with LLM...")
+    
+    # Load user group keys
+    user_group_keys = utils.load_user_group_keys()
+    
+    # Load LLM response language proficiency level
+    proficiency_level = utils.load_llm_response_language_proficiency_level()
+
+    # Group incomplete stories into one lane per persona, keeping file order within each lane
+    lanes = defaultdict(list)
+    for story in incomplete_stories:
+        lanes[story.persona].append(story)
+
+    def run_lane(persona_id: str) -> int:
+        persona = all_personas.get(persona_id)
+        group_key = user_group_keys.get(persona.user_group) if persona else None
+        group_summary = utils.load_user_group_description(group_key) if group_key else "Unknown"
+        return generate_user_stories_for_persona(
+            utils, persona_id, lanes[persona_id], loader, persona, use_case_loader,
+            group_summary, system_summary, story_guidelines, proficiency_level, batch_size, exhaustion_threshold,
+        )
+
+    # Generate user stories' titles and summaries using LLM, all persona lanes concurrently
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_PERSONA_LANES, len(lanes)))) as executor:
+        completed = sum(executor.map(run_lane, sorted(lanes)))
+
+    print(f"✅ Finished updating {completed}/{len(incomplete_stories)} user stories.")
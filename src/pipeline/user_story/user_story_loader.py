@@ -1,26 +1,33 @@
 import os
 import json
 
-from typing import List, Optional
+from collections import defaultdict
+from itertools import count
+from typing import Dict, List, Optional
 
-from pipeline.utils import Utils
+from pipeline.utils import Utils, intern_value, save_json
 
 
 class UserStory:
+    # Slotted: large runs hold many stories, often in several loaders at once
+    __slots__ = ("id", "title", "persona", "user_group", "task", "use_case",
+                 "priority", "summary", "pillar", "type", "type_source", "cluster")
+
     def __init__(self, id: str, title: str, persona: str, user_group: str, task: str, use_case: str,
                  priority: int, summary: str, type: str, cluster: Optional[str] = None,
-                 pillar: Optional[str] = None):
+                 pillar: Optional[str] = None, type_source: Optional[str] = None):
         self.id = id
         self.title = title
-        self.persona = persona
-        self.user_group = user_group
+        self.persona = intern_value(persona)
+        self.user_group = intern_value(user_group)
         self.task = task 
-        self.use_case = use_case
+        self.use_case = intern_value(use_case)
         self.priority = priority
         self.summary = summary
-        self.pillar = pillar
-        self.type = type  # "Functional" or "Non-functional"
-        self.cluster = cluster
+        self.pillar = intern_value(pillar)
+        self.type = intern_value(type)  # "Functional" or "Non-functional"
+        self.type_source = intern_value(type_source)  # Who assigned the type: "llm" or "local" (classifier)
+        self.cluster = intern_value(cluster)
 
 
     def to_dict(self):
@@ -35,6 +42,7 @@ class UserStory:
             "summary": self.summary,
             "pillar": self.pillar,
             "type": self.type,
+            "typeSource": self.type_source,
             "cluster": self.cluster,
         }
 
@@ -51,29 +59,126 @@ class UserStory:
             summary=data["summary"],
             pillar=data.get("pillar"),
             type=data["type"],
-            cluster=data.get("cluster")
+            cluster=data.get("cluster"),
+            type_source=data.get("typeSource")
         )
 
 
 class UserStoryLoader:
+    # Fields with a lookup index, and how each story is keyed in it
+    INDEXED_FIELDS = {
+        "persona": lambda s: s.persona,
+        "type": lambda s: (s.type or "").lower(),
+        "cluster": lambda s: s.cluster,
+        "use_case": lambda s: s.use_case,
+    }
+
     def __init__(self, user_story_dir: str = None):
         self.user_stories: List[UserStory] = []
         self.user_story_dir = user_story_dir or Utils().UNIQUE_USER_STORY_DIR_PATH
 
-    def load_from_file(self, file_path: str):
+        # Personas whose stories were updated in memory but not yet written back
+        self.dirty_personas = set()
+        self.pending_updates = 0
+
+        # Per loaded file: its (mtime, size, inode) at load time and the stories parsed from it. save_json
+        # replaces files through os.replace, so a rewrite always changes the inode even within one mtime tick
+        self._file_signatures: Dict[str, tuple] = {}
+        self._file_stories: Dict[str, List[UserStory]] = {}
+
+        self._clear_indexes()
+
+    # ---------- Indexes ----------
+    # Buckets are keyed by object identity so that stories sharing an ID never shadow each other,
+    # and lookups return stories in load/insertion order. Buckets are insertion-ordered dicts, rebuilt
+    # in file order on (re)load; a story re-indexed by an update lands at the end of its new bucket,
+    # which is then put back in order once, on its next lookup.
+
+    def _clear_indexes(self):
+        self.by_id: Dict[str, UserStory] = {}
+        self._buckets = {field: defaultdict(dict) for field in self.INDEXED_FIELDS}
+        self._unordered_buckets = set()
+        self._positions: Dict[int, int] = {}
+        self._counter = count()
+
+    def _index(self, story: UserStory):
+        self.by_id[story.id] = story
+        position = self._positions.setdefault(id(story), next(self._counter))
+        for field, key_of in self.INDEXED_FIELDS.items():
+            key = key_of(story)
+            bucket = self._buckets[field][key]
+            if bucket and self._positions[next(reversed(bucket))] > position:
+                self._unordered_buckets.add((field, key))
+            bucket[id(story)] = story
+
+    def _unindex(self, story: UserStory):
+        if self.by_id.get(story.id) is story:
+            del self.by_id[story.id]
+        for field, key_of in self.INDEXED_FIELDS.items():
+            bucket = self._buckets[field].get(key_of(story))
+            if bucket is not None:
+                bucket.pop(id(story), None)
+
+    def _lookup(self, field: str, key) -> List[UserStory]:
+        bucket = self._buckets[field].get(key)
+        if not bucket:
+            return []
+        if (field, key) in self._unordered_buckets:
+            self._unordered_buckets.discard((field, key))
+            bucket = self._buckets[field][key] = dict(sorted(bucket.items(), key=lambda item: self._positions[item[0]]))
+        return list(bucket.values())
+
+    def _parse_file(self, file_path: str) -> List[UserStory]:
         with open(file_path, 'r', encoding='utf-8') as f:
             raw_data = json.load(f)
-        self.user_stories.extend([UserStory.from_dict(d) for d in raw_data])
+        return [UserStory.from_dict(d) for d in raw_data]
+
+    def load_from_file(self, file_path: str):
+        stories = self._parse_file(file_path)
+        self.user_stories.extend(stories)
+        for story in stories:
+            self._index(story)
 
     def load_all_user_stories(self):
-        self.user_stories.clear()
-        for fname in os.listdir(self.user_story_dir):
-            if fname.endswith(".json"):
-                self.load_from_file(os.path.join(self.user_story_dir, fname))
+        """
+        (Re)load every persona file of the directory. Only files whose mtime, size or inode changed since the
+        previous load (or whose persona has unsaved in-memory updates) are parsed again; the stories of
+        unchanged files are kept as they are.
+        """
+        current = {}
+        for entry in sorted(os.scandir(self.user_story_dir), key=lambda e: e.name):
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                current[entry.path] = (stat.st_mtime_ns, stat.st_size, entry.inode())
+
+        # Unsaved in-memory updates are dropped, as a full reload would
+        stale_personas = set(self.dirty_personas)
+        changed = [
+            path for path, signature in current.items()
+            if self._file_signatures.get(path) != signature
+            or any(s.persona in stale_personas for s in self._file_stories.get(path, ()))
+        ]
+        removed = [path for path in self._file_stories if path not in current]
+
+        for path in removed:
+            del self._file_stories[path]
+            del self._file_signatures[path]
+
+        for path in changed:
+            self._file_stories[path] = self._parse_file(path)
+            self._file_signatures[path] = current[path]
+
+        # Keep file order (stories added outside a file are dropped), and rebuild the indexes to match it
+        self.user_stories[:] = [s for path in sorted(self._file_stories) for s in self._file_stories[path]]
+        self._clear_indexes()
+        for story in self.user_stories:
+            self._index(story)
+
+        self.dirty_personas.clear()
+        self.pending_updates = 0
 
     def save_to_file(self, file_path: str):
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump([story.to_dict() for story in self.user_stories], f, indent=2)
+        save_json(file_path, [story.to_dict() for story in self.user_stories])
 
     def save_all_user_stories_by_persona(self):
         from collections import defaultdict
@@ -82,12 +187,50 @@ class UserStoryLoader:
             grouped[s.persona].append(s)
 
         for persona_id, stories in grouped.items():
-            file_path = os.path.join(self.user_story_dir, f"User_stories_for_{persona_id}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump([s.to_dict() for s in stories], f, indent=2)
+            self._write_persona_file(persona_id, stories)
+
+    def save_user_stories_for_persona(self, persona_id: str, stories: Optional[List[UserStory]] = None):
+        self._write_persona_file(persona_id, self.get_by_persona(persona_id) if stories is None else stories)
+
+    def _write_persona_file(self, persona_id: str, stories: List[UserStory]):
+        file_path = os.path.join(self.user_story_dir, f"User_stories_for_{persona_id}.json")
+        save_json(file_path, [s.to_dict() for s in stories])
+
+    def update_cluster(self, story: UserStory, cluster: str):
+        """Assign a cluster in memory; the persona file is written by `save_dirty_personas`."""
+        self._unindex(story)
+        story.cluster = intern_value(cluster)
+        self._index(story)
+        self._mark_dirty(story)
+
+    def update_type(self, story: UserStory, story_type: str, source: str = "llm"):
+        """Assign a type (and who assigned it) in memory; the persona file is written by `save_dirty_personas`."""
+        self._unindex(story)
+        story.type = intern_value(story_type)
+        story.type_source = intern_value(source)
+        self._index(story)
+        self._mark_dirty(story)
+
+    def update_summary(self, story: UserStory, summary: str):
+        """Replace a summary in memory; the persona file is written by `save_dirty_personas`."""
+        story.summary = summary
+        self._mark_dirty(story)
+
+    def _mark_dirty(self, story: UserStory):
+        self.dirty_personas.add(story.persona)
+        self.pending_updates += 1
+
+    def save_dirty_personas(self) -> int:
+        """Write back every persona file with pending in-memory updates. Returns the number of files written."""
+        written = len(self.dirty_personas)
+        for persona_id in sorted(self.dirty_personas):
+            self.save_user_stories_for_persona(persona_id)
+        self.dirty_personas.clear()
+        self.pending_updates = 0
+        return written
 
     def filter_by_type(self, story_type: str) -> List[UserStory]:
-        return [story for story in self.user_stories if story.type.lower() == story_type.lower()]
+        return self._lookup("type", story_type.lower())
     
     def print_clusters_for_non_functional_stories(self):
         from collections import defaultdict
@@ -121,17 +264,31 @@ class UserStoryLoader:
             for s in stories:
                 print(f"  • {s.id} - {s.title} [{s.persona}]")
 
+    def get_by_id(self, story_id: str) -> Optional[UserStory]:
+        return self.by_id.get(story_id)
+
     def get_by_persona(self, persona_id: str) -> List[UserStory]:
-        return [story for story in self.user_stories if story.persona == persona_id]
+        return self._lookup("persona", persona_id)
 
     def get_by_use_case(self, use_case_id: str) -> List[UserStory]:
-        return [story for story in self.user_stories if story.use_case == use_case_id]
+        return self._lookup("use_case", use_case_id)
+
+    def get_by_cluster(self, cluster: str) -> List[UserStory]:
+        return self._lookup("cluster", cluster)
 
     def get_by_priority(self, max_priority: int) -> List[UserStory]:
+        # Not indexed: the generator sets `priority` on story objects directly rather than through the
+        # loader, so an index would go stale, and this lookup is not used on any hot path
         return [story for story in self.user_stories if story.priority is not None and story.priority <= max_priority]
 
     def add_user_story(self, user_story: UserStory):
         self.user_stories.append(user_story)
+        self._index(user_story)
+
+    def remove_user_story(self, user_story: UserStory):
+        self.user_stories.remove(user_story)
+        self._unindex(user_story)
+        self._positions.pop(id(user_story), None)
 
     def get_all(self) -> List[UserStory]:
         return self.user_stories
@@ -1,10 +1,17 @@
 import os
 import json
 
+from collections import defaultdict
+from typing import Dict
+
 from pipeline.user_story.user_story_loader import UserStoryLoader
 from pipeline.utils import Utils
 
 
+# Number of one persona's stories checked per LLM call
+VERIFICATION_BATCH_SIZE = 15
+
+
 def verify_user_stories_to_ensure_persona_centricity(persona_loader):
     """Verify and possibly correct user story summaries to prioritize persona context over system context."""
 
@@ -28,23 +35,68 @@ def verify_user_stories_to_ensure_persona_centricity(persona_loader):
     # Load LLM response language proficiency level
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
+    # The persona and context are sent once per batch of that persona's stories
+    stories_by_persona = defaultdict(list)
     for story in all_stories:
-        persona = all_personas.get(story.persona)
+        stories_by_persona[story.persona].append(story)
+
+    for persona_id, persona_stories in stories_by_persona.items():
+        persona = all_personas.get(persona_id)
         if not persona:
-            print(f"⚠️ Persona {story.persona} not found for story {story.id}. Skipping.")
+            print(f"⚠️ Persona {persona_id} not found for {len(persona_stories)} stories. Skipping.")
             continue
 
-        prompt = build_verification_prompt(system_context, user_story_guidelines, persona, story, proficiency_level=proficiency_level)
+        for i in range(0, len(persona_stories), VERIFICATION_BATCH_SIZE):
+            batch = persona_stories[i:i + VERIFICATION_BATCH_SIZE]
+            revisions = verify_user_story_batch(system_context, user_story_guidelines, persona, batch, utils, proficiency_level)
+
+            if revisions is None:
+                # Unreadable batch reply – fall back to one prompt per story
+                revisions = {}
+                for story in batch:
+                    revised_summary = verify_single_user_story(system_context, user_story_guidelines, persona, story, utils, proficiency_level)
+                    if revised_summary:
+                        revisions[story.id] = revised_summary
+
+            for story in batch:
+                revised_summary = revisions.get(story.id)
+                if revised_summary and revised_summary != story.summary:
+                    print(f"✏️ Updated summary for story {story.id} (Persona: {story.persona})")
+                    update_story_summary(story, revised_summary, loader)
+                else:
+                    print(f"✅ Summary for story {story.id} looks good.")
+
+        # One write per persona file
+        loader.save_dirty_personas()
+
+
+def verify_single_user_story(system_context, guidelines, persona, story, utils: Utils, proficiency_level="") -> str:
+    prompt = build_verification_prompt(system_context, guidelines, persona, story, proficiency_level=proficiency_level)
+    try:
+        return utils.get_llm_response(prompt).strip()
+    except Exception as e:
+        print(f"❌ LLM error verifying story {story.id}: {e}")
+        return ""
+
+
+def verify_user_story_batch(system_context, guidelines, persona, stories, utils: Utils, proficiency_level="") -> Dict[str, str]:
+    """Revised summaries keyed by story ID, only for stories that need a rewrite. None if the reply is unreadable."""
+    prompt = build_batch_verification_prompt(system_context, guidelines, persona, stories, proficiency_level=proficiency_level)
+    try:
+        revisions = json.loads(utils.get_llm_response(prompt))
+        if not isinstance(revisions, dict):
+            raise ValueError("Expected a JSON object keyed by user story ID.")
+    except Exception as e:
+        print(f"⚠️ Batch verification failed for {len(stories)} stories of {persona.id}: {e}")
+        return None
+
+    batch_ids = {s.id for s in stories}
+    return {
+        story_id: summary.strip()
+        for story_id, summary in revisions.items()
+        if story_id in batch_ids and isinstance(summary, str) and summary.strip()
+    }
 
-        try:
-            revised_summary = utils.get_llm_response(prompt).strip()
-            if revised_summary and revised_summary != story.summary:
-                print(f"✏️ Updated summary for story {story.id} (Persona: {story.persona})")
-                update_story_summary(story, revised_summary, utils)
-            else:
-                print(f"✅ Summary for story {story.id} looks good.")
-        except Exception as e:
-            print(f"❌ LLM error verifying story {story.id}: {e}")
 
 def build_verification_prompt(system_context, guidelines, persona, story, proficiency_level=""):
     """Build prompt instructing LLM to check and correct user story summary."""
@@ -88,27 +140,57 @@ Strictly, return ONLY the summary text. Do not include any additional text or co
 """
     return prompt
 
-def update_story_summary(story, new_summary, utils: Utils = None):
-    """Update the summary in the persona's user story JSON file."""
-    filename = f"User_stories_for_{story.persona}.json"
-    filepath = os.path.join(utils.UNIQUE_USER_STORY_DIR_PATH, filename)
+def build_batch_verification_prompt(system_context, guidelines, persona, stories, proficiency_level=""):
+    """Build prompt instructing LLM to check several summaries of one persona and return only the rewrites."""
 
-    if not os.path.exists(filepath):
-        print(f"❌ Could not find user story file for persona {story.persona} to update summary.")
-        return
+    persona_info = persona.to_prompt_string() if hasattr(persona, 'to_prompt_string') else json.dumps(persona.__dict__, indent=2)
+
+    stories_text = "\n".join(
+        f"- ID: {s.id}\n  Title: {s.title}\n  Summary: {s.summary}\n  Pillar: {s.pillar}\n  User Group: {s.user_group}"
+        for s in stories
+    )
+
+    prompt = f"""
+You are a Requirement analyst. Requirements made by a persona in a given system may have been misled to make them more logical and smooth with the system, rather than aligning with the persona information, or they may not have been, I can't be sure. Your job is to check the requirements (a.k.a user stories) to be 100% sure that the persona information should be dominant in the context of each user story rather than the system context, even if it contradicts some of the content in the system context.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+------------------------------
+
+--- USER STORY GUIDELINES ---
+{guidelines}
+------------------------------
+
+--- PERSONA INFORMATION ---
+{persona_info}
+------------------------------
+
+--- USER STORIES ---
+Persona's user stories for checking:
+{stories_text}
+------------------------------
+
+--- YOUR TASK ---
+Check each of the above user story summaries carefully. If a summary seems more influenced by the system context than the persona, rewrite it so that the persona's context and perspective is dominant, even if that means contradicting or modifying the system context aspects. If a summary already properly reflects the persona's perspective, leave it out of your response.
+However, please make sure each rewritten summary is informative but concise, and avoid unnecessary verbosity. A summary should be a single sentence that captures the essence of the user story from the persona's perspective (please see the USER STORY GUIDELINES above).
+------------------------------
+
+--- OUTPUT FORMAT ---
+Return a single JSON object that maps the ID of each user story that NEEDS a rewrite to its rewritten summary, e.g.:
+{{
+  "US-XXX": "(Rewritten summary)"
+}}
+Return {{}} if no summary needs a rewrite.
+
+Strictly, return ONLY the JSON object. Do not include any additional text or commentary. Do NOT use any markdown, bold, italic, or special formatting in your response.
+------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+"""
+    return prompt
 
-    with open(filepath, "r", encoding="utf-8") as f:
-        stories = json.load(f)
-
-    updated = False
-    for s in stories:
-        if s.get("id") == story.id:
-            s["summary"] = new_summary
-            updated = True
-            break
-
-    if updated:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(stories, f, indent=2, ensure_ascii=False)
-    else:
-        print(f"⚠️ Could not find story {story.id} in persona {story.persona} file to update summary.")
+def update_story_summary(story, new_summary, loader: UserStoryLoader):
+    """Update the summary in memory; the persona's file is written once its stories are all checked."""
+    loader.update_summary(story, new_summary)
@@ -2,21 +2,29 @@ import os
 import json
 import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
-from pipeline.user_story.user_story_loader import UserStoryLoader
-from pipeline.utils import Utils 
+from pipeline.artifact_store import ArtifactStore
+from pipeline.user_story.user_story_loader import UserStoryLoader, UserStory
+from pipeline.user_story_conflict.user_story_conflict_candidate_selector import comparison_batches, select_candidate_pairs
+from pipeline.user_story_conflict.user_story_conflict_verdict_memo import ConflictVerdictMemo, RecordedConflicts, identified_summaries, story_hash
+from pipeline.utils import Utils, load_json
 
 
-def load_json_file(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Number of candidate stories compared with one story per LLM call (1 = one prompt per pair)
+CONFLICT_BATCH_SIZE = 10
+
+# Batches of different clusters and group pairs are independent, so they are compared concurrently
+MAX_CONFLICT_WORKERS = 6
 
+# Stage name of these verdicts in the cross-run verdict memo
+VERDICT_MEMO_STAGE = "functional_conflicts_across"
 
-def save_json_file(path: str, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def load_json_file(path: str):
+    return load_json(path)
 
 
 def build_conflict_prompt(
@@ -84,15 +92,82 @@ Strictly, do not include commentary or extra text outside the JSON. Do NOT use a
 """.strip()
 
 
-def parse_conflict_response(
-    raw: str,
-    conflict_id_counter: int,
+def build_batch_conflict_prompt(
+    technique_summary: str,
+    system_context: str,
+    user_story_guidelines: str,
     story_a,
-    story_b,
+    candidates,
     cluster: str,
     user_group_a: str,
     user_group_b: str,
-) -> Optional[dict]:
+    proficiency_level: str = "",
+) -> str:
+    candidates_text = "\n".join(
+        f"- ID: {s.id}\n  Persona: {s.persona}\n  Title: {s.title}\n  Summary: {s.summary}"
+        for s in candidates
+    )
+
+    return f"""
+You are an expert in functional user story conflict analysis. You are identifying conflicts between one functional user story and several functional user stories of a different user group but within the same cluster.
+
+
+--- SYSTEM CONTEXT ---
+{system_context}
+-------------------------------------
+
+--- IDENTIFICATION TECHNIQUE ---
+Apply the Chentouf technique for identifying functional user story conflicts (across two different user groups):
+{technique_summary}
+-------------------------------------
+
+--- USER STORY GUIDELINES ---
+{user_story_guidelines}
+-------------------------------------
+
+--- YOUR TASK ---
+Compare User Story A with EACH of the candidate FUNCTIONAL user stories below. User Story A and the candidates belong to different user groups but within the same cluster:
+Cluster: {cluster}
+User Group of User Story A: {user_group_a}
+User Group of the candidates: {user_group_b}
+
+User Story A:
+- ID: {story_a.id}
+- Persona: {story_a.persona}
+- Title: {story_a.title}
+- Summary: {story_a.summary}
+
+Candidate User Stories:
+{candidates_text}
+
+TASK:
+Judge each candidate independently against User Story A. If you think there is a conflict between User Story A and a candidate, identify it according to the Chentouf conflict types (Start-Forbid, Forbid-stop, Two Condition Events, Two Operation Frequencies Conflict).
+Note that, please strictly follow the definition of conflict between two user stories in the Chentouf's technique summary. Do not consider diversity of user preferences or slight differences in user stories as a conflict.
+If you think the conflict found is a mild or nuanced one, it is likely that the user stories are not conflicting at all. In that case, leave that candidate out of your response.
+
+Only respond with a valid JSON list containing one object per conflicting candidate, with the following structure:
+
+[
+  {{
+    "storyId": "The ID of the conflicting candidate user story",
+    "conflictType": "Start-Forbid" or "Forbid-stop" or "Two Condition Events" or "Two Operation Frequencies Conflict",
+    "conflictDescription": "A short (1–3 sentence) description of why this is a conflict and/or why this conflict type was determined."
+  }}
+]
+
+If no candidate conflicts with User Story A, respond with an empty JSON list: []
+
+Strictly, do not include commentary or extra text outside the JSON. Do NOT use any markdown, bold, italic, or special formatting in your response.
+-------------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+""".strip()
+
+
+def parse_conflict_response(raw: str, story_a, story_b) -> Optional[dict]:
+    """The conflict in an LLM reply, {} for no conflict, or None if the reply is unreadable."""
     try:
         raw = re.sub(r"```(json)?", "", raw).strip()
         parsed = json.loads(raw)
@@ -100,20 +175,7 @@ def parse_conflict_response(
         # If empty JSON or missing keys -> no conflict
         if not parsed or not parsed.get("conflictType") or not parsed.get("conflictDescription"):
             print(f"ℹ️ No conflict found between {story_a.id} and {story_b.id}")
-            return None
-
-        parsed["conflictId"] = f"FCAT-{conflict_id_counter:03d}"
-        parsed["personaAId"] = story_a.persona
-        parsed["personaBId"] = story_b.persona
-        parsed["userGroupA"] = user_group_a
-        parsed["userGroupB"] = user_group_b
-        parsed["userStoryAId"] = story_a.id
-        parsed["userStoryBId"] = story_b.id
-        parsed["userStoryASummary"] = story_a.summary
-        parsed["userStoryBSummary"] = story_b.summary
-        parsed["cluster"] = cluster
-
-        print(f"✅ Found conflict {parsed['conflictId']} between {story_a.id} and {story_b.id}")
+            return {}
 
         return parsed
     except Exception as e:
@@ -122,7 +184,124 @@ def parse_conflict_response(
         return None
 
 
-def identify_functional_conflicts_across_two_groups(user_story_loader: UserStoryLoader = None):
+def parse_batch_conflict_response(raw: str, story_a, candidates) -> Optional[Dict[str, dict]]:
+    """Detected conflicts keyed by candidate story ID. None if the reply is unreadable."""
+    try:
+        raw = re.sub(r"```(json)?", "", raw).strip()
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict):
+            parsed = [parsed] if parsed else []
+        if not isinstance(parsed, list):
+            raise ValueError("Expected a JSON list of conflicts.")
+    except Exception as e:
+        print(f"⚠️ Batch conflict identification failed for {story_a.id} against {len(candidates)} stories: {e}")
+        return None
+
+    candidate_ids = {s.id for s in candidates}
+    conflicts = {}
+    for entry in parsed:
+        if not isinstance(entry, dict) or entry.get("storyId") not in candidate_ids:
+            continue
+        if not entry.get("conflictType") or not entry.get("conflictDescription"):
+            continue
+        conflicts[entry["storyId"]] = {
+            "conflictType": entry["conflictType"],
+            "conflictDescription": entry["conflictDescription"],
+        }
+    return conflicts
+
+
+def annotate_conflict(
+    conflict: dict,
+    conflict_id_counter: int,
+    story_a,
+    story_b,
+    cluster: str,
+    user_group_a: str,
+    user_group_b: str,
+) -> dict:
+    """Attach the conflict ID and the compared stories to a conflict verdict."""
+    conflict["conflictId"] = f"FCAT-{conflict_id_counter:03d}"
+    conflict["personaAId"] = story_a.persona
+    conflict["personaBId"] = story_b.persona
+    conflict["userGroupA"] = user_group_a
+    conflict["userGroupB"] = user_group_b
+    conflict["userStoryAId"] = story_a.id
+    conflict["userStoryBId"] = story_b.id
+    conflict["userStoryASummary"] = story_a.summary
+    conflict["userStoryBSummary"] = story_b.summary
+    conflict["cluster"] = cluster
+
+    print(f"✅ Found conflict {conflict['conflictId']} between {story_a.id} and {story_b.id}")
+
+    return conflict
+
+
+def compare_story_with_candidates(
+    utils: Utils,
+    technique_summary: str,
+    system_context: str,
+    user_story_guidelines: str,
+    anchor,
+    candidates,
+    anchor_is_a: bool,
+    cluster: str,
+    user_group_a: str,
+    user_group_b: str,
+    proficiency_level: str = "",
+) -> List[Tuple[UserStory, UserStory, dict]]:
+    """
+    Verdicts of one story against its candidates as (story A, story B, verdict), from one batch prompt or per-pair prompts.
+    A verdict is the conflict, or {} for no conflict. Pairs whose reply could not be read are left out.
+    """
+    verdicts = None
+    if len(candidates) > 1:
+        anchor_group, candidate_group = (user_group_a, user_group_b) if anchor_is_a else (user_group_b, user_group_a)
+        prompt = build_batch_conflict_prompt(
+            technique_summary,
+            system_context,
+            user_story_guidelines,
+            anchor,
+            candidates,
+            cluster,
+            anchor_group,
+            candidate_group,
+            proficiency_level,
+        )
+        verdicts = parse_batch_conflict_response(utils.get_llm_response(prompt), anchor, candidates)
+
+    found = []
+    for candidate in candidates:
+        sa, sb = (anchor, candidate) if anchor_is_a else (candidate, anchor)
+        if verdicts is not None:
+            verdict = verdicts.get(candidate.id, {})
+            if not verdict:
+                print(f"ℹ️ No conflict found between {sa.id} and {sb.id}")
+        else:
+            # Single candidate, or unreadable batch reply – one prompt for this pair
+            prompt = build_conflict_prompt(
+                technique_summary,
+                system_context,
+                user_story_guidelines,
+                sa,
+                sb,
+                cluster,
+                user_group_a,
+                user_group_b,
+                proficiency_level,
+            )
+            verdict = parse_conflict_response(utils.get_llm_response(prompt), sa, sb)
+        if verdict is not None:
+            found.append((sa, sb, verdict))
+    return found
+
+
+def identify_functional_conflicts_across_two_groups(
+    user_story_loader: UserStoryLoader = None,
+    use_candidate_blocking: bool = False,
+    batch_size: int = CONFLICT_BATCH_SIZE,
+    use_verdict_memo: bool = True,
+):
     utils = Utils()
 
     os.makedirs(utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, exist_ok=True)
@@ -147,13 +326,28 @@ def identify_functional_conflicts_across_two_groups(user_story_loader: UserStory
     user_story_guidelines = utils.load_user_story_guidelines()
     conflict_technique_summary = utils.load_functional_user_story_conflict_technique_description()
 
-    conflict_id_counter = 1
-
     user_group_keys = utils.load_user_group_keys()
 
     # Load LLM response language proficiency level
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
+    memo = None
+    if use_verdict_memo:
+        memo = ConflictVerdictMemo(
+            VERDICT_MEMO_STAGE, (conflict_technique_summary, system_context, user_story_guidelines, proficiency_level)
+        )
+
+    # Conflicts of earlier runs keep their record and verification; stories rewritten by their resolution
+    # are hashed with the summary they were identified on
+    recorded = RecordedConflicts(
+        utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, utils.INVALID_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR
+    )
+    summaries = identified_summaries(recorded.records, functional_stories)
+
+    # One work item per story and batch of its candidates, across all clusters and group pairs
+    work_items = []
+    remembered = []
+    story_hashes = {}
     for cluster, stories_in_cluster in cluster_map.items():
         # Group stories by user group inside the cluster
         group_map = defaultdict(list)
@@ -171,59 +365,76 @@ def identify_functional_conflicts_across_two_groups(user_story_loader: UserStory
             groupA_stories = group_map[groupA]
             groupB_stories = group_map[groupB]
 
-            conflicts = []
-
-            for sa in groupA_stories:
-                for sb in groupB_stories:
-                    prompt = build_conflict_prompt(
-                        conflict_technique_summary,
-                        system_context,
-                        user_story_guidelines,
-                        sa,
-                        sb,
-                        cluster,
-                        groupA,
-                        groupB,
-                        proficiency_level,
-                    )
-                    response = utils.get_llm_response(prompt)
-                    conflict = parse_conflict_response(
-                        response,
-                        conflict_id_counter,
-                        sa,
-                        sb,
-                        cluster,
-                        groupA,
-                        groupB,
-                    )
-                    if conflict:
-                        conflicts.append(conflict)
-                        conflict_id_counter += 1
-
-            if conflicts:
-                filename = f"{user_group_keys[groupA]}_vs_{user_group_keys[groupB]}.json"
-                path = os.path.join(utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, filename)
-
-                # Read existing conflicts to merge
-                existing_conflicts = []
-                if os.path.exists(path):
-                    try:
-                        with open(path, "r", encoding="utf-8") as f:
-                            existing_conflicts = json.load(f)
-                    except Exception as e:
-                        print(f"⚠️ Failed to load existing conflict file {filename}: {e}")
-
-                # Merge and deduplicate by sorted pair of userStory IDs
-                combined_conflicts = existing_conflicts + conflicts
-                unique_conflicts = []
-                seen_pairs = set()
-                for c in combined_conflicts:
-                    pair = tuple(sorted([c["userStoryAId"], c["userStoryBId"]]))
-                    if pair not in seen_pairs:
-                        seen_pairs.add(pair)
-                        unique_conflicts.append(c)
-
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(unique_conflicts, f, indent=2, ensure_ascii=False)
-
-                print(f"✅ Saved {len(conflicts)} new conflicts between {groupA} and {groupB} to {filename}")
+            # Every pair, or only the locally ranked candidates
+            if use_candidate_blocking:
+                pairs = select_candidate_pairs(groupA_stories, groupB_stories)
+                skipped = len(groupA_stories) * len(groupB_stories) - len(pairs)
+                if skipped:
+                    print(f"   ➤ '{cluster}' / {groupA} vs {groupB}: {len(pairs)} candidate pair(s) sent to LLM, {skipped} skipped by local blocking")
+            else:
+                pairs = [(sa, sb) for sa in groupA_stories for sb in groupB_stories]
+
+            # Pairs judged in an earlier run keep their verdict, only the others go to the LLM
+            if memo is not None:
+                for story in groupA_stories + groupB_stories:
+                    story_hashes[story.id] = story_hash(story, cluster, summary=summaries.get(story.id))
+                block_remembered, pairs = memo.split(pairs, story_hashes)
+                remembered.extend((sa, sb, verdict, cluster, groupA, groupB) for sa, sb, verdict in block_remembered)
+
+            for anchor, candidates, anchor_is_a in comparison_batches(pairs, batch_size):
+                work_items.append((cluster, groupA, groupB, anchor, candidates, anchor_is_a))
+
+    def run_item(item) -> List[Tuple[UserStory, UserStory, dict, str, str, str]]:
+        cluster, groupA, groupB, anchor, candidates, anchor_is_a = item
+        found = compare_story_with_candidates(
+            utils, conflict_technique_summary, system_context, user_story_guidelines,
+            anchor, candidates, anchor_is_a, cluster, groupA, groupB, proficiency_level,
+        )
+        return [(sa, sb, verdict, cluster, groupA, groupB) for sa, sb, verdict in found]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONFLICT_WORKERS, len(work_items)))) as executor:
+        judged = [verdict for item_verdicts in executor.map(run_item, work_items) for verdict in item_verdicts]
+
+    if memo is not None:
+        for sa, sb, verdict, _, _, _ in judged:
+            memo.put(story_hashes[sa.id], story_hashes[sb.id], verdict)
+        print(f"   ➤ {len(remembered)} story pair verdict(s) reused from earlier runs, {memo.save()} new one(s) remembered")
+        memo.close()
+
+    found = [conflict for conflict in remembered + judged if conflict[2]]
+
+    # New conflict IDs follow story ID order, so they do not depend on how the work was scheduled
+    found.sort(key=lambda conflict: (conflict[0].id, conflict[1].id))
+    conflicts_by_group_pair = defaultdict(list)
+    for sa, sb, verdict, cluster, groupA, groupB in found:
+        conflict = recorded.carry_over(sa, sb, lambda number: annotate_conflict(verdict, number, sa, sb, cluster, groupA, groupB))
+        if conflict is not None:
+            conflicts_by_group_pair[(groupA, groupB)].append(conflict)
+
+    # One merge and write per group-pair file, through the artifact store
+    store = ArtifactStore()
+    for (groupA, groupB), conflicts in sorted(conflicts_by_group_pair.items()):
+        filename = f"{user_group_keys[groupA]}_vs_{user_group_keys[groupB]}.json"
+        path = os.path.join(utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, filename)
+
+        # Read existing conflicts to merge
+        existing_conflicts = []
+        try:
+            existing_conflicts = store.read_file(path)
+        except Exception as e:
+            print(f"⚠️ Failed to load existing conflict file {filename}: {e}")
+
+        # Merge and deduplicate by sorted pair of userStory IDs
+        combined_conflicts = existing_conflicts + conflicts
+        unique_conflicts = []
+        seen_pairs = set()
+        for c in combined_conflicts:
+            pair = tuple(sorted([c["userStoryAId"], c["userStoryBId"]]))
+            if pair not in seen_pairs:
+                seen_pairs.add(pair)
+                unique_conflicts.append(c)
+
+        store.write_file(path, unique_conflicts)
+
+        print(f"✅ Saved {len(conflicts)} new conflicts between {groupA} and {groupB} to {filename}")
+    store.close()
@@ -2,20 +2,16 @@ import os
 import json
 from typing import Optional
 
+from pipeline.artifact_store import ArtifactStore
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    load_json,
 )
 
 
 def load_json_file(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_json_file(path: str, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    return load_json(path)
 
 
 def build_resolution_prompt(
@@ -115,29 +111,12 @@ def parse_llm_response(raw: str) -> Optional[dict]:
         return None
 
 
-def update_user_story_file_by_persona(persona_id: str, story_id: str, new_summary: str, utils: Utils):
-
-    filepath = os.path.join(utils.UNIQUE_USER_STORY_DIR_PATH, f"User_stories_for_{persona_id}.json")
-    if not os.path.exists(filepath):
-        print(f"⚠️ User story file for persona {persona_id} not found: {filepath}")
-        return
-
-    with open(filepath, "r", encoding="utf-8") as f:
-        stories = json.load(f)
-
-    idx = next((i for i, s in enumerate(stories) if s.get("id") == story_id), None)
-    if idx is None:
+def update_user_story_file_by_persona(persona_id: str, story_id: str, new_summary: str, store: ArtifactStore):
+    """Write a resolved summary through the artifact store; an empty summary removes the story."""
+    if not store.update_user_story_summary(persona_id, story_id, new_summary):
         print(f"⚠️ Story {story_id} not found in persona {persona_id} file")
-        return
-
-    if not new_summary.strip():
-        print(f"🗑️ Removing story {story_id} from persona {persona_id} file due to empty summary")
-        stories.pop(idx)
-    else:
-        stories[idx]["summary"] = new_summary
-
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(stories, f, indent=2, ensure_ascii=False)
+    elif not new_summary.strip():
+        print(f"🗑️ Removed story {story_id} from persona {persona_id} file due to empty summary")
 
 
 def resolve_functional_conflicts_across_two_groups(persona_loader: UserPersonaLoader):
@@ -170,6 +149,9 @@ def resolve_functional_conflicts_across_two_groups(persona_loader: UserPersonaLo
         if f.endswith(".json")
     ]
 
+    # Resolved summaries and conflict files are written through the artifact store
+    store = ArtifactStore()
+
     for conflict_file in conflict_files:
         conflict_path = os.path.join(utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, conflict_file)
         try:
@@ -246,12 +228,14 @@ def resolve_functional_conflicts_across_two_groups(persona_loader: UserPersonaLo
             updated = True
 
             # Update user story files accordingly (per persona)
-            update_user_story_file_by_persona(conflict.get("personaAId"), a_id, parsed["newUserStoryASummary"], utils)
-            update_user_story_file_by_persona(conflict.get("personaBId"), b_id, parsed["newUserStoryBSummary"], utils)
+            update_user_story_file_by_persona(conflict.get("personaAId"), a_id, parsed["newUserStoryASummary"], store)
+            update_user_story_file_by_persona(conflict.get("personaBId"), b_id, parsed["newUserStoryBSummary"], store)
 
         if updated:
             try:
-                save_json_file(conflict_path, conflicts)
+                store.write_file(conflict_path, conflicts)
                 print(f"✅ Updated conflict file saved: {conflict_file}")
             except Exception as e:
                 print(f"❌ Failed to save updated conflict file {conflict_file}: {e}")
+
+    store.close()
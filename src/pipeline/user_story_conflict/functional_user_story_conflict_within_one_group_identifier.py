@@ -3,22 +3,48 @@ import json
 import re
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
-from typing import Optional
-
-from pipeline.user_story.user_story_loader import UserStoryLoader
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.artifact_store import ArtifactStore
+from pipeline.user_story.user_story_loader import UserStoryLoader, UserStory
+from pipeline.user_story_conflict.user_story_conflict_candidate_selector import comparison_batches, select_candidate_pairs
+from pipeline.user_story_conflict.user_story_conflict_verdict_memo import (
+    ConflictVerdictMemo, RecordedConflicts, conflicts_resolved, identified_summaries, load_conflict_records, story_hash,
+)
 from pipeline.utils import Utils
 
-def identify_functional_conflicts_within_one_group(user_story_loader: Optional[UserStoryLoader] = None):
+
+# Number of candidate stories compared with one story per LLM call (1 = one prompt per pair)
+CONFLICT_BATCH_SIZE = 10
+
+# Batches of different clusters and user groups are independent, so they are compared concurrently
+MAX_CONFLICT_WORKERS = 6
+
+# Stage name of these verdicts in the cross-run verdict memo
+VERDICT_MEMO_STAGE = "functional_conflicts_within"
+
+
+def identify_functional_conflicts_within_one_group(
+    user_story_loader: Optional[UserStoryLoader] = None,
+    use_candidate_blocking: bool = False,
+    batch_size: int = CONFLICT_BATCH_SIZE,
+    use_verdict_memo: bool = True,
+):
     utils = Utils()
     
     os.makedirs(utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, exist_ok=True)
 
-    # Skip if all user group files already exist
+    # Skip if all user group files already exist (with the verdict memo: once they are resolved, or no story pair is new to it)
     existing_files = set(f for f in os.listdir(utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR) if f.endswith(".json"))
-    if len(existing_files) >= len(utils.get_user_groups()):
+    all_files_exist = len(existing_files) >= len(utils.get_user_groups())
+    if all_files_exist and not use_verdict_memo:
         print("✅ Skipping functional user story conflict identification — all group JSONs already exist.")
         return
+    if all_files_exist and conflicts_resolved(utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR):
+        print("✅ Skipping functional user story conflict identification — all group JSONs already exist and are resolved.")
+        return
 
     loader = user_story_loader if user_story_loader else UserStoryLoader()
     loader.load_all_user_stories()
@@ -40,7 +66,6 @@ def identify_functional_conflicts_within_one_group(user_story_loader: Optional[U
     user_story_guidelines = utils.load_user_story_guidelines()
     conflict_technique_summary = utils.load_functional_user_story_conflict_technique_description()
 
-    conflict_id_counter = 1
     user_group_keys = utils.load_user_group_keys()
     user_groups = utils.get_user_groups()
     all_conflicts_by_group = {user_group_keys[g]: [] for g in user_groups}
@@ -48,7 +73,30 @@ def identify_functional_conflicts_within_one_group(user_story_loader: Optional[U
     # Load LLM response language proficiency level
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
-    # For each cluster, process conflicts by user group
+    memo = None
+    if use_verdict_memo:
+        memo = ConflictVerdictMemo(
+            VERDICT_MEMO_STAGE, (conflict_technique_summary, system_context, user_story_guidelines, proficiency_level)
+        )
+        if all_files_exist and len(memo) == 0:
+            # Results from before the memo (or from another technique) are kept as they are
+            print("✅ Skipping functional user story conflict identification — all group JSONs already exist.")
+            memo.close()
+            return
+
+    # Conflicts of earlier runs keep their record and verification; stories rewritten by their resolution
+    # (within, then across groups) are hashed with the summary they were identified on
+    recorded = RecordedConflicts(
+        utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, utils.INVALID_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR
+    )
+    summaries = identified_summaries(
+        recorded.records + load_conflict_records(utils.FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR), functional_stories
+    )
+
+    # One work item per story and batch of its candidates, across all clusters and user groups
+    work_items = []
+    remembered = []
+    story_hashes = {}
     for cluster, stories_in_cluster in cluster_map.items():
         # Group stories by user group within this cluster
         group_map = defaultdict(list)
@@ -83,33 +131,120 @@ def identify_functional_conflicts_within_one_group(user_story_loader: Optional[U
             storiesA = persona_map[personaA]
             storiesB = persona_map[personaB]
 
-            # Nested loop compare all user stories from personaA to personaB
-            for storyA in storiesA:
-                for storyB in storiesB:
-                    prompt = build_conflict_prompt(
-                        conflict_technique_summary,
-                        system_context,
-                        user_story_guidelines,
-                        storyA,
-                        storyB,
-                        cluster,
-                        user_group,
-                        proficiency_level,
-                    )
-                    response = utils.get_llm_response(prompt)
-                    parsed = parse_conflict_response(
-                        response, conflict_id_counter, storyA, storyB, cluster, user_group
-                    )
-                    if parsed:
-                        all_conflicts_by_group[user_group_keys[user_group]].append(parsed)
-                        conflict_id_counter += 1
-
-    # Save conflicts per user group
+            # Compare user stories from personaA to personaB: every pair, or only the locally ranked candidates
+            if use_candidate_blocking:
+                pairs = select_candidate_pairs(storiesA, storiesB)
+                skipped = len(storiesA) * len(storiesB) - len(pairs)
+                if skipped:
+                    print(f"   ➤ '{cluster}' / {user_group}: {len(pairs)} candidate pair(s) sent to LLM, {skipped} skipped by local blocking")
+            else:
+                pairs = [(storyA, storyB) for storyA in storiesA for storyB in storiesB]
+
+            # Pairs judged in an earlier run keep their verdict, only the others go to the LLM
+            if memo is not None:
+                for story in storiesA + storiesB:
+                    story_hashes[story.id] = story_hash(story, cluster, summary=summaries.get(story.id))
+                block_remembered, pairs = memo.split(pairs, story_hashes)
+                remembered.extend((storyA, storyB, verdict, cluster, user_group) for storyA, storyB, verdict in block_remembered)
+
+            for anchor, candidates, anchor_is_a in comparison_batches(pairs, batch_size):
+                work_items.append((cluster, user_group, anchor, candidates, anchor_is_a))
+
+    def run_item(item) -> List[Tuple[UserStory, UserStory, dict, str, str]]:
+        cluster, user_group, anchor, candidates, anchor_is_a = item
+        found = compare_story_with_candidates(
+            utils, conflict_technique_summary, system_context, user_story_guidelines,
+            anchor, candidates, anchor_is_a, cluster, user_group, proficiency_level,
+        )
+        return [(storyA, storyB, verdict, cluster, user_group) for storyA, storyB, verdict in found]
+
+    if memo is not None and all_files_exist and not work_items:
+        print(f"✅ Skipping functional user story conflict identification — all group JSONs exist and all {len(remembered)} story pairs are unchanged.")
+        memo.close()
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONFLICT_WORKERS, len(work_items)))) as executor:
+        judged = [verdict for item_verdicts in executor.map(run_item, work_items) for verdict in item_verdicts]
+
+    if memo is not None:
+        for storyA, storyB, verdict, _, _ in judged:
+            memo.put(story_hashes[storyA.id], story_hashes[storyB.id], verdict)
+        print(f"   ➤ {len(remembered)} story pair verdict(s) reused from earlier runs, {memo.save()} new one(s) remembered")
+        memo.close()
+
+    found = [conflict for conflict in remembered + judged if conflict[2]]
+
+    # New conflict IDs follow story ID order, so they do not depend on how the work was scheduled
+    found.sort(key=lambda conflict: (conflict[0].id, conflict[1].id))
+    for storyA, storyB, verdict, cluster, user_group in found:
+        parsed = recorded.carry_over(
+            storyA, storyB, lambda number: annotate_conflict(verdict, number, storyA, storyB, cluster, user_group)
+        )
+        if parsed is not None:
+            all_conflicts_by_group[user_group_keys[user_group]].append(parsed)
+
+    # Conflict files are written through the artifact store
+    store = ArtifactStore()
     for group_key, conflicts in all_conflicts_by_group.items():
         path = os.path.join(utils.FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, f"{group_key}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(conflicts, f, indent=2, ensure_ascii=False)
+        store.write_file(path, conflicts)
         print(f"✅ Saved {len(conflicts)} conflicts for user group {group_key} at {path}")
+    store.close()
+
+
+def compare_story_with_candidates(
+    utils: Utils,
+    technique_summary: str,
+    system_context: str,
+    user_story_guidelines: str,
+    anchor,
+    candidates,
+    anchor_is_a: bool,
+    cluster: str,
+    user_group: str,
+    proficiency_level: str = ""
+) -> List[Tuple[UserStory, UserStory, dict]]:
+    """
+    Verdicts of one story against its candidates as (story A, story B, verdict), from one batch prompt or per-pair prompts.
+    A verdict is the conflict, or {} for no conflict. Pairs whose reply could not be read are left out.
+    """
+    verdicts = None
+    if len(candidates) > 1:
+        prompt = build_batch_conflict_prompt(
+            technique_summary,
+            system_context,
+            user_story_guidelines,
+            anchor,
+            candidates,
+            cluster,
+            user_group,
+            proficiency_level,
+        )
+        verdicts = parse_batch_conflict_response(utils.get_llm_response(prompt), anchor, candidates)
+
+    found = []
+    for candidate in candidates:
+        storyA, storyB = (anchor, candidate) if anchor_is_a else (candidate, anchor)
+        if verdicts is not None:
+            verdict = verdicts.get(candidate.id, {})
+            if not verdict:
+                print(f"ℹ️ No conflict found between {storyA.id} and {storyB.id}")
+        else:
+            # Single candidate, or unreadable batch reply – one prompt for this pair
+            prompt = build_conflict_prompt(
+                technique_summary,
+                system_context,
+                user_story_guidelines,
+                storyA,
+                storyB,
+                cluster,
+                user_group,
+                proficiency_level,
+            )
+            verdict = parse_conflict_response(utils.get_llm_response(prompt), storyA, storyB)
+        if verdict is not None:
+            found.append((storyA, storyB, verdict))
+    return found
 
 
 def build_conflict_prompt(
@@ -174,7 +309,79 @@ Strictly, do not include commentary or extra text outside the JSON. Do NOT use a
 """
 
 
-def parse_conflict_response(raw: str, conflict_id_counter: int, storyA, storyB, cluster: str, user_group: str) -> Optional[dict]:
+def build_batch_conflict_prompt(
+    technique_summary: str,
+    system_context: str,
+    user_story_guidelines: str,
+    storyA,
+    candidates,
+    cluster: str,
+    user_group: str,
+    proficiency_level: str = ""
+) -> str:
+    candidates_text = "\n".join(
+        f"- ID: {s.id}\n  Persona: {s.persona}\n  Title: {s.title}\n  Summary: {s.summary}"
+        for s in candidates
+    )
+
+    return f"""
+You are an expert in functional user story conflict analysis. You are identifying conflicts between one functional user story and several other functional user stories within the same user group and cluster.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+-------------------------------------
+
+--- IDENTIFICATION TECHNIQUE ---
+Apply the Chentouf technique for identifying functional user story conflicts (within one user group):
+{technique_summary}
+-------------------------------------
+
+--- USER STORY GUIDELINES ---
+{user_story_guidelines}
+-------------------------------------
+
+--- YOUR TASK ---
+Compare User Story A with EACH of the candidate FUNCTIONAL user stories below. The candidates belong to a different persona than User Story A, but within the same user group and cluster:
+Cluster: {cluster}
+User Group: {user_group}
+
+User Story A:
+- ID: {storyA.id}
+- Persona: {storyA.persona}
+- Title: {storyA.title}
+- Summary: {storyA.summary}
+
+Candidate User Stories:
+{candidates_text}
+
+TASK:
+Judge each candidate independently against User Story A. If you think there is a conflict between User Story A and a candidate, identify it according to the Chentouf conflict types (Start-Forbid, Forbid-stop, Two Condition Events, Two Operation Frequencies Conflict).
+Note that, please strictly follow the definition of conflict between two user stories in the Chentouf's technique summary. Do not consider diversity of user preferences or slight differences in user stories as a conflict.
+If you think the conflict found is a mild or nuanced one, it is likely that the user stories are not conflicting at all. In that case, leave that candidate out of your response.
+
+Only respond with a valid JSON list containing one object per conflicting candidate, with the following structure:
+
+[
+  {{
+    "storyId": "The ID of the conflicting candidate user story",
+    "conflictType": "Start-Forbid" or "Forbid-stop" or "Two Condition Events" or "Two Operation Frequencies Conflict",
+    "conflictDescription": "A short (1–3 sentence) description of why this is a conflict and/or why this conflict type was determined."
+  }}
+]
+
+If no candidate conflicts with User Story A, respond with an empty JSON list: []
+
+Strictly, do not include commentary or extra text outside the JSON. Do NOT use any markdown, bold, italic, or special formatting in your response.
+-------------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+"""
+
+
+def parse_conflict_response(raw: str, storyA, storyB) -> Optional[dict]:
+    """The conflict in an LLM reply, {} for no conflict, or None if the reply is unreadable."""
     try:
         # Strip possible markdown/code blocks
         raw = re.sub(r"```(json)?", "", raw).strip()
@@ -183,21 +390,53 @@ def parse_conflict_response(raw: str, conflict_id_counter: int, storyA, storyB,
         # If empty JSON or missing keys -> no conflict
         if not parsed or not parsed.get("conflictType") or not parsed.get("conflictDescription"):
             print(f"ℹ️ No conflict found between {storyA.id} and {storyB.id}")
-            return None
-
-        parsed["conflictId"] = f"FCWI-{conflict_id_counter:03d}"
-        parsed["personaAId"] = storyA.persona
-        parsed["personaBId"] = storyB.persona
-        parsed["userGroup"] = user_group
-        parsed["userStoryAId"] = storyA.id
-        parsed["userStoryBId"] = storyB.id
-        parsed["userStoryASummary"] = storyA.summary
-        parsed["userStoryBSummary"] = storyB.summary
-        parsed["cluster"] = cluster
-
-        print(f"✅ Found conflict {parsed['conflictId']} between {storyA.id} and {storyB.id}")
+            return {}
+
         return parsed
     except Exception as e:
         print(f"❌ Failed to parse conflict response: {e}")
         print(f"Raw response: {raw[:300]}")
         return None
+
+
+def parse_batch_conflict_response(raw: str, storyA, candidates) -> Optional[Dict[str, dict]]:
+    """Detected conflicts keyed by candidate story ID. None if the reply is unreadable."""
+    try:
+        raw = re.sub(r"```(json)?", "", raw).strip()
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict):
+            parsed = [parsed] if parsed else []
+        if not isinstance(parsed, list):
+            raise ValueError("Expected a JSON list of conflicts.")
+    except Exception as e:
+        print(f"⚠️ Batch conflict identification failed for {storyA.id} against {len(candidates)} stories: {e}")
+        return None
+
+    candidate_ids = {s.id for s in candidates}
+    conflicts = {}
+    for entry in parsed:
+        if not isinstance(entry, dict) or entry.get("storyId") not in candidate_ids:
+            continue
+        if not entry.get("conflictType") or not entry.get("conflictDescription"):
+            continue
+        conflicts[entry["storyId"]] = {
+            "conflictType": entry["conflictType"],
+            "conflictDescription": entry["conflictDescription"],
+        }
+    return conflicts
+
+
+def annotate_conflict(conflict: dict, conflict_id_counter: int, storyA, storyB, cluster: str, user_group: str) -> dict:
+    """Attach the conflict ID and the compared stories to a conflict verdict."""
+    conflict["conflictId"] = f"FCWI-{conflict_id_counter:03d}"
+    conflict["personaAId"] = storyA.persona
+    conflict["personaBId"] = storyB.persona
+    conflict["userGroup"] = user_group
+    conflict["userStoryAId"] = storyA.id
+    conflict["userStoryBId"] = storyB.id
+    conflict["userStoryASummary"] = storyA.summary
+    conflict["userStoryBSummary"] = storyB.summary
+    conflict["cluster"] = cluster
+
+    print(f"✅ Found conflict {conflict['conflictId']} between {storyA.id} and {storyB.id}")
+    return conflict
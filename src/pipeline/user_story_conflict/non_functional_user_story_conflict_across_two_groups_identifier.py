@@ -2,21 +2,30 @@ import os
 import json
 import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
+from pipeline.artifact_store import ArtifactStore
 from pipeline.user_story.user_story_loader import UserStoryLoader, UserStory
-from pipeline.utils import Utils
+from pipeline.user_story_conflict.user_story_conflict_candidate_selector import comparison_batches
+from pipeline.user_story_conflict.user_story_conflict_verdict_memo import ConflictVerdictMemo, RecordedConflicts, identified_summaries, story_hash
+from pipeline.utils import Utils, load_json
 
 
-def load_json_file(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Number of candidate stories compared with one story per LLM call (1 = one prompt per pair).
+# Kept below the functional one, since every candidate carries its NFR decomposition.
+CONFLICT_BATCH_SIZE = 5
+
+# Batches of different clusters and group pairs are independent, so they are compared concurrently
+MAX_CONFLICT_WORKERS = 6
+
+# Stage name of these verdicts in the cross-run verdict memo
+VERDICT_MEMO_STAGE = "non_functional_conflicts_across"
 
 
-def save_json_file(path: str, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def load_json_file(path: str):
+    return load_json(path)
 
 
 def build_conflict_prompt(
@@ -106,15 +115,94 @@ Only include actual conflicting NFR pairs. Do not include commentary or extra te
     return prompt
 
 
-def parse_conflict_response(
-    raw: str,
-    conflict_id_counter: int,
-    sa: UserStory,
-    sb: UserStory,
+def build_batch_conflict_prompt(
+    technique_summary: str,
+    system_context: str,
+    user_group_guidelines_A: str,
+    user_group_guidelines_B: str,
+    user_story_guidelines: str,
+    story_a: UserStory,
+    candidates: List[UserStory],
     cluster: str,
-    user_group_A: str,
-    user_group_B: str,
-) -> Optional[dict]:
+    decomposed_map: dict,
+    proficiency_level: str = "",
+) -> str:
+    candidates_text = "\n\n".join(
+        f"Candidate User Story (ID: {s.id}, Persona: {s.persona}, User Group: {s.user_group}):\n"
+        f"- Title: {s.title}\n"
+        f"- Summary: {s.summary}\n"
+        f"- Decomposed NFRs:\n{json.dumps(decomposed_map[s.id]['decomposition'], indent=2)}"
+        for s in candidates
+    )
+
+    prompt = f"""
+You are an expert in non-functional requirement analysis. You are identifying conflicts between one non-functional user story and several non-functional user stories of another user group in a software system.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+---------------------------------
+
+--- TECHNIQUE SUMMARY ---
+Apply the Sadana and Liu technique for indentifying non-functional requirement (a.k.a user story) conflicts (across two different user groups):
+{technique_summary}
+
+--- USER GROUP GUIDELINES ---
+- Guidelines of the User Group of User Story A:
+{user_group_guidelines_A}
+
+- Guidelines of the User Group of the candidates:
+{user_group_guidelines_B}
+---------------------------------
+
+--- USER STORY GUIDELINES ---
+{user_story_guidelines}
+---------------------------------
+
+--- YOUR TASK ---
+Cluster of the user stories below: {cluster}
+Compare User Story A with EACH of the candidate non-functional user stories below, judging every candidate independently. Report any conflicts between User Story A and a candidate using the Sadana and Liu's technique mentioned above, focusing on the lowest-level non-functional (decomposed) user stories.
+
+Note that, please strictly follow the definition of conflict between two user stories in the technique summary. Do not consider diversity of user preferences or slight differences in user stories as a conflict.
+If you think the conflict found is a mild or nuanced one, it is likely that the user stories are not conflicting at all. In that case, leave that candidate out of your response.
+
+Do NOT attempt to propose resolutions. Only identify clear contradictions or incompatible goals.
+
+User Story A (ID: {story_a.id}, Persona: {story_a.persona}, User Group: {story_a.user_group}):
+- Title: {story_a.title}
+- Summary: {story_a.summary}
+- Decomposed NFRs:
+{json.dumps(decomposed_map[story_a.id]["decomposition"], indent=2)}
+
+{candidates_text}
+
+Format your answer strictly as a JSON list containing one object per conflicting candidate:
+
+[
+  {{
+    "storyId": "<ID of the conflicting candidate user story>",
+    "conflictType": "Mutually Exclusive" or "Partial",
+    "conflictDescription": "[A short (1–3 sentence) description of why this is a conflict, and/or why this conflict type is determined]",
+    "conflictingNfrPairs": [
+      ["<lowest-level NFR from A>", "<lowest-level NFR from the candidate>"],
+      ...
+    ]
+  }}
+]
+
+If no candidate conflicts with User Story A, respond with an empty JSON list: []
+
+Only include actual conflicting NFR pairs. Do not include commentary or extra text outside the JSON. Do NOT use any markdown, bold, italic, or special formatting in your response.
+----------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+""".strip()
+    return prompt
+
+
+def parse_conflict_response(raw: str, sa: UserStory, sb: UserStory) -> Optional[dict]:
+    """The conflict in an LLM reply, {} for no conflict, or None if the reply is unreadable."""
     try:
         raw = re.sub(r"```(json)?", "", raw).strip()
         parsed = json.loads(raw)
@@ -126,24 +214,11 @@ def parse_conflict_response(
             or len(parsed["conflictingNfrPairs"]) == 0
         ):
             print(f"ℹ️ No conflict found between {sa.id} and {sb.id}")
-            return None
+            return {}
 
         if not parsed.get("conflictType") or not parsed.get("conflictDescription"):
             raise ValueError("Missing required conflict fields in LLM output")
 
-        parsed["conflictId"] = f"NFCAT-{conflict_id_counter:03d}"
-        parsed["personaAId"] = sa.persona
-        parsed["personaBId"] = sb.persona
-        parsed["userGroupA"] = user_group_A
-        parsed["userGroupB"] = user_group_B
-        parsed["userStoryAId"] = sa.id
-        parsed["userStoryBId"] = sb.id
-        parsed["userStoryASummary"] = sa.summary
-        parsed["userStoryBSummary"] = sb.summary
-        parsed["cluster"] = cluster
-
-        print(f"✅ Found conflict {parsed['conflictId']} between {sa.id} and {sb.id}")
-
         return parsed
 
     except Exception as e:
@@ -152,8 +227,141 @@ def parse_conflict_response(
         return None
 
 
+def parse_batch_conflict_response(raw: str, sa: UserStory, candidates: List[UserStory]) -> Optional[Dict[str, dict]]:
+    """Detected conflicts keyed by candidate story ID. None if the reply is unreadable."""
+    try:
+        raw = re.sub(r"```(json)?", "", raw).strip()
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict):
+            parsed = [parsed] if parsed else []
+        if not isinstance(parsed, list):
+            raise ValueError("Expected a JSON list of conflicts.")
+    except Exception as e:
+        print(f"⚠️ Batch conflict identification failed for {sa.id} against {len(candidates)} stories: {e}")
+        return None
+
+    candidate_ids = {s.id for s in candidates}
+    conflicts = {}
+    for entry in parsed:
+        if not isinstance(entry, dict) or entry.get("storyId") not in candidate_ids:
+            continue
+        nfr_pairs = entry.get("conflictingNfrPairs")
+        if not nfr_pairs or not isinstance(nfr_pairs, list):
+            continue
+        if not entry.get("conflictType") or not entry.get("conflictDescription"):
+            continue
+        conflicts[entry["storyId"]] = {
+            "conflictType": entry["conflictType"],
+            "conflictDescription": entry["conflictDescription"],
+            "conflictingNfrPairs": nfr_pairs,
+        }
+    return conflicts
+
+
+def orient_nfr_pairs(verdict: dict) -> dict:
+    """Swap the NFR pairs of a verdict found with story B as the anchor, so each pair reads (A, B) again."""
+    verdict["conflictingNfrPairs"] = [list(reversed(pair)) for pair in verdict["conflictingNfrPairs"]]
+    return verdict
+
+
+def annotate_conflict(
+    conflict: dict,
+    conflict_id_counter: int,
+    sa: UserStory,
+    sb: UserStory,
+    cluster: str,
+    user_group_A: str,
+    user_group_B: str,
+) -> dict:
+    """Attach the conflict ID and the compared stories to a conflict verdict."""
+    conflict["conflictId"] = f"NFCAT-{conflict_id_counter:03d}"
+    conflict["personaAId"] = sa.persona
+    conflict["personaBId"] = sb.persona
+    conflict["userGroupA"] = user_group_A
+    conflict["userGroupB"] = user_group_B
+    conflict["userStoryAId"] = sa.id
+    conflict["userStoryBId"] = sb.id
+    conflict["userStoryASummary"] = sa.summary
+    conflict["userStoryBSummary"] = sb.summary
+    conflict["cluster"] = cluster
+
+    print(f"✅ Found conflict {conflict['conflictId']} between {sa.id} and {sb.id}")
+
+    return conflict
+
+
+def compare_story_with_candidates(
+    utils: Utils,
+    technique_summary: str,
+    system_context: str,
+    user_group_guidelines_A: str,
+    user_group_guidelines_B: str,
+    user_story_guidelines: str,
+    anchor: UserStory,
+    candidates: List[UserStory],
+    anchor_is_a: bool,
+    cluster: str,
+    decomposed_map: dict,
+    proficiency_level: str = "",
+) -> List[Tuple[UserStory, UserStory, dict]]:
+    """
+    Verdicts of one story against its candidates as (story A, story B, verdict), from one batch prompt or per-pair prompts.
+    A verdict is the conflict, or {} for no conflict. Pairs whose reply could not be read are left out.
+    """
+    verdicts = None
+    if len(candidates) > 1:
+        if anchor_is_a:
+            anchor_guidelines, candidate_guidelines = user_group_guidelines_A, user_group_guidelines_B
+        else:
+            anchor_guidelines, candidate_guidelines = user_group_guidelines_B, user_group_guidelines_A
+        prompt = build_batch_conflict_prompt(
+            technique_summary,
+            system_context,
+            anchor_guidelines,
+            candidate_guidelines,
+            user_story_guidelines,
+            anchor,
+            candidates,
+            cluster,
+            decomposed_map,
+            proficiency_level,
+        )
+        verdicts = parse_batch_conflict_response(utils.get_llm_response(prompt), anchor, candidates)
+
+    found = []
+    for candidate in candidates:
+        sa, sb = (anchor, candidate) if anchor_is_a else (candidate, anchor)
+        if verdicts is not None:
+            verdict = verdicts.get(candidate.id, {})
+            if not verdict:
+                print(f"ℹ️ No conflict found between {sa.id} and {sb.id}")
+            elif not anchor_is_a:
+                verdict = orient_nfr_pairs(verdict)
+        else:
+            # Single candidate, or unreadable batch reply – one prompt for this pair
+            prompt = build_conflict_prompt(
+                technique_summary,
+                system_context,
+                user_group_guidelines_A,
+                user_group_guidelines_B,
+                user_story_guidelines,
+                sa,
+                sb,
+                cluster,
+                decomposed_map[sa.id]["decomposition"],
+                decomposed_map[sb.id]["decomposition"],
+                proficiency_level,
+            )
+            verdict = parse_conflict_response(utils.get_llm_response(prompt), sa, sb)
+        if verdict is not None:
+            found.append((sa, sb, verdict))
+    return found
+
+
 def identify_non_functional_conflicts_across_two_groups(
     user_story_loader: UserStoryLoader = None,
+    batch_size: int = CONFLICT_BATCH_SIZE,
+    use_verdict_memo: bool = True,
 ):
     utils = Utils()
 
@@ -176,12 +384,30 @@ def identify_non_functional_conflicts_across_two_groups(
 
     system_context = utils.load_system_context()
     user_story_guidelines = utils.load_user_story_guidelines()
+    technique_summary = utils.load_non_functional_user_story_conflict_technique_description()
+
+    user_group_keys = utils.load_user_group_keys()
 
-    conflict_id_counter = 1
-    
     # Load language proficiency level
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
+    memo = None
+    if use_verdict_memo:
+        memo = ConflictVerdictMemo(
+            VERDICT_MEMO_STAGE, (technique_summary, system_context, user_story_guidelines, proficiency_level)
+        )
+
+    # Conflicts of earlier runs keep their record and verification; stories rewritten by their resolution
+    # are hashed with the summary they were identified on
+    recorded = RecordedConflicts(
+        utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, utils.INVALID_NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR
+    )
+    summaries = identified_summaries(recorded.records, non_functional_stories)
+
+    # One work item per story and batch of its candidates, across all clusters and group pairs
+    work_items = []
+    remembered = []
+    story_hashes = {}
     for cluster, stories in cluster_map.items():
         # Group stories by user group inside the cluster
         group_map = defaultdict(list)
@@ -194,8 +420,6 @@ def identify_non_functional_conflicts_across_two_groups(
 
         groups_in_cluster = sorted(group_map.keys())
 
-        user_group_keys = utils.load_user_group_keys()
-
         # Generate all unique pairs of user groups
         for groupA, groupB in combinations(groups_in_cluster, 2):
             groupA_stories = group_map[groupA]
@@ -205,63 +429,78 @@ def identify_non_functional_conflicts_across_two_groups(
             user_group_guidelines_A = utils.load_user_group_description(user_group_keys[groupA])
             user_group_guidelines_B = utils.load_user_group_description(user_group_keys[groupB])
 
-            conflicts = []
-
-            for sa in groupA_stories:
-                for sb in groupB_stories:
-                    if sa.id not in decomposed_map or sb.id not in decomposed_map:
-                        continue
-                    prompt = build_conflict_prompt(
-                        utils.load_non_functional_user_story_conflict_technique_description(),
-                        system_context,
-                        user_group_guidelines_A,
-                        user_group_guidelines_B,
-                        user_story_guidelines,
-                        sa,
-                        sb,
-                        cluster,
-                        decomposed_map[sa.id]["decomposition"],
-                        decomposed_map[sb.id]["decomposition"],
-                        proficiency_level,
-                    )
-                    response = utils.get_llm_response(prompt)
-                    conflict = parse_conflict_response(
-                        response,
-                        conflict_id_counter,
-                        sa,
-                        sb,
-                        cluster,
-                        groupA,
-                        groupB,
-                    )
-                    if conflict:
-                        conflicts.append(conflict)
-                        conflict_id_counter += 1
-
-            if conflicts:
-                filename = f"{user_group_keys[groupA]}_vs_{user_group_keys[groupB]}.json"
-                path = os.path.join(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, filename)
-
-                # Read existing conflicts to merge
-                existing_conflicts = []
-                if os.path.exists(path):
-                    try:
-                        with open(path, "r", encoding="utf-8") as f:
-                            existing_conflicts = json.load(f)
-                    except Exception as e:
-                        print(f"⚠️ Failed to load existing conflict file {filename}: {e}")
-
-                # Merge and deduplicate by sorted pair of userStory IDs
-                combined_conflicts = existing_conflicts + conflicts
-                unique_conflicts = []
-                seen_pairs = set()
-                for c in combined_conflicts:
-                    pair = tuple(sorted([c["userStoryAId"], c["userStoryBId"]]))
-                    if pair not in seen_pairs:
-                        seen_pairs.add(pair)
-                        unique_conflicts.append(c)
-
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(unique_conflicts, f, indent=2, ensure_ascii=False)
-
-                print(f"✅ Saved {len(conflicts)} new conflicts between {groupA} and {groupB} to {filename}")
\ No newline at end of file
+            pairs = [
+                (sa, sb) for sa in groupA_stories for sb in groupB_stories
+                if sa.id in decomposed_map and sb.id in decomposed_map
+            ]
+
+            # Pairs judged in an earlier run keep their verdict, only the others go to the LLM
+            if memo is not None:
+                for stories, guidelines in ((groupA_stories, user_group_guidelines_A), (groupB_stories, user_group_guidelines_B)):
+                    for story in stories:
+                        if story.id in decomposed_map:
+                            decomposition = json.dumps(decomposed_map[story.id]["decomposition"], sort_keys=True)
+                            story_hashes[story.id] = story_hash(story, cluster, decomposition, guidelines, summary=summaries.get(story.id))
+                block_remembered, pairs = memo.split(pairs, story_hashes)
+                remembered.extend((sa, sb, verdict, cluster, groupA, groupB) for sa, sb, verdict in block_remembered)
+
+            for anchor, candidates, anchor_is_a in comparison_batches(pairs, batch_size):
+                work_items.append((
+                    cluster, groupA, groupB, user_group_guidelines_A, user_group_guidelines_B,
+                    anchor, candidates, anchor_is_a,
+                ))
+
+    def run_item(item) -> List[Tuple[UserStory, UserStory, dict, str, str, str]]:
+        cluster, groupA, groupB, user_group_guidelines_A, user_group_guidelines_B, anchor, candidates, anchor_is_a = item
+        found = compare_story_with_candidates(
+            utils, technique_summary, system_context, user_group_guidelines_A, user_group_guidelines_B,
+            user_story_guidelines, anchor, candidates, anchor_is_a, cluster, decomposed_map, proficiency_level,
+        )
+        return [(sa, sb, verdict, cluster, groupA, groupB) for sa, sb, verdict in found]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONFLICT_WORKERS, len(work_items)))) as executor:
+        judged = [verdict for item_verdicts in executor.map(run_item, work_items) for verdict in item_verdicts]
+
+    if memo is not None:
+        for sa, sb, verdict, _, _, _ in judged:
+            memo.put(story_hashes[sa.id], story_hashes[sb.id], verdict)
+        print(f"   ➤ {len(remembered)} story pair verdict(s) reused from earlier runs, {memo.save()} new one(s) remembered")
+        memo.close()
+
+    found = [conflict for conflict in remembered + judged if conflict[2]]
+
+    # New conflict IDs follow story ID order, so they do not depend on how the work was scheduled
+    found.sort(key=lambda conflict: (conflict[0].id, conflict[1].id))
+    conflicts_by_group_pair = defaultdict(list)
+    for sa, sb, verdict, cluster, groupA, groupB in found:
+        conflict = recorded.carry_over(sa, sb, lambda number: annotate_conflict(verdict, number, sa, sb, cluster, groupA, groupB))
+        if conflict is not None:
+            conflicts_by_group_pair[(groupA, groupB)].append(conflict)
+
+    # One merge and write per group-pair file, through the artifact store
+    store = ArtifactStore()
+    for (groupA, groupB), conflicts in sorted(conflicts_by_group_pair.items()):
+        filename = f"{user_group_keys[groupA]}_vs_{user_group_keys[groupB]}.json"
+        path = os.path.join(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR, filename)
+
+        # Read existing conflicts to merge
+        existing_conflicts = []
+        try:
+            existing_conflicts = store.read_file(path)
+        except Exception as e:
+            print(f"⚠️ Failed to load existing conflict file {filename}: {e}")
+
+        # Merge and deduplicate by sorted pair of userStory IDs
+        combined_conflicts = existing_conflicts + conflicts
+        unique_conflicts = []
+        seen_pairs = set()
+        for c in combined_conflicts:
+            pair = tuple(sorted([c["userStoryAId"], c["userStoryBId"]]))
+            if pair not in seen_pairs:
+                seen_pairs.add(pair)
+                unique_conflicts.append(c)
+
+        store.write_file(path, unique_conflicts)
+
+        print(f"✅ Saved {len(conflicts)} new conflicts between {groupA} and {groupB} to {filename}")
+    store.close()
@@ -2,23 +2,49 @@ import os
 import json
 import re
 from collections import defaultdict
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
+from pipeline.artifact_store import ArtifactStore
 from pipeline.user_story.user_story_loader import UserStoryLoader, UserStory
+from pipeline.user_story_conflict.user_story_conflict_candidate_selector import comparison_batches
+from pipeline.user_story_conflict.user_story_conflict_verdict_memo import (
+    ConflictVerdictMemo, RecordedConflicts, conflicts_resolved, identified_summaries, load_conflict_records, story_hash,
+)
 from pipeline.utils import Utils
 
 
-def identify_non_functional_conflicts_within_one_group(user_story_loader: Optional[UserStoryLoader] = None):
+# Number of candidate stories compared with one story per LLM call (1 = one prompt per pair).
+# Kept below the functional one, since every candidate carries its NFR decomposition.
+CONFLICT_BATCH_SIZE = 5
+
+# Batches of different clusters and user groups are independent, so they are compared concurrently
+MAX_CONFLICT_WORKERS = 6
+
+# Stage name of these verdicts in the cross-run verdict memo
+VERDICT_MEMO_STAGE = "non_functional_conflicts_within"
+
+
+def identify_non_functional_conflicts_within_one_group(
+    user_story_loader: Optional[UserStoryLoader] = None,
+    batch_size: int = CONFLICT_BATCH_SIZE,
+    use_verdict_memo: bool = True,
+):
     utils = Utils()
     os.makedirs(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, exist_ok=True)
 
     user_groups = utils.get_user_groups()
     user_group_keys = utils.load_user_group_keys()
 
+    # Skip if all user group files already exist (with the verdict memo: once they are resolved, or no story pair is new to it)
     existing_files = set(f for f in os.listdir(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR) if f.endswith(".json"))
-    if len(existing_files) >= len(user_groups):
+    all_files_exist = len(existing_files) >= len(user_groups)
+    if all_files_exist and not use_verdict_memo:
         print("✅ Skipping conflict identification — all group JSONs already exist.")
         return
+    if all_files_exist and conflicts_resolved(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR):
+        print("✅ Skipping conflict identification — all group JSONs already exist and are resolved.")
+        return
 
     # Load decomposed user stories
     with open(utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH, "r", encoding="utf-8") as f:
@@ -38,12 +64,35 @@ def identify_non_functional_conflicts_within_one_group(user_story_loader: Option
     user_story_guidelines = utils.load_user_story_guidelines()
     technique_summary = utils.load_non_functional_user_story_conflict_technique_description()
 
-    conflict_id_counter = 1
     all_conflicts_by_group = {user_group_keys[g]: [] for g in user_groups}
     
     # Load LLM response language proficiency level
     proficiency_level = utils.load_llm_response_language_proficiency_level()
 
+    memo = None
+    if use_verdict_memo:
+        memo = ConflictVerdictMemo(
+            VERDICT_MEMO_STAGE, (technique_summary, system_context, user_story_guidelines, proficiency_level)
+        )
+        if all_files_exist and len(memo) == 0:
+            # Results from before the memo (or from another technique) are kept as they are
+            print("✅ Skipping conflict identification — all group JSONs already exist.")
+            memo.close()
+            return
+
+    # Conflicts of earlier runs keep their record and verification; stories rewritten by their resolution
+    # (within, then across groups) are hashed with the summary they were identified on
+    recorded = RecordedConflicts(
+        utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, utils.INVALID_NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR
+    )
+    summaries = identified_summaries(
+        recorded.records + load_conflict_records(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR), non_functional_stories
+    )
+
+    # One work item per story and batch of its candidates, across all clusters and user groups
+    work_items = []
+    remembered = []
+    story_hashes = {}
     for cluster, stories in cluster_map.items():
         group_map = defaultdict(list)
         for s in stories:
@@ -61,6 +110,8 @@ def identify_non_functional_conflicts_within_one_group(user_story_loader: Option
             if len(persona_map) < 2:
                 continue
 
+            user_group_summary = utils.load_user_group_description(group_key)
+
             persona_ids = list(persona_map.keys())
             for i in range(len(persona_ids)):
                 for j in range(i + 1, len(persona_ids)):
@@ -69,33 +120,122 @@ def identify_non_functional_conflicts_within_one_group(user_story_loader: Option
                     stories_a = persona_map[pid_a]
                     stories_b = persona_map[pid_b]
 
-                    for sa in stories_a:
-                        for sb in stories_b:
-                            if sa.id not in decomposed_map or sb.id not in decomposed_map:
-                                continue
-                            prompt = build_conflict_prompt(
-                                technique_summary,
-                                system_context,
-                                utils.load_user_group_description(group_key),
-                                user_story_guidelines,
-                                sa,
-                                sb,
-                                cluster,
-                                decomposed_map[sa.id]["decomposition"],
-                                decomposed_map[sb.id]["decomposition"],
-                                proficiency_level
-                            )
-                            response = utils.get_llm_response(prompt)
-                            parsed = parse_conflict_response(response, conflict_id_counter, sa, sb, cluster, user_group)
-                            if parsed:
-                                all_conflicts_by_group[group_key].append(parsed)
-                                conflict_id_counter += 1
+                    pairs = [
+                        (sa, sb) for sa in stories_a for sb in stories_b
+                        if sa.id in decomposed_map and sb.id in decomposed_map
+                    ]
+
+                    # Pairs judged in an earlier run keep their verdict, only the others go to the LLM
+                    if memo is not None:
+                        for story in stories_a + stories_b:
+                            if story.id in decomposed_map:
+                                decomposition = json.dumps(decomposed_map[story.id]["decomposition"], sort_keys=True)
+                                story_hashes[story.id] = story_hash(story, cluster, decomposition, user_group_summary, summary=summaries.get(story.id))
+                        block_remembered, pairs = memo.split(pairs, story_hashes)
+                        remembered.extend((sa, sb, verdict, cluster, user_group) for sa, sb, verdict in block_remembered)
+
+                    for anchor, candidates, anchor_is_a in comparison_batches(pairs, batch_size):
+                        work_items.append((cluster, user_group, user_group_summary, anchor, candidates, anchor_is_a))
+
+    def run_item(item) -> List[Tuple[UserStory, UserStory, dict, str, str]]:
+        cluster, user_group, user_group_summary, anchor, candidates, anchor_is_a = item
+        found = compare_story_with_candidates(
+            utils, technique_summary, system_context, user_group_summary, user_story_guidelines,
+            anchor, candidates, anchor_is_a, cluster, decomposed_map, proficiency_level,
+        )
+        return [(sa, sb, verdict, cluster, user_group) for sa, sb, verdict in found]
+
+    if memo is not None and all_files_exist and not work_items:
+        print(f"✅ Skipping conflict identification — all group JSONs exist and all {len(remembered)} story pairs are unchanged.")
+        memo.close()
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONFLICT_WORKERS, len(work_items)))) as executor:
+        judged = [verdict for item_verdicts in executor.map(run_item, work_items) for verdict in item_verdicts]
+
+    if memo is not None:
+        for sa, sb, verdict, _, _ in judged:
+            memo.put(story_hashes[sa.id], story_hashes[sb.id], verdict)
+        print(f"   ➤ {len(remembered)} story pair verdict(s) reused from earlier runs, {memo.save()} new one(s) remembered")
+        memo.close()
+
+    found = [conflict for conflict in remembered + judged if conflict[2]]
 
+    # New conflict IDs follow story ID order, so they do not depend on how the work was scheduled
+    found.sort(key=lambda conflict: (conflict[0].id, conflict[1].id))
+    for sa, sb, verdict, cluster, user_group in found:
+        parsed = recorded.carry_over(sa, sb, lambda number: annotate_conflict(verdict, number, sa, sb, cluster, user_group))
+        if parsed is not None:
+            all_conflicts_by_group[user_group_keys[user_group]].append(parsed)
+
+    # Conflict files are written through the artifact store
+    store = ArtifactStore()
     for group_key, conflicts in all_conflicts_by_group.items():
         if conflicts:
             path = os.path.join(utils.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR, f"{group_key}.json")
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(conflicts, f, indent=2, ensure_ascii=False)
+            store.write_file(path, conflicts)
+    store.close()
+
+
+def compare_story_with_candidates(
+    utils: Utils,
+    technique_summary: str,
+    system_context: str,
+    user_group_summary: str,
+    user_story_guidelines: str,
+    anchor: UserStory,
+    candidates: List[UserStory],
+    anchor_is_a: bool,
+    cluster: str,
+    decomposed_map: dict,
+    proficiency_level: str = "",
+) -> List[Tuple[UserStory, UserStory, dict]]:
+    """
+    Verdicts of one story against its candidates as (story A, story B, verdict), from one batch prompt or per-pair prompts.
+    A verdict is the conflict, or {} for no conflict. Pairs whose reply could not be read are left out.
+    """
+    verdicts = None
+    if len(candidates) > 1:
+        prompt = build_batch_conflict_prompt(
+            technique_summary,
+            system_context,
+            user_group_summary,
+            user_story_guidelines,
+            anchor,
+            candidates,
+            cluster,
+            decomposed_map,
+            proficiency_level
+        )
+        verdicts = parse_batch_conflict_response(utils.get_llm_response(prompt), anchor, candidates)
+
+    found = []
+    for candidate in candidates:
+        sa, sb = (anchor, candidate) if anchor_is_a else (candidate, anchor)
+        if verdicts is not None:
+            verdict = verdicts.get(candidate.id, {})
+            if not verdict:
+                print(f"ℹ️ No conflict found between {sa.id} and {sb.id}")
+            elif not anchor_is_a:
+                verdict = orient_nfr_pairs(verdict)
+        else:
+            # Single candidate, or unreadable batch reply – one prompt for this pair
+            prompt = build_conflict_prompt(
+                technique_summary,
+                system_context,
+                user_group_summary,
+                user_story_guidelines,
+                sa,
+                sb,
+                cluster,
+                decomposed_map[sa.id]["decomposition"],
+                decomposed_map[sb.id]["decomposition"],
+                proficiency_level
+            )
+            verdict = parse_conflict_response(utils.get_llm_response(prompt), sa, sb)
+        if verdict is not None:
+            found.append((sa, sb, verdict))
+    return found
 
 
 def build_conflict_prompt(
@@ -180,7 +320,89 @@ Only include actual conflicting NFR pairs. Do not include commentary or extra te
 """.strip()
 
 
-def parse_conflict_response(raw: str, conflict_id_counter: int, sa: UserStory, sb: UserStory, cluster: str, group: str) -> Optional[dict]:
+def build_batch_conflict_prompt(
+    technique_summary: str,
+    system_context: str,
+    user_group_summary: str,
+    user_story_guidelines: str,
+    story_a: UserStory,
+    candidates: List[UserStory],
+    cluster: str,
+    decomposed_map: dict,
+    proficiency_level: str = "",
+) -> str:
+    candidates_text = "\n\n".join(
+        f"Candidate User Story (ID: {s.id}, Persona: {s.persona}):\n"
+        f"- Title: {s.title}\n"
+        f"- Summary: {s.summary}\n"
+        f"- Decomposed NFRs:\n{json.dumps(decomposed_map[s.id]['decomposition'], indent=2)}"
+        for s in candidates
+    )
+
+    return f"""
+You are an expert in non-functional requirement analysis. You are identifying conflicts between one non-functional user story and several other non-functional user stories in a software system.
+
+--- SYSTEM CONTEXT ---
+{system_context}
+------------------------------
+
+--- IDENTIFICATION TECHNIQUE ---
+Apply the Sadana and Liu technique for indentifying non-functional requirement (a.k.a user story) conflicts (within one user group):
+{technique_summary}
+------------------------------
+
+--- USER GROUP CONTEXT ---
+{user_group_summary}
+------------------------------
+
+--- USER STORY GUIDELINES ---
+{user_story_guidelines}
+------------------------------
+
+--- YOUR TASK ---
+Cluster of the user stories below: {cluster}
+Compare User Story A with EACH of the candidate non-functional user stories below, judging every candidate independently. Report any conflicts between User Story A and a candidate using the Sadana and Liu's technique mentioned above, focusing on the lowest-level non-functional (decomposed) user stories.
+
+Note that, please strictly follow the definition of conflict between two user stories in the Chentouf's technique summary. Do not consider diversity of user preferences or slight differences in user stories as a conflict.
+If you think the conflict found is a mild or nuanced one, it is likely that the user stories are not conflicting at all. In that case, leave that candidate out of your response.
+
+Do NOT attempt to propose resolutions. Only identify clear contradictions or incompatible goals.
+
+User Story A (ID: {story_a.id}, Persona: {story_a.persona}):
+- Title: {story_a.title}
+- Summary: {story_a.summary}
+- Decomposed NFRs:
+{json.dumps(decomposed_map[story_a.id]["decomposition"], indent=2)}
+
+{candidates_text}
+
+Format your answer strictly as a JSON list containing one object per conflicting candidate:
+
+[
+  {{
+    "storyId": "<ID of the conflicting candidate user story>",
+    "conflictType": "Mutually Exclusive" or "Partial",
+    "conflictDescription": "[A short (1–3 sentence) description of why this is a conflict, and/or why this conflict type is determined]",
+    "conflictingNfrPairs": [
+      ["<lowest-level NFR from A>", "<lowest-level NFR from the candidate>"],
+      ...
+    ]
+  }}
+]
+
+If no candidate conflicts with User Story A, respond with an empty JSON list: []
+
+Only include actual conflicting NFR pairs. Do not include commentary or extra text outside the JSON. Do NOT use any markdown, bold, italic, or special formatting in your response.
+------------------------------
+
+{proficiency_level}
+
+--- END OF PROMPT ---
+""".strip()
+
+
+def parse_conflict_response(raw: str, sa: UserStory, sb: UserStory) -> Optional[dict]:
+    """The conflict in an LLM reply, {} for no conflict, or None if the reply is unreadable."""
     try:
         raw = re.sub(r"```(json)?", "", raw).strip()
         parsed = json.loads(raw)
@@ -192,26 +414,68 @@ def parse_conflict_response(raw: str, conflict_id_counter: int, sa: UserStory, s
             len(parsed["conflictingNfrPairs"]) == 0
         ):
             print(f"ℹ️ No conflict found between {sa.id} and {sb.id}")
-            return None
+            return {}
 
         if not parsed.get("conflictType") or not parsed.get("conflictDescription"):
             raise ValueError("Missing required conflict fields in LLM output")
 
-        parsed["conflictId"] = f"NFCWI-{conflict_id_counter:03d}"
-        parsed["personaAId"] = sa.persona
-        parsed["personaBId"] = sb.persona
-        parsed["userGroup"] = group
-        parsed["userStoryAId"] = sa.id
-        parsed["userStoryBId"] = sb.id
-        parsed["userStoryASummary"] = sa.summary
-        parsed["userStoryBSummary"] = sb.summary
-        parsed["cluster"] = cluster
-        
-        print(f"✅ Found conflict {parsed['conflictId']} between {sa.id} and {sb.id}")
-        
         return parsed
 
     except Exception as e:
         print(f"❌ Failed to parse conflict response: {e}")
         print(f"Raw content: {raw[:300]}")
         return None
+
+
+def parse_batch_conflict_response(raw: str, sa: UserStory, candidates: List[UserStory]) -> Optional[Dict[str, dict]]:
+    """Detected conflicts keyed by candidate story ID. None if the reply is unreadable."""
+    try:
+        raw = re.sub(r"```(json)?", "", raw).strip()
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict):
+            parsed = [parsed] if parsed else []
+        if not isinstance(parsed, list):
+            raise ValueError("Expected a JSON list of conflicts.")
+    except Exception as e:
+        print(f"⚠️ Batch conflict identification failed for {sa.id} against {len(candidates)} stories: {e}")
+        return None
+
+    candidate_ids = {s.id for s in candidates}
+    conflicts = {}
+    for entry in parsed:
+        if not isinstance(entry, dict) or entry.get("storyId") not in candidate_ids:
+            continue
+        nfr_pairs = entry.get("conflictingNfrPairs")
+        if not nfr_pairs or not isinstance(nfr_pairs, list):
+            continue
+        if not entry.get("conflictType") or not entry.get("conflictDescription"):
+            continue
+        conflicts[entry["storyId"]] = {
+            "conflictType": entry["conflictType"],
+            "conflictDescription": entry["conflictDescription"],
+            "conflictingNfrPairs": nfr_pairs,
+        }
+    return conflicts
+
+
+def orient_nfr_pairs(verdict: dict) -> dict:
+    """Swap the NFR pairs of a verdict found with story B as the anchor, so each pair reads (A, B) again."""
+    verdict["conflictingNfrPairs"] = [list(reversed(pair)) for pair in verdict["conflictingNfrPairs"]]
+    return verdict
+
+
+def annotate_conflict(conflict: dict, conflict_id_counter: int, sa: UserStory, sb: UserStory, cluster: str, group: str) -> dict:
+    """Attach the conflict ID and the compared stories to a conflict verdict."""
+    conflict["conflictId"] = f"NFCWI-{conflict_id_counter:03d}"
+    conflict["personaAId"] = sa.persona
+    conflict["personaBId"] = sb.persona
+    conflict["userGroup"] = group
+    conflict["userStoryAId"] = sa.id
+    conflict["userStoryBId"] = sb.id
+    conflict["userStoryASummary"] = sa.summary
+    conflict["userStoryBSummary"] = sb.summary
+    conflict["cluster"] = cluster
+
+    print(f"✅ Found conflict {conflict['conflictId']} between {sa.id} and {sb.id}")
+
+    return conflict
@@ -4,7 +4,7 @@ import re
 from typing import Optional
 
 from pipeline.user_story.user_story_loader import UserStoryLoader, UserStory
-from pipeline.utils import Utils
+from pipeline.utils import Utils, save_json
 
 
 def decompose_non_functional_user_stories(user_story_loader: Optional[UserStoryLoader] = None):
@@ -70,8 +70,7 @@ def decompose_non_functional_user_stories(user_story_loader: Optional[UserStoryL
 
         # print(f"✅ Decomposed NFUS (ID: {story.id}, Persona: {story.persona}, decomposition: {decomposition})")
 
-    with open(utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH, "w", encoding="utf-8") as f:
-        json.dump(all_results, f, indent=2, ensure_ascii=False)
+    save_json(utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH, all_results)
 
     print(f"✅ Saved decompositions to: {utils.NON_FUNCTIONAL_USER_STORY_DECOMPOSITION_PATH}")
 
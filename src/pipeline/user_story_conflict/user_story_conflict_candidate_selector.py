@@ -0,0 +1,178 @@
+import math
+import re
+
+from collections import defaultdict
+from itertools import combinations
+from typing import List, Sequence, Set, Tuple
+
+from pipeline.similarity import cosine_similarity_matrix, tokenize
+
+
+# ==============================================================================================
+# LOCAL CANDIDATE-PAIR BLOCKING FOR FUNCTIONAL CONFLICTS
+#
+# Chentouf conflicts (Start-Forbid, Forbid-stop, Two Condition Events, Two Operation Frequencies)
+# need two stories about the same thing that pull in opposite directions. Pairs are ranked by topical
+# overlap plus such opposing cues, and only the best-ranked ones are sent to the LLM. Blocking is
+# opt-in (`use_candidate_blocking`) on the functional identifiers: it trades recall for LLM calls, so
+# check it with analyze_functional_conflict_candidate_recall before enabling it on a system.
+
+# Cue phrases, matched on whole words in the "I want ..." part of a summary. Only phrases that state a
+# trigger, a prohibition or a consent condition; generic words ("no", "all", "limit", ...) show up in
+# almost every summary and would give most stories a stance.
+FORBID_CUES = (
+    "don't want", "do not want", "never", "block", "blocks", "disable", "turn off", "switch off",
+    "prevent", "refuse", "forbid", "mute", "silence", "opt out", "restrict", "reject", "deny",
+)
+FORCE_CUES = (
+    "always", "force", "forcibly", "enforce", "automatically", "even if", "regardless", "without asking",
+    "without permission", "without their permission", "without consent", "mandatory",
+)
+CONSENT_CUES = (
+    "consent", "permission", "approval", "approve", "only when", "only if", "unless", "ask me first",
+    "ask for my",
+)
+FREQUENCY_TERMS = frozenset("""
+always never every daily weekly monthly hourly often frequent frequently constant constantly continuous
+continuously regular regularly occasionally rarely once twice repeated repeatedly fewer less more minimal
+""".split())
+CONDITION_TERMS = frozenset("""
+when if unless during while after before until night morning evening emergency emergencies work hours
+busy urgent schedule
+""".split())
+
+# Weights of the cues on top of the topical cosine similarity
+OPPOSED_STANCE_WEIGHT = 0.3
+FREQUENCY_WEIGHT = 0.15
+CONDITION_WEIGHT = 0.15
+
+# Per comparison block, the best-ranked share of pairs sent to the LLM. Blocks with no more pairs
+# than the minimum are still compared exhaustively, so blocking only prunes the large ones.
+CANDIDATE_PAIR_RATIO = 0.5
+MIN_CANDIDATE_PAIRS = 12
+
+_BENEFIT_SPLIT = re.compile(r",?\s+so\s+(?:that\s+)?", re.IGNORECASE)
+
+
+def request_part(summary: str) -> str:
+    """The requested behaviour of a summary, without its "so that ..." benefit clause."""
+    return _BENEFIT_SPLIT.split(summary or "", maxsplit=1)[0].lower().replace("’", "'")
+
+
+def count_cues(text: str, cues: Sequence[str]) -> int:
+    return sum(len(re.findall(rf"\b{re.escape(cue)}\b", text)) for cue in cues)
+
+
+def stance(summary: str) -> int:
+    """+1 when a story pushes behaviour onto others, -1 when it restricts or asks for consent, 0 otherwise."""
+    text = request_part(summary)
+    force = count_cues(text, FORCE_CUES)
+    control = count_cues(text, FORBID_CUES) + count_cues(text, CONSENT_CUES)
+    return (force > control) - (control > force)
+
+
+def terms_of(summary: str, vocabulary: frozenset) -> Set[str]:
+    return {token for token in tokenize(request_part(summary), remove_stopwords=False) if token in vocabulary}
+
+
+def score_candidate_pairs(stories_a: Sequence, stories_b: Sequence) -> List[Tuple[float, int, int]]:
+    """Score every (A, B) story pair as (score, index in A, index in B), best first."""
+    if not stories_a or not stories_b:
+        return []
+
+    summaries = [s.summary for s in stories_a] + [s.summary for s in stories_b]
+    similarity = cosine_similarity_matrix([request_part(text) for text in summaries], analyzer="word")
+    offset = len(stories_a)
+
+    stances = [stance(text) for text in summaries]
+    frequencies = [terms_of(text, FREQUENCY_TERMS) for text in summaries]
+    conditions = [terms_of(text, CONDITION_TERMS) for text in summaries]
+
+    scored = []
+    for i in range(len(stories_a)):
+        for j in range(len(stories_b)):
+            k = offset + j
+            score = float(similarity[i, k])
+            if stances[i] * stances[k] < 0:
+                score += OPPOSED_STANCE_WEIGHT
+            if frequencies[i] and frequencies[k] and frequencies[i] != frequencies[k]:
+                score += FREQUENCY_WEIGHT
+            if conditions[i] and conditions[k] and conditions[i] != conditions[k]:
+                score += CONDITION_WEIGHT
+            scored.append((score, i, j))
+
+    scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+    return scored
+
+
+def select_candidate_pairs(
+    stories_a: Sequence,
+    stories_b: Sequence,
+    ratio: float = CANDIDATE_PAIR_RATIO,
+    min_pairs: int = MIN_CANDIDATE_PAIRS,
+) -> List[Tuple[object, object]]:
+    """The best-ranked (story A, story B) pairs of one comparison block, in the original nested-loop order."""
+    scored = score_candidate_pairs(stories_a, stories_b)
+    keep = max(min_pairs, math.ceil(ratio * len(scored)))
+    kept = sorted((i, j) for _, i, j in scored[:keep])
+    return [(stories_a[i], stories_b[j]) for i, j in kept]
+
+
+def functional_comparison_blocks(functional_stories: Sequence, within_one_group: bool) -> List[Tuple[str, list, list]]:
+    """
+    The (cluster, stories A, stories B) blocks the functional conflict identifiers compare exhaustively:
+    the first two personas of each user group in a cluster, or every pair of user groups in a cluster.
+    """
+    cluster_map = defaultdict(list)
+    for story in functional_stories:
+        cluster = story.cluster
+        if not cluster or not cluster.strip() or cluster.lower() == "unclustered":
+            cluster = "(Unclustered)"
+        cluster_map[cluster].append(story)
+
+    blocks = []
+    for cluster, stories_in_cluster in cluster_map.items():
+        group_map = defaultdict(list)
+        for story in stories_in_cluster:
+            group_map[story.user_group].append(story)
+
+        if within_one_group:
+            for group_stories in group_map.values():
+                persona_map = defaultdict(list)
+                for story in group_stories:
+                    persona_map[story.persona].append(story)
+                persona_ids = list(persona_map)[:2]
+                if len(persona_ids) == 2:
+                    blocks.append((cluster, persona_map[persona_ids[0]], persona_map[persona_ids[1]]))
+        else:
+            for group_a, group_b in combinations(sorted(group_map), 2):
+                blocks.append((cluster, group_map[group_a], group_map[group_b]))
+
+    return blocks
+
+
+# ==============================================================================================
+# ONE-VS-MANY BATCHES (shared by all conflict identifiers)
+
+
+def _anchored_batches(pairs: Sequence[Tuple[object, object]], side: int, batch_size: int) -> List[Tuple[object, list, bool]]:
+    grouped = {}
+    for pair in pairs:
+        anchor, candidate = pair[side], pair[1 - side]
+        grouped.setdefault(anchor.id, (anchor, []))[1].append(candidate)
+    return [
+        (anchor, candidates[i:i + batch_size], side == 0)
+        for anchor, candidates in grouped.values()
+        for i in range(0, len(candidates), batch_size)
+    ]
+
+
+def comparison_batches(pairs: Sequence[Tuple[object, object]], batch_size: int) -> List[Tuple[object, list, bool]]:
+    """
+    Group (story A, story B) pairs into (anchor story, [candidate stories], anchor is story A) batches of at most
+    batch_size candidates, so one prompt compares a story with many. The anchor is taken from whichever side
+    of the pairs gives fewer batches.
+    """
+    by_a = _anchored_batches(pairs, 0, batch_size)
+    by_b = _anchored_batches(pairs, 1, batch_size)
+    return by_b if len(by_b) < len(by_a) else by_a
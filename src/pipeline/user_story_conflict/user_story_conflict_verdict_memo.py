@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import sqlite3
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pipeline.utils import Utils, content_hash, load_json
+
+
+# ==============================================================================================
+# CROSS-RUN MEMO OF PAIRWISE CONFLICT VERDICTS
+#
+# Every verdict a conflict identifier gets from the LLM (the conflict JSON, or {} for "no conflict") is
+# kept under (stage, technique hash, story A hash, story B hash). On a rerun only the pairs involving a
+# changed story, or a changed technique / prompt context, are sent to the LLM again.
+#
+# The conflict files of earlier runs are carried over alongside: stories are hashed with the summary
+# they were identified on (resolutions rewrite summaries afterwards), a conflict found again keeps its
+# saved record (ID, resolution), and a pair verified invalid is not brought back.
+
+# SQLite file of the memo in the results root, kept apart from the artifact store (memo verdicts are
+# not pipeline artifacts)
+VERDICT_MEMO_DB_FILENAME = "conflict_verdicts.db"
+
+# Length of the hex digests used as memo keys
+VERDICT_HASH_LENGTH = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conflict_verdicts (
+    stage TEXT NOT NULL,
+    technique_hash TEXT NOT NULL,
+    story_a_hash TEXT NOT NULL,
+    story_b_hash TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    PRIMARY KEY (stage, technique_hash, story_a_hash, story_b_hash)
+);
+"""
+
+
+def story_hash(story, *context: str, summary: Optional[str] = None) -> str:
+    """
+    Hash of what a conflict prompt shows of one story, plus any extra context (cluster, NFR decomposition, ...).
+    `summary` replaces the story's current summary, e.g. with the one it was identified on.
+    """
+    summary = story.summary if summary is None else summary
+    return content_hash(story.persona, story.user_group, story.title, summary, *context, length=VERDICT_HASH_LENGTH)
+
+
+def load_conflict_records(*directories: str) -> List[dict]:
+    """Every conflict record saved in the group files of the given conflict directories."""
+    records = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for fname in sorted(os.listdir(directory)):
+            if fname.endswith(".json"):
+                records.extend(load_json(os.path.join(directory, fname)))
+    return records
+
+
+def conflict_pair(record: dict) -> Tuple[str, str]:
+    return tuple(sorted((record.get("userStoryAId") or "", record.get("userStoryBId") or "")))
+
+
+def conflicts_resolved(directory: str) -> bool:
+    """Whether every conflict saved in a directory went through its resolver (as the resolvers' own skip checks)."""
+    return all("generalResolutionType" in c and "resolutionDescription" in c for c in load_conflict_records(directory))
+
+
+def identified_summaries(records: List[dict], stories) -> Dict[str, str]:
+    """
+    Story ID -> the summary it had before the resolutions of `records` rewrote it, for the stories they rewrote.
+    A story resolved several times is traced back through each resolution.
+    """
+    resolved_from = {}
+    for record in records:
+        for side in ("A", "B"):
+            old, new = record.get(f"userStory{side}Summary"), record.get(f"newUserStory{side}Summary")
+            if old and new and old != new:
+                resolved_from[(record.get(f"userStory{side}Id"), new)] = old
+
+    summaries = {}
+    for story in stories:
+        summary, seen = story.summary, set()
+        while (story.id, summary) in resolved_from and summary not in seen:
+            seen.add(summary)
+            summary = resolved_from[(story.id, summary)]
+        if summary != story.summary:
+            summaries[story.id] = summary
+    return summaries
+
+
+class RecordedConflicts:
+    """Conflicts saved by earlier runs of one identification stage: the kept records, and the pairs verified invalid."""
+
+    def __init__(self, directory: str, invalid_directory: str):
+        self.records = load_conflict_records(directory)
+        invalid = load_conflict_records(invalid_directory)
+        self.by_pair = {conflict_pair(r): r for r in self.records}
+        self.invalid_pairs = {conflict_pair(r) for r in invalid}
+
+        # New conflicts are numbered after every saved one, so saved IDs never change or repeat
+        numbers = [re.search(r"(\d+)$", r.get("conflictId") or "") for r in self.records + invalid]
+        self.next_number = 1 + max((int(m.group(1)) for m in numbers if m), default=0)
+
+    def carry_over(self, story_a, story_b, annotate: Callable[[int], dict]) -> Optional[dict]:
+        """
+        The record of a conflict found between two stories: its saved record, None if it was verified
+        invalid, or else a new record from `annotate(conflict number)`.
+        """
+        pair = tuple(sorted((story_a.id, story_b.id)))
+        if pair in self.invalid_pairs:
+            return None
+        if pair in self.by_pair:
+            return self.by_pair[pair]
+        record = annotate(self.next_number)
+        self.next_number += 1
+        return record
+
+
+class ConflictVerdictMemo:
+    """Remembered verdicts of one conflict identification stage and technique. New verdicts are written by `save`."""
+
+    def __init__(self, stage: str, technique_parts: Sequence[str], db_path: Optional[str] = None):
+        self.stage = stage
+        self.technique_hash = content_hash(*technique_parts, length=VERDICT_HASH_LENGTH)
+        self.db_path = db_path or os.path.join(Utils().ROOT_RESULTS_DIR, VERDICT_MEMO_DB_FILENAME)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+        rows = self.conn.execute(
+            "SELECT story_a_hash, story_b_hash, verdict FROM conflict_verdicts WHERE stage = ? AND technique_hash = ?",
+            (stage, self.technique_hash),
+        ).fetchall()
+        self.verdicts = {(hash_a, hash_b): verdict for hash_a, hash_b, verdict in rows}
+        self.pending = {}
+
+    def __len__(self) -> int:
+        return len(self.verdicts)
+
+    def get(self, hash_a: str, hash_b: str) -> Optional[dict]:
+        """The remembered verdict of a pair: the conflict, {} for no conflict, or None if the pair is new."""
+        verdict = self.verdicts.get((hash_a, hash_b))
+        return json.loads(verdict) if verdict is not None else None
+
+    def split(self, pairs: Sequence[Tuple[object, object]], hashes: Dict[str, str]) -> Tuple[List[Tuple[object, object, dict]], list]:
+        """Split (story A, story B) pairs into remembered (story A, story B, verdict) triples and new pairs."""
+        remembered, new_pairs = [], []
+        for story_a, story_b in pairs:
+            verdict = self.get(hashes[story_a.id], hashes[story_b.id])
+            if verdict is None:
+                new_pairs.append((story_a, story_b))
+            else:
+                remembered.append((story_a, story_b, verdict))
+        return remembered, new_pairs
+
+    def put(self, hash_a: str, hash_b: str, verdict: dict) -> None:
+        self.verdicts[(hash_a, hash_b)] = self.pending[(hash_a, hash_b)] = json.dumps(verdict or {}, ensure_ascii=False)
+
+    def save(self) -> int:
+        """Write the verdicts added since the last save. Returns how many were written."""
+        saved = len(self.pending)
+        if self.pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO conflict_verdicts (stage, technique_hash, story_a_hash, story_b_hash, verdict) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(self.stage, self.technique_hash, hash_a, hash_b, verdict) for (hash_a, hash_b), verdict in self.pending.items()],
+                )
+            self.pending = {}
+        return saved
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,21 +1,17 @@
 import os
-import json
 from typing import Optional
 
+from pipeline.artifact_store import ArtifactStore
+from pipeline.user_story_conflict.user_story_conflict_verdict_memo import conflict_pair
 from pipeline.utils import (
     UserPersonaLoader,
     Utils,
+    load_json,
 )
 
 
 def load_json_file(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_json_file(path: str, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    return load_json(path)
 
 
 def build_verification_within_one_group_prompt(
@@ -114,6 +110,9 @@ def verify_conflicts(
 
     conflict_files = [f for f in os.listdir(conflict_dir) if f.endswith(".json")]
 
+    # Valid and invalid conflict files are written through the artifact store
+    store = ArtifactStore()
+
     for conflict_file in conflict_files:
         conflict_path = os.path.join(conflict_dir, conflict_file)
         try:
@@ -199,16 +198,21 @@ def verify_conflicts(
         # Write valid conflicts back to original file
         if updated:
             try:
-                save_json_file(conflict_path, valid_conflicts)
+                store.write_file(conflict_path, valid_conflicts)
                 print(f"✅ Updated valid conflicts: {conflict_file}")
             except Exception as e:
                 print(f"❌ Failed to save updated conflict file {conflict_file}: {e}")
 
-        # Write invalid conflicts to corresponding subfolder
+        # Write invalid conflicts to corresponding subfolder, after those of earlier runs (which keep
+        # identification from bringing them back)
         if invalid_conflicts:
             invalid_path = os.path.join(invalid_dir, conflict_file)
             try:
-                save_json_file(invalid_path, invalid_conflicts)
+                invalid_pairs = {conflict_pair(c) for c in invalid_conflicts}
+                earlier_invalid = load_json_file(invalid_path) if os.path.exists(invalid_path) else []
+                store.write_file(invalid_path, [c for c in earlier_invalid if conflict_pair(c) not in invalid_pairs] + invalid_conflicts)
                 print(f"📁 Moved {len(invalid_conflicts)} invalid conflict(s) → {invalid_path}")
             except Exception as e:
-                print(f"❌ Failed to save invalid conflicts: {invalid_path}: {e}")
\ No newline at end of file
+                print(f"❌ Failed to save invalid conflicts: {invalid_path}: {e}")
+
+    store.close()
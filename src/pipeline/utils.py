@@ -1,8 +1,125 @@
 import json
 import os
-from typing import List, Dict, Optional
+import sys
+import gzip
+import hashlib
+import threading
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
 
+# Optional: faster JSON (de)serialisation when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ==============================================================================================
+# CONTENT-DERIVED IDS
+
+#region ContentIds
+def content_hash(*parts: str, length: int = 8) -> str:
+    """Short, process-independent hash of the given content parts."""
+    joined = "\x1f".join((part or "").strip() for part in parts)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:length]
+
+
+def assign_content_ids(prefix: str, keys: List[Tuple[str, ...]], existing: Optional[Dict[str, Tuple[str, ...]]] = None) -> List[str]:
+    """
+    Derive a stable ID (e.g. 'TASK-3fa9c1d2') for each content key, so that adding or regenerating
+    other items never renumbers this one.
+    `existing` maps IDs already in use to their keys: a key that is already known gets its old ID back,
+    while a hash collision with a different key (or a repeated identical key) gets a '-2', '-3', ... suffix.
+    """
+    taken = {item_id: tuple(key) for item_id, key in (existing or {}).items()}
+    known_ids_by_key = defaultdict(list)
+    for item_id, key in taken.items():
+        known_ids_by_key[key].append(item_id)
+
+    seen = defaultdict(int)
+    claimed = set()
+    ids = []
+
+    for key in map(tuple, keys):
+        occurrence = seen[key]
+        seen[key] += 1
+
+        # Same content seen before (possibly under a legacy ID): keep that ID
+        if occurrence < len(known_ids_by_key[key]):
+            candidate = known_ids_by_key[key][occurrence]
+        else:
+            base = f"{prefix}-{content_hash(*key)}"
+            candidate, n = base, 1
+            while candidate in claimed or candidate in taken:
+                n += 1
+                candidate = f"{base}-{n}"
+            taken[candidate] = key
+
+        claimed.add(candidate)
+        ids.append(candidate)
+
+    return ids
+
+
+def intern_value(value):
+    """Intern a label-like string (type, user group, pillar, cluster, ...) so repeated values share one object."""
+    return sys.intern(value) if isinstance(value, str) else value
+#endregion
+
+
+# ==============================================================================================
+# JSON PERSISTENCE
+
+#region JsonPersistence
+def dump_json_bytes(data, compact: bool = False) -> bytes:
+    """UTF-8 JSON, indented by 2 (as every result file is) unless `compact`."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass  # e.g. non-string keys or big integers: fall back to the standard library
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def save_json(path: str, data, compact: bool = False, compress: Optional[bool] = None) -> None:
+    """
+    Write JSON atomically: the content goes to a temporary file next to `path`, which then replaces it,
+    so an interrupted run never leaves a truncated file behind. Paths ending in '.gz' are gzip-compressed
+    (or force it either way with `compress`).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    payload = dump_json_bytes(data, compact)
+    if compress if compress is not None else path.endswith(".gz"):
+        payload = gzip.compress(payload, compresslevel=6, mtime=0)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_json(path: str):
+    """Read a JSON file written by `save_json` (plain or gzip-compressed)."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+#endregion
+
+
 # ==============================================================================================
 # USER PERSONA LOADER
 
@@ -10,10 +127,13 @@ from collections import defaultdict
 class UserPersona:
     """Represents a new-format user persona (e.g., Olivia, Elena, Thomas)."""
 
+    __slots__ = ("no_logging", "id", "name", "role", "tagline", "demographic_data",
+                 "core_characteristics", "core_goals", "typical_challenges", "singularities", "main_actions",
+                 "working_situation", "place_of_work", "expertise", "user_group")
+
     def __init__(self, data: dict, no_logging: bool = False):
         self.no_logging = no_logging
         
-        self.raw_data = data
         self.id: str = data.get("Id", "Unknown")
         self.name: str = data.get("Name", "Unknown")
         self.role: str = data.get("Role", "Unknown")
@@ -31,7 +151,7 @@ class UserPersona:
         self.expertise: str = data.get("Expertise", "")
         
         # Set user group once
-        self.user_group = self.classify_user_group()
+        self.user_group = intern_value(self.classify_user_group())
         
     def classify_user_group(self) -> str:
         """Use LLM to classify this persona into one of the 3 user groups."""
@@ -326,7 +446,9 @@ class Utils:
         loader = UserPersonaLoader(no_logging=True)
         loader.load()
         persona_abbr = loader.get_persona_abbreviation()
+        self._set_results_paths(persona_abbr)
 
+    def _set_results_paths(self, persona_abbr: str):
         self.RESULTS_DIR = os.path.join("results")
 
         self.ROOT_RESULTS_DIR = os.path.join(self.RESULTS_DIR, self.SYSTEM_NAME, persona_abbr, self.CURRENT_LLM)
@@ -335,10 +457,13 @@ class Utils:
         self.TASK_DIR = os.path.join(self.ROOT_RESULTS_DIR, "tasks")
         self.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR = os.path.join(self.TASK_DIR, "unique_extracted_use_case_tasks")
         self.DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR = os.path.join(self.TASK_DIR, "duplicated_extracted_use_case_tasks")
+        self.PROCESSED_USE_CASES_PATH = os.path.join(self.TASK_DIR, "processed_use_cases.json")
+        self.DEDUPLICATED_TASK_IDS_PATH = os.path.join(self.TASK_DIR, "deduplicated_task_ids.json")
 
         self.USER_STORY_DIR_PATH = os.path.join(self.ROOT_RESULTS_DIR, "user_stories")
         self.UNIQUE_USER_STORY_DIR_PATH = os.path.join(self.USER_STORY_DIR_PATH, "unique_user_stories")
         self.DUPLICATED_USER_STORY_DIR_PATH = os.path.join(self.USER_STORY_DIR_PATH, "duplicated_user_stories")
+        self.SKELETON_EXTRACTED_TASK_IDS_PATH = os.path.join(self.USER_STORY_DIR_PATH, "skeleton_extracted_task_ids.json")
         self.FUNCTIONAL_USER_STORY_CLUSTER_SET_PATH = os.path.join(self.ROOT_RESULTS_DIR, "functional_user_story_cluster_set.json")
 
         self.CONFLICTS_DIR = os.path.join(self.ROOT_RESULTS_DIR, "user_story_conflicts")
@@ -372,6 +497,7 @@ class Utils:
         self.USER_STORY_UNIQUENESS_ANALYSIS_BY_TYPES_CSV_FILE_PATH = os.path.join(self.ROOT_RESULT_ANALYSIS_DIR_PATH, "user_story_uniqueness_analysis_by_types.csv")
         self.NON_FUNCTIONAL_USER_STORY_CLUSTERING_ANALYSIS_CSV_FILE_PATH = os.path.join(self.ROOT_RESULT_ANALYSIS_DIR_PATH, "non_functional_user_story_clustering_analysis.csv")
         self.FUNCTIONAL_USER_STORY_CLUSTERING_ANALYSIS_CSV_FILE_PATH = os.path.join(self.ROOT_RESULT_ANALYSIS_DIR_PATH, "functional_user_story_clustering_analysis.csv")
+        self.FUNCTIONAL_USER_STORY_CONFLICT_CANDIDATE_RECALL_ANALYSIS_CSV_FILE_PATH = os.path.join(self.ROOT_RESULT_ANALYSIS_DIR_PATH, "functional_user_story_conflict_candidate_recall_analysis.csv")
         
         self.USER_STORY_CONFLICT_VERIFYING_ANALYSIS_DIR_PATH = os.path.join(self.ROOT_RESULT_ANALYSIS_DIR_PATH, "user_story_conflict_verifying_analysis")
         self.NON_FUNCTIONAL_USER_STORY_CONFLICT_WITHIN_ONE_GROUP_VERIFYING_ANALYSIS_CSV_FILE_PATH = os.path.join(self.USER_STORY_CONFLICT_VERIFYING_ANALYSIS_DIR_PATH, "non_functional_user_story_conflict_within_one_group_verifying_analysis.csv")
@@ -386,21 +512,7 @@ class Utils:
         """
         Refresh all internal result paths using the current SYSTEM_NAME, CURRENT_LLM, and provided persona abbreviation.
         """
-        self.ROOT_RESULTS_DIR = os.path.join(self.RESULTS_DIR, self.SYSTEM_NAME, persona_abbr, self.CURRENT_LLM)
-
-        self.USE_CASE_DIR = os.path.join(self.ROOT_RESULTS_DIR, "use_cases")
-        self.TASK_DIR = os.path.join(self.ROOT_RESULTS_DIR, "tasks")
-        self.UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR = os.path.join(self.TASK_DIR, "unique_extracted_use_case_tasks")
-        self.DUPLICATED_UNIQUE_EXTRACTED_USE_CASE_TASKS_DIR = os.path.join(self.TASK_DIR, "duplicated_extracted_use_case_tasks")
-
-        self.USER_STORY_DIR_PATH = os.path.join(self.ROOT_RESULTS_DIR, "user_stories")
-        self.UNIQUE_USER_STORY_DIR_PATH = os.path.join(self.USER_STORY_DIR_PATH, "unique_user_stories")
-        self.DUPLICATED_USER_STORY_DIR_PATH = os.path.join(self.USER_STORY_DIR_PATH, "duplicated_user_stories")
-        self.FUNCTIONAL_USER_STORY_CLUSTER_SET_PATH = os.path.join(self.ROOT_RESULTS_DIR, "functional_user_story_cluster_set.json")
-
-        self.CONFLICTS_DIR = os.path.join(self.ROOT_RESULTS_DIR, "user_story_conflicts")
-        self.USER_STORY_CONFLICT_WITHIN_ONE_GROUP_DIR = os.path.join(self.CONFLICTS_DIR, "conflicts_within_one_group")
-        self.USER_STORY_CONFLICT_ACROSS_TWO_GROUPS_DIR = os.path.join(self.CONFLICTS_DIR, "conflicts_across_two_groups")
+        self._set_results_paths(persona_abbr)
 
     # ===============================
     # Loaders and helpers below...